@@ -0,0 +1,285 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+class AgentAssignment:
+    """A test currently placed on an agent."""
+
+    def __init__(self, test_id, sid, browser):
+        self.test_id = test_id
+        self.sid = sid
+        self.browser = browser
+        self.lost = False
+        self.dispatches = 1
+        self.done = threading.Event()
+
+
+class AgentRegistry:
+    """
+    Connected local agents, their capacity and the tests placed on them.
+
+    Agents register with the browsers they support and how many tests they run
+    at once, then send heartbeats with their current load. ``acquire`` places a
+    test on the least-loaded live agent with a free slot, preferring agents that
+    list the requested browser. When an agent disconnects or misses heartbeats
+    its tests are marked lost so their runners can dispatch them again. A test
+    its runner gave up on keeps the agent's slot until that agent reports back,
+    and the late result is refused.
+    Agents that never sent a heartbeat (older agent scripts) are only dropped on
+    disconnect.
+    """
+
+    def __init__(self, heartbeat_timeout=30, default_concurrency=1):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.default_concurrency = default_concurrency
+        self._lock = threading.Lock()
+        self._agents: Dict[str, Dict] = {}
+        self._assignments: Dict[int, AgentAssignment] = {}
+        # (test_id, sid) of runs given up on while the agent may still be running them
+        self._abandoned: Dict[Tuple[int, str], float] = {}
+        self.stats = {
+            'registered': 0,
+            'disconnected': 0,
+            'evicted': 0,
+            'dispatched': 0,
+            'redispatched': 0,
+            'no_capacity': 0,
+            'abandoned': 0,
+            'late_results': 0,
+            'heartbeats': 0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        """Build a registry from AGENT_* environment variables."""
+        return cls(
+            heartbeat_timeout=float(os.environ.get('AGENT_HEARTBEAT_TIMEOUT', 30)),
+            default_concurrency=int(os.environ.get('AGENT_DEFAULT_CONCURRENCY', 1)),
+        )
+
+    # ---------------- Membership ----------------
+
+    def register(self, sid, agent_id, browsers=None, max_concurrency=None):
+        with self._lock:
+            agent = self._agents.get(sid)
+            if agent is None:
+                agent = {
+                    'agent_id': agent_id,
+                    'connected_at': datetime.now().isoformat(),
+                    'reported_load': 0,
+                    'heartbeats': 0,
+                    'last_seen': time.monotonic(),
+                    'dispatched': 0,
+                    'last_dispatch': 0.0,
+                }
+                self._agents[sid] = agent
+                self.stats['registered'] += 1
+            agent['agent_id'] = agent_id
+            agent['browsers'] = list(browsers or [])
+            agent['max_concurrency'] = max(1, int(max_concurrency or self.default_concurrency))
+
+    def heartbeat(self, sid, load=None, max_concurrency=None, browsers=None):
+        """Record a heartbeat. Returns False for an unknown agent, which should register again."""
+        with self._lock:
+            agent = self._agents.get(sid)
+            if agent is None:
+                return False
+            agent['last_seen'] = time.monotonic()
+            agent['heartbeats'] += 1
+            if load is not None:
+                agent['reported_load'] = int(load)
+                if not agent['reported_load']:
+                    # An idle agent is not running anything we gave up on
+                    self._drop_abandoned_locked(sid)
+            if max_concurrency:
+                agent['max_concurrency'] = max(1, int(max_concurrency))
+            if browsers:
+                agent['browsers'] = list(browsers)
+            self.stats['heartbeats'] += 1
+        return True
+
+    def unregister(self, sid) -> List[int]:
+        """Drop an agent; returns the tests it was running, now marked lost."""
+        with self._lock:
+            if self._agents.pop(sid, None) is None:
+                return []
+            self.stats['disconnected'] += 1
+            return self._lose_locked(sid)
+
+    def evict_stale(self) -> Dict[str, List[int]]:
+        """Drop agents whose heartbeats stopped; returns {sid: lost test ids}."""
+        cutoff = time.monotonic() - self.heartbeat_timeout
+        evicted = {}
+        with self._lock:
+            for sid, agent in list(self._agents.items()):
+                if agent['heartbeats'] and agent['last_seen'] < cutoff:
+                    del self._agents[sid]
+                    evicted[sid] = self._lose_locked(sid)
+            self.stats['evicted'] += len(evicted)
+        return evicted
+
+    def _drop_abandoned_locked(self, sid):
+        for key in [key for key in self._abandoned if key[1] == sid]:
+            del self._abandoned[key]
+
+    def _lose_locked(self, sid):
+        self._drop_abandoned_locked(sid)
+        lost = []
+        for assignment in self._assignments.values():
+            if assignment.sid == sid and not assignment.lost:
+                assignment.lost = True
+                assignment.sid = None
+                assignment.done.set()
+                lost.append(assignment.test_id)
+        return lost
+
+    def __contains__(self, sid):
+        with self._lock:
+            return sid in self._agents
+
+    def __len__(self):
+        with self._lock:
+            return len(self._agents)
+
+    # ---------------- Dispatch ----------------
+
+    def _running_locked(self, sid):
+        return sum(1 for assignment in self._assignments.values() if assignment.sid == sid)
+
+    def _abandoned_locked(self, sid):
+        return sum(1 for _, owner in self._abandoned if owner == sid)
+
+    def _load_locked(self, sid):
+        # Only work this server placed, so it matches what total_capacity gives the
+        # scheduler; reported load lags by a heartbeat and is shown for information
+        return self._running_locked(sid) + self._abandoned_locked(sid)
+
+    def acquire(self, test_id, browser=None) -> Optional[str]:
+        """
+        Place a test on the least-loaded agent with a free slot; returns its sid or None.
+
+        Calling it again for a lost test moves that test to another agent.
+        """
+        with self._lock:
+            candidates = [sid for sid, agent in self._agents.items()
+                          if self._load_locked(sid) < agent['max_concurrency']]
+            # Playwright bundles every browser, so an agent that does not list one can still run it
+            preferred = [sid for sid in candidates if browser in self._agents[sid]['browsers']]
+            candidates = preferred or candidates
+            if not candidates:
+                self.stats['no_capacity'] += 1
+                return None
+
+            sid = min(candidates, key=lambda sid: (
+                self._load_locked(sid) / self._agents[sid]['max_concurrency'],
+                self._agents[sid]['last_dispatch']
+            ))
+            agent = self._agents[sid]
+            agent['dispatched'] += 1
+            agent['last_dispatch'] = time.monotonic()
+
+            assignment = self._assignments.get(test_id)
+            if assignment is None:
+                self._assignments[test_id] = AgentAssignment(test_id, sid, browser)
+                self.stats['dispatched'] += 1
+            else:
+                assignment.sid = sid
+                assignment.lost = False
+                assignment.dispatches += 1
+                assignment.done.clear()
+                self.stats['redispatched'] += 1
+            return sid
+
+    def owns(self, test_id, sid):
+        """False when a result from ``sid`` is stale: the test was moved elsewhere or given up on."""
+        with self._lock:
+            assignment = self._assignments.get(test_id)
+            return assignment is not None and assignment.sid == sid
+
+    def release(self, test_id, sid=None):
+        """
+        Free the test's slot and wake its runner.
+
+        With ``sid``, only the agent that owns the test may release it; returns
+        False for a stale result, from an agent the test was moved away from or
+        one that arrives after the runner gave up (which still frees that slot).
+        """
+        with self._lock:
+            if sid is not None and self._abandoned.pop((test_id, sid), None) is not None:
+                self.stats['late_results'] += 1
+                return False
+            assignment = self._assignments.get(test_id)
+            if assignment is None:
+                return sid is None
+            if sid is not None and assignment.sid != sid:
+                return False
+            del self._assignments[test_id]
+        assignment.done.set()
+        return True
+
+    def abandon(self, test_id):
+        """
+        The runner gave up on a test (no result in time, or no agent to move it to).
+
+        Its agent may still be running it, so the slot stays taken until that
+        agent reports back, disconnects or heartbeats as idle.
+        """
+        with self._lock:
+            assignment = self._assignments.pop(test_id, None)
+            if assignment is None:
+                return
+            if assignment.sid:
+                self._abandoned[(test_id, assignment.sid)] = time.monotonic()
+                self.stats['abandoned'] += 1
+        assignment.done.set()
+
+    def wait(self, test_id, timeout=None):
+        """Wait for a placed test: 'done' once released, 'lost' if its agent dropped, else 'timeout'."""
+        with self._lock:
+            assignment = self._assignments.get(test_id)
+        if assignment is None:
+            return 'done'
+        if not assignment.done.wait(timeout):
+            return 'timeout'
+        return 'lost' if assignment.lost else 'done'
+
+    # ---------------- Reporting ----------------
+
+    def total_capacity(self):
+        """
+        The scheduler's ``agent`` slot limit: every live agent's slots minus those
+        still held by abandoned runs, so an admitted job finds a slot in ``acquire``.
+        """
+        with self._lock:
+            return sum(max(0, agent['max_concurrency'] - self._abandoned_locked(sid))
+                       for sid, agent in self._agents.items())
+
+    def agents(self) -> List[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                'agent_id': agent['agent_id'],
+                'browsers': agent['browsers'],
+                'connected_at': agent['connected_at'],
+                'max_concurrency': agent['max_concurrency'],
+                'running': self._running_locked(sid),
+                'load': self._load_locked(sid),
+                'reported_load': agent['reported_load'],
+                'dispatched': agent['dispatched'],
+                'seconds_since_heartbeat': round(now - agent['last_seen'], 1) if agent['heartbeats'] else None,
+            } for sid, agent in self._agents.items()]
+
+    def get_stats(self):
+        agents = self.agents()
+        with self._lock:
+            stats = dict(self.stats)
+            stats['running'] = sum(1 for assignment in self._assignments.values() if assignment.sid)
+            stats['abandoned_running'] = len(self._abandoned)
+        stats['agents'] = agents
+        stats['connected'] = len(agents)
+        stats['capacity'] = sum(agent['max_concurrency'] for agent in agents)
+        stats['heartbeat_timeout'] = self.heartbeat_timeout
+        return stats
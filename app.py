@@ -3,20 +3,28 @@ monkey.patch_all()
 
 import os
 import json
-import sqlite3
 import uuid
 import time
-from datetime import datetime
 from flask import Flask, render_template, request, jsonify, send_from_directory, Response
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 from openai import OpenAI
-from executor import ServerExecutor
 from healing_executor import HealingExecutor
 from code_validator import CodeValidator
-from models import Database, LearnedTask, TaskExecution
-from vector_store import SemanticSearch
+from models import Database, LearnedTask, ExecutionHistory
+from vector_store import SemanticSearch, keyword_search_tasks
+from browser_pool import browser_pool_enabled, shutdown_browser_pool
+from scheduler import ExecutionScheduler, QueueFullError
+from execution_backend import create_execution_backend
+from code_cache import CodeGenerationCache
+from db_pool import get_db
+from write_behind import WriteBehindQueue
+from completion import CompletionRegistry
+from artifact_store import ArtifactStore
+from agent_registry import AgentRegistry
+import atexit
 import base64
+import hashlib
 import asyncio
 
 app = Flask(__name__)
@@ -32,57 +40,105 @@ os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'logs'), exist_ok=True)
 openai_api_key = os.environ.get('OPENAI_API_KEY','')
 if openai_api_key:
     client = OpenAI(api_key=openai_api_key)
-    # Initialize semantic search service
-    try:
-        semantic_search = SemanticSearch(api_key=openai_api_key)
-        print("✅ Semantic search service initialized")
-    except Exception as e:
-        semantic_search = None
-        print(f"⚠️ Failed to initialize semantic search: {e}")
 else:
     client = None
+    print("WARNING: OPENAI_API_KEY is not set. AI code generation will not be available; "
+          "semantic search will use local embeddings.")
+
+# Initialize semantic search service (OpenAI or local embeddings, per EMBEDDING_BACKEND)
+try:
+    semantic_search = SemanticSearch(api_key=openai_api_key or None)
+    print(f"✅ Semantic search service initialized ({semantic_search.embedding_service.model})")
+except Exception as e:
     semantic_search = None
-    print("WARNING: OPENAI_API_KEY is not set. AI code generation and semantic search will not be available.")
+    print(f"⚠️ Failed to initialize semantic search: {e}")
 
-connected_agents = {}
+# Local agents, their capacity and the tests placed on them
+agent_registry = AgentRegistry.from_env()
+AGENT_RUN_TIMEOUT = float(os.environ.get('AGENT_RUN_TIMEOUT', 600))
+AGENT_MAX_REDISPATCHES = int(os.environ.get('AGENT_MAX_REDISPATCHES', 2))
 active_healing_executors = {}
 
+# Admission control for executions started from the API
+scheduler = ExecutionScheduler.from_env(socketio)
+# A job that raises still marks its test failed, notifies clients and records the outcome
+scheduler.on_error = lambda test_id, error: fail_run(test_id, f'Execution error: {error}')
+# Agent runs follow the capacity agents report, unless EXECUTION_CONCURRENCY_AGENT caps them
+scheduler.concurrency_limits.setdefault('agent', agent_registry.total_capacity)
+
+# Server-side runs go to worker processes (or inline, per EXECUTION_BACKEND)
+execution_backend = create_execution_backend(socketio, api_key=openai_api_key)
+
 # Initialize database with new tables
 db = Database()
 print("✅ Database initialized with persistent learning tables")
 
+# Generated code cache, keyed on normalized command + browser + prompt version
+code_cache = CodeGenerationCache(
+    ttl_seconds=int(os.environ.get('CODEGEN_CACHE_TTL', 7 * 24 * 3600)),
+    max_entries=int(os.environ.get('CODEGEN_CACHE_MAX_ENTRIES', 1000))
+)
 
-def generate_playwright_code(natural_language_command, browser='chromium'):
-    if not client:
-        raise Exception("OpenAI API key not configured. Please set the OPENAI_API_KEY environment variable.")
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": """You are an expert at converting natural language commands into Playwright Python code.
+# Execution results and task stats are written in batches by a single writer
+write_queue = WriteBehindQueue(
+    max_pending=int(os.environ.get('WRITE_QUEUE_MAX_PENDING', 1000)),
+    max_batch=int(os.environ.get('WRITE_QUEUE_MAX_BATCH', 200)),
+    flush_interval=float(os.environ.get('WRITE_QUEUE_FLUSH_INTERVAL', 0.1))
+)
+
+# Screenshots are content-addressed, re-encoded and written off the request greenlet
+artifact_store = ArtifactStore.from_env(app.config['UPLOAD_FOLDER'])
+ARTIFACT_GC_INTERVAL = float(os.environ.get('ARTIFACT_GC_INTERVAL_HOURS', 6)) * 3600
+
+# Listeners fired when a test finishes (learned task stats, execution log)
+completion_registry = CompletionRegistry()
+
+# Optional fast path: run a matching learned task instead of generating code
+SEMANTIC_REUSE_ENABLED = os.environ.get('SEMANTIC_REUSE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+SEMANTIC_REUSE_MIN_SUCCESS_RATIO = float(os.environ.get('SEMANTIC_REUSE_MIN_SUCCESS_RATIO', 0.8))
+SEMANTIC_REUSE_MIN_RUNS = int(os.environ.get('SEMANTIC_REUSE_MIN_RUNS', 1))
+
+# Close warm pooled browsers and execution workers when the worker exits
+atexit.register(shutdown_browser_pool)
+atexit.register(execution_backend.shutdown)
+atexit.register(write_queue.close)
+atexit.register(artifact_store.shutdown)
+
+
+CODEGEN_MODEL = "gpt-4o-mini"
+CODEGEN_SYSTEM_PROMPT = """You are an expert at converting natural language commands into Playwright Python code.
 Generate complete, executable Playwright code that:
 1. Uses async/await syntax
 2. Includes proper browser launch with the specified browser
 3. Has error handling with proper cleanup
 4. Returns a dict with 'success', 'logs', and 'screenshot' keys
 5. ALWAYS takes screenshot BEFORE closing browser (CRITICAL)
-6. The code should be a complete async function named 'run_test' that takes browser_name and headless parameters
+6. The code should be a complete async function named 'run_test' that takes browser_name, headless and page=None parameters
+7. When a page is passed in, uses it and does NOT launch or close any browser (the runner owns it); otherwise launches its own browser
 
 CRITICAL RULE: Always take screenshot BEFORE closing browser/page. Never close browser before screenshot.
 
 Example structure:
-async def run_test(browser_name='chromium', headless=True):
+async def run_test(browser_name='chromium', headless=True, page=None):
     from playwright.async_api import async_playwright
     logs = []
     screenshot = None
     browser = None
-    page = None
+    
+    async def steps(page):
+        # Your automation code here
+        logs.append("Step completed")
+    
     try:
+        if page is not None:
+            await steps(page)
+            # CRITICAL: Screenshot BEFORE returning
+            screenshot = await page.screenshot()
+            return {'success': True, 'logs': logs, 'screenshot': screenshot}
         async with async_playwright() as p:
             browser = await getattr(p, browser_name).launch(headless=headless)
             page = await browser.new_page()
-            # Your automation code here
-            logs.append("Step completed")
+            await steps(page)
             # CRITICAL: Screenshot BEFORE closing
             screenshot = await page.screenshot()
             await browser.close()
@@ -102,7 +158,20 @@ async def run_test(browser_name='chromium', headless=True):
                 pass
         return {'success': False, 'logs': logs, 'screenshot': screenshot}
 
-Only return the function code, no explanations."""},
+Only return the function code, no explanations."""
+
+# Cached code is keyed on this, so editing the prompt or model invalidates old entries
+CODEGEN_PROMPT_VERSION = hashlib.sha256((CODEGEN_MODEL + CODEGEN_SYSTEM_PROMPT).encode('utf-8')).hexdigest()[:12]
+
+
+def generate_playwright_code(natural_language_command, browser='chromium'):
+    if not client:
+        raise Exception("OpenAI API key not configured. Please set the OPENAI_API_KEY environment variable.")
+    try:
+        response = client.chat.completions.create(
+            model=CODEGEN_MODEL,
+            messages=[
+                {"role": "system", "content": CODEGEN_SYSTEM_PROMPT},
                 {"role": "user", "content": f"Convert this to Playwright code for {browser}: {natural_language_command}"}
             ],
             temperature=0.3
@@ -120,34 +189,72 @@ Only return the function code, no explanations."""},
     except Exception as e:
         raise Exception(f"OpenAI API error: {str(e)}")
 
+def queue_full_response(error, test_id=None):
+    """429 response for a full execution queue; marks the test as rejected."""
+    if test_id is not None:
+        write_queue.update_test_history(test_id, status='rejected', logs=json.dumps([str(error)]))
+        completion_registry.discard(test_id)
+    response = jsonify({'error': str(error), 'queue_length': error.queue_length})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+def no_agent_response(test_id):
+    """503 response when no local agent is connected; marks the test as rejected."""
+    write_queue.update_test_history(test_id, status='rejected', logs=json.dumps(['No agent connected']))
+    completion_registry.discard(test_id)
+    return jsonify({'error': 'No agent connected'}), 503
+
+def track_learned_task_run(test_id, task_id):
+    """Update a learned task's counters and execution log as soon as this test finishes."""
+    def on_complete(completion):
+        write_queue.increment_task_counters(task_id, completion.success)
+        write_queue.record_execution(
+            task_id,
+            completion.status,
+            completion.success,
+            error_message=json.dumps(completion.logs) if not completion.success else None,
+            execution_time_ms=completion.execution_time_ms
+        )
+    completion_registry.add_listener(test_id, on_complete)
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+MAX_PAGE_SIZE = 200
+
+def page_size(default=50):
+    """?limit= clamped to 1..MAX_PAGE_SIZE."""
+    return max(1, min(request.args.get('limit', default, type=int), MAX_PAGE_SIZE))
+
 @app.route('/api/history')
 def get_history():
-    conn = sqlite3.connect('automation.db')
-    c = conn.cursor()
-    c.execute('SELECT * FROM test_history ORDER BY created_at DESC LIMIT 50')
-    rows = c.fetchall()
-    conn.close()
-    
-    history = []
-    for row in rows:
-        history.append({
-            'id': row[0],
-            'command': row[1],
-            'generated_code': row[2],
-            'browser': row[3],
-            'mode': row[4],
-            'execution_location': row[5],
-            'status': row[6],
-            'logs': row[7],
-            'screenshot_path': row[8],
-            'created_at': row[9]
-        })
+    """
+    Run summaries, newest first. ?limit=&cursor=&status=&browser=&mode=&execution_location=&since=&until=
     
-    return jsonify(history)
+    Pass the returned next_cursor to get the following page; code and logs come from /api/history/<id>.
+    """
+    write_queue.flush()
+    filters = {column: request.args[column] for column in ExecutionHistory.FILTERS if request.args.get(column)}
+    try:
+        history, next_cursor = ExecutionHistory.list_page(
+            filters, since=request.args.get('since'), until=request.args.get('until'),
+            limit=page_size(), cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    for item in history:
+        item['thumbnail_path'] = ArtifactStore.thumbnail_for(item['screenshot_path'])
+    return jsonify({'history': history, 'next_cursor': next_cursor})
+
+@app.route('/api/history/<int:test_id>')
+def get_history_item(test_id):
+    """Full record of one run, including generated/healed code and logs."""
+    write_queue.flush()
+    item = ExecutionHistory.get(test_id)
+    if not item:
+        return jsonify({'error': 'Test not found'}), 404
+    return jsonify(item)
 
 @app.route('/api/execute', methods=['POST'])
 def execute_test():
@@ -157,58 +264,93 @@ def execute_test():
     mode = data.get('mode', 'headless')
     execution_location = data.get('execution_location', 'server')
     use_healing = data.get('use_healing', True)
+    priority = data.get('priority', 'interactive')
+    use_cache = data.get('use_cache', True)
+    use_learned_tasks = data.get('use_learned_tasks', SEMANTIC_REUSE_ENABLED)
     
     if not command:
         return jsonify({'error': 'Command is required'}), 400
     
+    if scheduler.is_full():
+        return queue_full_response(QueueFullError(scheduler.max_queue_size))
+    
     try:
-        generated_code = generate_playwright_code(command, browser)
+        reused_task = None
+        if use_learned_tasks and semantic_search:
+            try:
+                reused_task = semantic_search.find_reusable_task(
+                    command,
+                    threshold=data.get('similarity_threshold'),
+                    min_success_ratio=SEMANTIC_REUSE_MIN_SUCCESS_RATIO,
+                    min_runs=SEMANTIC_REUSE_MIN_RUNS
+                )
+            except Exception as e:
+                print(f"⚠️ Learned task lookup failed, generating code instead: {e}")
+        
+        cache_hit = False
+        if reused_task:
+            generated_code = reused_task['playwright_code']
+            print(f"♻️ Reusing learned task '{reused_task['task_name']}' "
+                  f"(similarity {reused_task['similarity_score']:.3f})")
+        else:
+            generated_code = code_cache.get(command, browser, CODEGEN_PROMPT_VERSION) if use_cache else None
+            cache_hit = generated_code is not None
+            if not cache_hit:
+                generated_code = generate_playwright_code(command, browser)
         
         validator = CodeValidator()
         if not validator.validate(generated_code):
             error_msg = "Generated code failed security validation: " + "; ".join(validator.get_errors())
+            if cache_hit:
+                code_cache.invalidate_code(generated_code)
             return jsonify({'error': error_msg}), 400
         
-        conn = sqlite3.connect('automation.db')
-        c = conn.cursor()
-        c.execute('INSERT INTO test_history (command, generated_code, browser, mode, execution_location, status) VALUES (?, ?, ?, ?, ?, ?)',
-                  (command, generated_code, browser, mode, execution_location, 'pending'))
-        test_id = c.lastrowid
-        conn.commit()
-        conn.close()
+        if not cache_hit and not reused_task:
+            code_cache.put(command, browser, CODEGEN_PROMPT_VERSION, generated_code)
+        
+        test_id = get_db().execute(
+            'INSERT INTO test_history (command, generated_code, browser, mode, execution_location, status) VALUES (?, ?, ?, ?, ?, ?)',
+            (command, generated_code, browser, mode, execution_location, 'pending')
+        ).lastrowid
+        if reused_task:
+            track_learned_task_run(test_id, reused_task['task_id'])
         
+        queue_position = 0
         if execution_location == 'server':
-            if use_healing:
-                socketio.start_background_task(execute_with_healing, test_id, generated_code, browser, mode)
-            else:
-                socketio.start_background_task(execute_on_server, test_id, generated_code, browser, mode)
+            target = execute_with_healing if use_healing else execute_on_server
+            try:
+                queue_position = scheduler.submit(test_id, browser, target, test_id, generated_code,
+                                                  browser, mode, priority=priority)
+            except QueueFullError as e:
+                return queue_full_response(e, test_id)
         else:
-            # Agent execution - find agent's session ID
-            agent_sid = None
-            for sid in connected_agents:
-                agent_sid = sid
-                break  # Get the first available agent
-            
-            if use_healing:
-                socketio.start_background_task(execute_agent_with_healing, test_id, generated_code, browser, mode)
-            else:
-                if agent_sid:
-                    socketio.emit('execute_on_agent', {
-                        'test_id': test_id,
-                        'code': generated_code,
-                        'browser': browser,
-                        'mode': mode
-                    }, to=agent_sid)
-                else:
-                    return jsonify({'error': 'No agent connected'}), 503
+            # Agent runs queue on the 'agent' slot and go to the least-loaded agent when started
+            if not len(agent_registry):
+                return no_agent_response(test_id)
+            target = execute_agent_with_healing if use_healing else execute_on_agent
+            try:
+                queue_position = scheduler.submit(test_id, 'agent', target, test_id, generated_code,
+                                                  browser, mode, priority=priority)
+            except QueueFullError as e:
+                return queue_full_response(e, test_id)
         
-        return jsonify({'test_id': test_id, 'code': generated_code})
+        return jsonify({
+            'test_id': test_id,
+            'code': generated_code,
+            'cached': cache_hit,
+            'reused_task': {
+                'task_id': reused_task['task_id'],
+                'task_name': reused_task['task_name'],
+                'similarity_score': reused_task['similarity_score']
+            } if reused_task else None,
+            'queue_position': queue_position
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 def execute_on_server(test_id, code, browser, mode):
-    executor = ServerExecutor()
     headless = mode == 'headless'
+    completion_registry.mark_started(test_id)
     
     socketio.emit('execution_status', {
         'test_id': test_id,
@@ -216,23 +358,15 @@ def execute_on_server(test_id, code, browser, mode):
         'message': f'Executing on server in {mode} mode...'
     })
     
-    result = executor.execute(code, browser, headless)
+    result = execution_backend.run_server(test_id, code, browser, headless)
     
-    screenshot_path = None
-    if result.get('screenshot'):
-        screenshot_path = f"screenshots/test_{test_id}.png"
-        with open(os.path.join(app.config['UPLOAD_FOLDER'], screenshot_path), 'wb') as f:
-            f.write(result['screenshot'])
+    screenshot_path = artifact_store.store(result.get('screenshot'))
     
     logs_json = json.dumps(result.get('logs', []))
     status = 'success' if result.get('success') else 'failed'
     
-    conn = sqlite3.connect('automation.db')
-    c = conn.cursor()
-    c.execute('UPDATE test_history SET status=?, logs=?, screenshot_path=? WHERE id=?',
-              (status, logs_json, screenshot_path, test_id))
-    conn.commit()
-    conn.close()
+    write_queue.update_test_history(test_id, status=status, logs=logs_json, screenshot_path=screenshot_path)
+    completion_registry.complete(test_id, status, result.get('logs', []))
     
     socketio.emit('execution_complete', {
         'test_id': test_id,
@@ -242,9 +376,10 @@ def execute_on_server(test_id, code, browser, mode):
     })
 
 def execute_with_healing(test_id, code, browser, mode):
-    healing_executor = HealingExecutor(socketio, api_key=openai_api_key)
+    healing_executor = execution_backend.create_healing_handle(test_id)
     active_healing_executors[test_id] = healing_executor
     headless = mode == 'headless'
+    completion_registry.mark_started(test_id)
     
     socketio.emit('execution_status', {
         'test_id': test_id,
@@ -253,35 +388,32 @@ def execute_with_healing(test_id, code, browser, mode):
     })
     
     try:
-        result = asyncio.run(healing_executor.execute_with_healing(code, browser, headless, test_id))
+        result = execution_backend.run_healing(healing_executor, test_id, code, browser, headless)
     finally:
         if test_id in active_healing_executors:
             del active_healing_executors[test_id]
     
-    screenshot_path = None
-    if result.get('screenshot'):
-        screenshot_path = f"screenshots/test_{test_id}.png"
-        with open(os.path.join(app.config['UPLOAD_FOLDER'], screenshot_path), 'wb') as f:
-            f.write(result['screenshot'])
+    screenshot_path = artifact_store.store(result.get('screenshot'))
     
     logs_json = json.dumps(result.get('logs', []))
     status = 'success' if result.get('success') else 'failed'
     healed_code = result.get('healed_script')
     
+    # The original script needed healing, so stop serving it from the cache
+    if healed_code:
+        code_cache.invalidate_code(code)
+    
     print(f"\n💾 SAVING TO DATABASE:")
     print(f"  test_id: {test_id}")
     print(f"  status: {status}")
     print(f"  healed_code is None: {healed_code is None}")
     print(f"  healed_code length: {len(healed_code) if healed_code else 0}", flush=True)
     
-    conn = sqlite3.connect('automation.db')
-    c = conn.cursor()
-    c.execute('UPDATE test_history SET status=?, logs=?, screenshot_path=?, healed_code=? WHERE id=?',
-              (status, logs_json, screenshot_path, healed_code, test_id))
-    conn.commit()
-    conn.close()
+    write_queue.update_test_history(test_id, status=status, logs=logs_json,
+                                    screenshot_path=screenshot_path, healed_code=healed_code)
+    completion_registry.complete(test_id, status, result.get('logs', []))
     
-    print(f"  ✅ Database updated successfully", flush=True)
+    print(f"  ✅ Database update queued", flush=True)
     
     socketio.emit('execution_complete', {
         'test_id': test_id,
@@ -292,22 +424,72 @@ def execute_with_healing(test_id, code, browser, mode):
         'failed_locators': result.get('failed_locators', [])
     })
 
+def fail_run(test_id, message):
+    """Record a run that ended without a result (no agent answered, or the job raised)."""
+    logs = [f'❌ {message}']
+    write_queue.update_test_history(test_id, status='failed', logs=json.dumps(logs))
+    completion_registry.complete(test_id, 'failed', logs)
+    socketio.emit('execution_complete', {
+        'test_id': test_id,
+        'status': 'failed',
+        'logs': logs,
+        'screenshot_path': None
+    })
+
+def execute_on_agent(test_id, code, browser, mode):
+    """
+    Run a test on the least-loaded agent and hold its slot until the result arrives.
+    
+    The result itself is recorded by handle_agent_result. If the agent drops out
+    mid-run the test is dispatched to another agent.
+    """
+    completion_registry.mark_started(test_id)
+    message = 'No agent available'
+    for dispatch in range(AGENT_MAX_REDISPATCHES + 1):
+        agent_sid = agent_registry.acquire(test_id, browser)
+        if not agent_sid:
+            break
+        socketio.emit('execute_on_agent', {
+            'test_id': test_id,
+            'code': code,
+            'browser': browser,
+            'mode': mode
+        }, to=agent_sid)
+        
+        outcome = agent_registry.wait(test_id, timeout=AGENT_RUN_TIMEOUT)
+        if outcome == 'done':
+            return
+        if outcome == 'timeout':
+            message = f'Agent did not report a result within {AGENT_RUN_TIMEOUT:.0f}s'
+            break
+        message = 'Agent disconnected and no other agent is available'
+        print(f"🔁 Agent lost during test {test_id}, dispatching it again")
+        socketio.emit('execution_status', {
+            'test_id': test_id,
+            'status': 'running',
+            'message': 'Agent disconnected, moving the test to another agent...'
+        })
+    
+    # The agent may still be running it: keep its slot and refuse the late result
+    agent_registry.abandon(test_id)
+    fail_run(test_id, message)
+
 def execute_agent_with_healing(test_id, code, browser, mode):
     """Execute automation on agent with server-coordinated healing."""
-    import gevent
-    from gevent import monkey
-    
-    # Find the agent's session ID
-    agent_sid = None
-    for sid in connected_agents:
-        agent_sid = sid
-        break  # Get the first available agent
+    agent_sid = agent_registry.acquire(test_id, browser)
+    if not agent_sid:
+        fail_run(test_id, 'No agent available')
+        return
     
     healing_executor = HealingExecutor(socketio, api_key=openai_api_key)
     healing_executor.execution_mode = 'agent'  # Mark as agent execution
     healing_executor.agent_sid = agent_sid  # Store agent session ID
+    # Attempts stay on this agent; if it drops out they move to another one
+    healing_executor.redispatch_agent = lambda: agent_registry.acquire(test_id, browser)
+    healing_executor.max_redispatches = AGENT_MAX_REDISPATCHES
     active_healing_executors[test_id] = healing_executor
     headless = mode == 'headless'
+    completion_registry.mark_started(test_id)
     
     socketio.emit('execution_status', {
         'test_id': test_id,
@@ -319,38 +501,41 @@ def execute_agent_with_healing(test_id, code, browser, mode):
     async def _run_healing():
         return await healing_executor.execute_with_healing(code, browser, headless, test_id)
     
+    result = None
     try:
         # Use asyncio.run() to execute the async function
         # This creates a new event loop specifically for this call
         result = asyncio.run(_run_healing())
     finally:
+        if result is None or healing_executor.agent_abandoned:
+            # The agent may still be running the last attempt: keep its slot and refuse the late result
+            agent_registry.abandon(test_id)
+        else:
+            agent_registry.release(test_id)
         if test_id in active_healing_executors:
             del active_healing_executors[test_id]
     
-    screenshot_path = None
-    if result.get('screenshot'):
-        screenshot_path = f"screenshots/test_{test_id}.png"
-        with open(os.path.join(app.config['UPLOAD_FOLDER'], screenshot_path), 'wb') as f:
-            f.write(result['screenshot'])
+    screenshot_path = result.get('screenshot_path') or artifact_store.store(result.get('screenshot'))
     
     logs_json = json.dumps(result.get('logs', []))
     status = 'success' if result.get('success') else 'failed'
     healed_code = result.get('healed_script')
     
+    # The original script needed healing, so stop serving it from the cache
+    if healed_code:
+        code_cache.invalidate_code(code)
+    
     print(f"\n💾 SAVING TO DATABASE:")
     print(f"  test_id: {test_id}")
     print(f"  status: {status}")
     print(f"  healed_code is None: {healed_code is None}")
     print(f"  healed_code length: {len(healed_code) if healed_code else 0}", flush=True)
     
-    conn = sqlite3.connect('automation.db')
-    c = conn.cursor()
-    c.execute('UPDATE test_history SET status=?, logs=?, screenshot_path=?, healed_code=? WHERE id=?',
-              (status, logs_json, screenshot_path, healed_code, test_id))
-    conn.commit()
-    conn.close()
+    write_queue.update_test_history(test_id, status=status, logs=logs_json,
+                                    screenshot_path=screenshot_path, healed_code=healed_code)
+    completion_registry.complete(test_id, status, result.get('logs', []))
     
-    print(f"  ✅ Database updated successfully", flush=True)
+    print(f"  ✅ Database update queued", flush=True)
     
     socketio.emit('execution_complete', {
         'test_id': test_id,
@@ -372,10 +557,9 @@ def heal_locator():
         return jsonify({'error': 'Missing required fields'}), 400
     
     try:
-        conn = sqlite3.connect('automation.db')
-        c = conn.cursor()
-        c.execute('SELECT generated_code, healed_code FROM test_history WHERE id=?', (test_id,))
-        row = c.fetchone()
+        # Read any queued healed_code before building on it
+        write_queue.flush()
+        row = get_db().query_one('SELECT generated_code, healed_code FROM test_history WHERE id=?', (test_id,))
         
         if not row:
             return jsonify({'error': 'Test not found'}), 404
@@ -384,10 +568,9 @@ def heal_locator():
         current_healed = row[1] or original_code
         
         new_healed = current_healed.replace(failed_locator, healed_locator)
+        code_cache.invalidate_code(original_code)
         
-        c.execute('UPDATE test_history SET healed_code=? WHERE id=?', (new_healed, test_id))
-        conn.commit()
-        conn.close()
+        write_queue.update_test_history(test_id, healed_code=new_healed)
         
         socketio.emit('script_healed', {
             'test_id': test_id,
@@ -402,7 +585,129 @@ def heal_locator():
 
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    if not ArtifactStore.is_artifact(filename):
+        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # Artifact names are content hashes, so a URL's bytes never change
+    artifact_store.wait(filename)
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=365 * 24 * 3600)
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/api/browser-pool/stats')
+def browser_pool_stats():
+    """Warm browser pool counters from the processes that run tests; never starts a pool."""
+    if not browser_pool_enabled():
+        return jsonify({'enabled': False})
+    stats = execution_backend.get_browser_pool_stats()
+    stats['enabled'] = True
+    return jsonify(stats)
+
+@app.route('/api/execution-backend/stats')
+def execution_backend_stats():
+    """Execution backend type and worker process status."""
+    return jsonify(execution_backend.get_stats())
+
+@app.route('/api/queue/stats')
+def queue_stats():
+    """Execution scheduler counters: queued, running per slot and wait times."""
+    return jsonify(scheduler.get_stats())
+
+@app.route('/api/codegen-cache/stats')
+def codegen_cache_stats():
+    """Hit/miss counters for the generated code cache."""
+    stats = code_cache.get_stats()
+    stats['prompt_version'] = CODEGEN_PROMPT_VERSION
+    return jsonify(stats)
+
+@app.route('/api/db/stats')
+def db_stats():
+    """SQLite connection pool counters, including connection wait times."""
+    return jsonify(get_db().get_stats())
+
+@app.route('/api/completions/stats')
+def completion_stats():
+    """Counters for test completion listeners."""
+    return jsonify(completion_registry.get_stats())
+
+@app.route('/api/write-queue/stats')
+def write_queue_stats():
+    """Pending and written counts for the write-behind queue."""
+    return jsonify(write_queue.get_stats())
+
+@app.route('/api/artifacts/uploads', methods=['POST'])
+def begin_artifact_upload():
+    """
+    Start a chunked screenshot upload. Body: {"sha256", "size", "encoding": "identity"|"gzip"}.
+    
+    Returns {"artifact"} if the image is already stored, else {"upload_id", "chunk_size"}
+    (201). Send the (encoded) bytes with PUT /api/artifacts/uploads/<id>?offset=N, then
+    POST /api/artifacts/uploads/<id>/complete.
+    """
+    data = request.json or {}
+    try:
+        path, upload_id = artifact_store.begin_upload(data.get('sha256'), data.get('size'),
+                                                      data.get('encoding', 'identity'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if path:
+        return jsonify({'artifact': path})
+    return jsonify({'upload_id': upload_id, 'chunk_size': artifact_store.chunk_size}), 201
+
+@app.route('/api/artifacts/uploads/<upload_id>', methods=['PUT'])
+def write_artifact_chunk(upload_id):
+    """Append one chunk of raw bytes at ?offset=."""
+    offset = request.args.get('offset', 0, type=int)
+    too_large = jsonify({'error': f'Chunk exceeds {artifact_store.chunk_size} bytes'}), 413
+    if (request.content_length or 0) > artifact_store.chunk_size:
+        return too_large
+    # Read at most one byte past the limit, so an undeclared oversized body is never buffered
+    chunk = request.stream.read(artifact_store.chunk_size + 1)
+    if len(chunk) > artifact_store.chunk_size:
+        return too_large
+    try:
+        received = artifact_store.write_chunk(upload_id, offset, chunk)
+    except KeyError:
+        return jsonify({'error': 'Unknown upload'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'received': received})
+
+@app.route('/api/artifacts/uploads/<upload_id>/complete', methods=['POST'])
+def finish_artifact_upload(upload_id):
+    """Verify the upload and store it; returns {"artifact"} for the agent's result event."""
+    try:
+        path = artifact_store.finish_upload(upload_id)
+    except KeyError:
+        return jsonify({'error': 'Unknown upload'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'artifact': path})
+
+@app.route('/api/agents/stats')
+def agent_stats():
+    """Connected agents with capacity, load and heartbeat age, plus dispatch counters."""
+    return jsonify(agent_registry.get_stats())
+
+@app.route('/api/artifacts/stats')
+def artifact_stats():
+    """Screenshot store counters: stored, deduplicated, bytes in/out and disk usage."""
+    return jsonify(artifact_store.get_stats())
+
+@app.route('/api/artifacts/gc', methods=['POST'])
+def artifact_gc():
+    """Apply the screenshot retention policy now. Body: {"retention_days": N} (optional)."""
+    write_queue.flush()
+    data = request.json or {}
+    return jsonify(artifact_store.gc(retention_days=data.get('retention_days')))
+
+@app.route('/api/embedding-cache/stats')
+def embedding_cache_stats():
+    """Hit/miss counters for the embedding cache."""
+    if not semantic_search:
+        return jsonify({'error': 'Semantic search is not available'}), 400
+    if not semantic_search.embedding_cache:
+        return jsonify({'enabled': False, 'model': semantic_search.embedding_service.model})
+    return jsonify(semantic_search.embedding_cache.get_stats())
 
 @app.route('/api/agent/download')
 def download_agent():
@@ -431,11 +736,59 @@ def download_agent():
 
 @app.route('/api/tasks', methods=['GET'])
 def get_all_tasks():
-    """Get all learned tasks."""
+    """
+    Task summaries (without code), newest first. ?limit=&cursor=&tags=a,b&match=any|all&since=&until=
+    
+    The first page also carries library-wide totals; code comes from /api/tasks/<task_id>.
+    """
     try:
-        limit = request.args.get('limit', 100, type=int)
-        tasks = LearnedTask.get_all(limit=limit)
-        return jsonify([task.to_dict() for task in tasks])
+        cursor = request.args.get('cursor')
+        tags = [tag for tag in request.args.get('tags', '').split(',') if tag.strip()]
+        tasks, next_cursor = LearnedTask.list_page(
+            tags, match=request.args.get('match', 'any'), since=request.args.get('since'),
+            until=request.args.get('until'), limit=page_size(100), cursor=cursor
+        )
+        response = {'tasks': [task.to_dict() for task in tasks], 'next_cursor': next_cursor}
+        if not cursor:
+            response['totals'] = LearnedTask.get_totals()
+        return jsonify(response)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/tasks/by-tags', methods=['GET'])
+def get_tasks_by_tags():
+    """Find tasks by tag. ?tags=a,b&match=any|all&limit=&offset="""
+    try:
+        tags = [tag for tag in request.args.get('tags', '').split(',') if tag.strip()]
+        match = request.args.get('match', 'any')
+        if match not in ('any', 'all'):
+            return jsonify({'error': "match must be 'any' or 'all'"}), 400
+        if not tags:
+            return jsonify({'error': 'tags is required'}), 400
+        
+        limit = request.args.get('limit', 50, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        tasks = LearnedTask.search_by_tags(tags, match=match, limit=limit, offset=offset)
+        return jsonify({
+            'tasks': [task.to_dict() for task in tasks],
+            'total': LearnedTask.count_by_tags(tags, match=match),
+            'limit': limit,
+            'offset': offset
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/tasks/tags', methods=['GET'])
+def get_task_tags():
+    """Tag facet counts, optionally narrowed by ?tags=a,b&match=any|all."""
+    try:
+        tags = [tag for tag in request.args.get('tags', '').split(',') if tag.strip()]
+        match = request.args.get('match', 'any')
+        limit = request.args.get('limit', 50, type=int)
+        facets = LearnedTask.tag_facets(tags, match=match, limit=limit)
+        return jsonify([{'tag': tag, 'count': count} for tag, count in facets])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -508,16 +861,124 @@ def delete_task(task_id):
             semantic_search.delete_task_from_index(task_id)
         
         # Delete from database
-        conn = sqlite3.connect('automation.db')
-        c = conn.cursor()
-        c.execute('DELETE FROM learned_tasks WHERE task_id=?', (task_id,))
-        conn.commit()
-        conn.close()
+        LearnedTask.delete(task_id)
         
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+reindex_state = {'running': False, 'last_result': None, 'last_sync': None}
+
+def start_reindex(batch_size=100, resume=False):
+    """Rebuild the semantic search index in a background task. Returns False if one is running."""
+    if reindex_state['running']:
+        return False
+    reindex_state['running'] = True
+    
+    def run_reindex():
+        def on_progress(done, total):
+            socketio.emit('reindex_progress', {'done': done, 'total': total})
+        try:
+            reindex_state['last_result'] = semantic_search.reindex_all_tasks(
+                batch_size=batch_size, resume=resume, progress_callback=on_progress
+            )
+            socketio.emit('reindex_complete', reindex_state['last_result'])
+        except Exception as e:
+            print(f"Reindex failed: {e}")
+            reindex_state['last_result'] = {'error': str(e)}
+            socketio.emit('reindex_complete', reindex_state['last_result'])
+        finally:
+            reindex_state['running'] = False
+    
+    socketio.start_background_task(run_reindex)
+    return True
+
+def start_index_sync(reembed=True):
+    """Repair the vector index from stored embeddings in a background task. Returns False if busy."""
+    if reindex_state['running']:
+        return False
+    reindex_state['running'] = True
+    
+    def run_sync():
+        try:
+            reindex_state['last_sync'] = semantic_search.sync_with_database(reembed=reembed)
+        except Exception as e:
+            print(f"Vector index sync failed: {e}")
+            reindex_state['last_sync'] = {'error': str(e)}
+        finally:
+            reindex_state['running'] = False
+    
+    socketio.start_background_task(run_sync)
+    return True
+
+def run_artifact_gc():
+    """Apply the screenshot retention policy periodically."""
+    while ARTIFACT_GC_INTERVAL > 0:
+        try:
+            write_queue.flush()
+            artifact_store.gc()
+        except Exception as e:
+            print(f"⚠️ Artifact GC failed: {e}")
+        socketio.sleep(ARTIFACT_GC_INTERVAL)
+
+socketio.start_background_task(run_artifact_gc)
+
+# Reconcile the index with learned_tasks on startup. Stored vectors are loaded
+# directly; only tasks without one (e.g. after switching embedding backends) are re-embedded.
+if semantic_search:
+    start_index_sync()
+
+@app.route('/api/tasks/reindex', methods=['POST'])
+def reindex_tasks():
+    """Rebuild the semantic search index in the background."""
+    if not semantic_search:
+        return jsonify({'error': 'Semantic search is not available'}), 400
+    
+    data = request.json or {}
+    resume = data.get('resume', False)
+    if not start_reindex(batch_size=data.get('batch_size', 100), resume=resume):
+        return jsonify({'error': 'Reindex already in progress'}), 409
+    return jsonify({'success': True, 'message': 'Reindex started', 'resume': resume}), 202
+
+@app.route('/api/tasks/reindex', methods=['GET'])
+def reindex_status():
+    """Status of the most recent reindex run."""
+    return jsonify(reindex_state)
+
+@app.route('/api/vector-index/stats')
+def vector_index_stats():
+    """Type, size and search parameters of the FAISS index."""
+    if not semantic_search:
+        return jsonify({'error': 'Semantic search is not available'}), 400
+    return jsonify(semantic_search.vector_store.get_stats())
+
+@app.route('/api/vector-index/sync', methods=['POST'])
+def sync_vector_index():
+    """Repair the FAISS index from learned_tasks embeddings; see /api/tasks/reindex for the result."""
+    if not semantic_search:
+        return jsonify({'error': 'Semantic search is not available'}), 400
+    
+    reembed = (request.json or {}).get('reembed', True)
+    if not start_index_sync(reembed=reembed):
+        return jsonify({'error': 'Reindex already in progress'}), 409
+    return jsonify({'success': True, 'message': 'Index sync started', 'reembed': reembed}), 202
+
+@app.route('/api/vector-index/rebuild', methods=['POST'])
+def rebuild_vector_index():
+    """Rebuild the FAISS index as flat, hnsw or ivfpq, and/or retune efSearch/nprobe."""
+    if not semantic_search:
+        return jsonify({'error': 'Semantic search is not available'}), 400
+    
+    data = request.json or {}
+    store = semantic_search.vector_store
+    try:
+        store.set_search_params(ef_search=data.get('ef_search'), nprobe=data.get('nprobe'))
+        if data.get('rebuild', True):
+            return jsonify(store.rebuild(data.get('index_type')))
+        return jsonify(store.get_stats())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/api/tasks/search', methods=['POST'])
 def search_tasks():
     """Search for tasks using natural language."""
@@ -525,20 +986,23 @@ def search_tasks():
         data = request.json
         query = data.get('query')
         top_k = data.get('top_k', 5)
+        mode = data.get('mode', 'semantic')
         
         if not query:
             return jsonify({'error': 'query is required'}), 400
+        if mode not in ('semantic', 'keyword', 'hybrid'):
+            return jsonify({'error': "mode must be 'semantic', 'keyword' or 'hybrid'"}), 400
         
-        if not semantic_search:
-            return jsonify({
-                'error': 'OPENAI_API_KEY is not set. Semantic search requires an OpenAI API key to generate embeddings.'
-            }), 400
-        
-        # Search for relevant tasks
-        results = semantic_search.search_tasks(query, top_k=top_k)
+        # Search for relevant tasks; keyword search works without embeddings
+        if mode == 'keyword' or not semantic_search:
+            mode = 'keyword'
+            results = keyword_search_tasks(query, top_k=top_k)
+        else:
+            results = semantic_search.search_tasks(query, top_k=top_k, mode=mode)
         
         return jsonify({
             'query': query,
+            'mode': mode,
             'results': results
         })
     except Exception as e:
@@ -559,6 +1023,10 @@ def execute_learned_task():
         browser = data.get('browser', 'chromium')
         mode = data.get('mode', 'headless')
         execution_location = data.get('execution_location', 'server')
+        priority = data.get('priority', 'interactive')
+        
+        if scheduler.is_full():
+            return queue_full_response(QueueFullError(scheduler.max_queue_size))
         
         # Get the task
         task = LearnedTask.get_by_id(task_id)
@@ -575,81 +1043,34 @@ def execute_learned_task():
             return jsonify({'error': error_msg}), 400
         
         # Create a test history entry for tracking
-        conn = sqlite3.connect('automation.db')
-        c = conn.cursor()
-        c.execute('INSERT INTO test_history (command, generated_code, browser, mode, execution_location, status) VALUES (?, ?, ?, ?, ?, ?)',
-                  (f"Learned Task: {task.task_name}", code, browser, mode, execution_location, 'pending'))
-        test_id = c.lastrowid
-        conn.commit()
-        conn.close()
+        test_id = get_db().execute(
+            'INSERT INTO test_history (command, generated_code, browser, mode, execution_location, status) VALUES (?, ?, ?, ?, ?, ?)',
+            (f"Learned Task: {task.task_name}", code, browser, mode, execution_location, 'pending')
+        ).lastrowid
+        track_learned_task_run(test_id, task_id)
         
         # Execute the task
+        queue_position = 0
         if execution_location == 'server':
-            socketio.start_background_task(execute_on_server, test_id, code, browser, mode)
+            try:
+                queue_position = scheduler.submit(test_id, browser, execute_on_server, test_id, code,
+                                                  browser, mode, priority=priority)
+            except QueueFullError as e:
+                return queue_full_response(e, test_id)
         else:
-            agent_sid = None
-            for sid in connected_agents:
-                agent_sid = sid
-                break
-            
-            if agent_sid:
-                socketio.emit('execute_on_agent', {
-                    'test_id': test_id,
-                    'code': code,
-                    'browser': browser,
-                    'mode': mode
-                }, to=agent_sid)
-            else:
-                return jsonify({'error': 'No agent connected'}), 503
-        
-        # Update task execution stats
-        start_time = time.time()
-        
-        # Record execution in background
-        def record_execution():
-            # Wait a bit for execution to complete
-            time.sleep(2)
-            
-            # Get execution result from test_history
-            conn = sqlite3.connect('automation.db')
-            c = conn.cursor()
-            c.execute('SELECT status, logs FROM test_history WHERE id=?', (test_id,))
-            row = c.fetchone()
-            
-            if row:
-                status = row[0]
-                logs = row[1]
-                success = status == 'success'
-                
-                # Update task stats
-                task = LearnedTask.get_by_id(task_id)
-                if task:
-                    if success:
-                        task.success_count += 1
-                    else:
-                        task.failure_count += 1
-                    task.last_executed = datetime.now()
-                    task.save()
-                
-                # Record execution
-                execution_time = int((time.time() - start_time) * 1000)
-                execution = TaskExecution(
-                    task_id=task_id,
-                    execution_result=status,
-                    success=success,
-                    error_message=logs if not success else None,
-                    execution_time_ms=execution_time
-                )
-                execution.save()
-            
-            conn.close()
-        
-        socketio.start_background_task(record_execution)
+            if not len(agent_registry):
+                return no_agent_response(test_id)
+            try:
+                queue_position = scheduler.submit(test_id, 'agent', execute_on_agent, test_id, code,
+                                                  browser, mode, priority=priority)
+            except QueueFullError as e:
+                return queue_full_response(e, test_id)
         
         return jsonify({
             'test_id': test_id,
             'task_name': task.task_name,
-            'message': 'Task execution started'
+            'queue_position': queue_position,
+            'message': 'Task execution started' if queue_position == 0 else f'Task queued at position {queue_position}'
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -667,13 +1088,14 @@ def recall_and_execute():
         mode = data.get('mode', 'headless')
         execution_location = data.get('execution_location', 'server')
         auto_execute = data.get('auto_execute', False)
+        priority = data.get('priority', 'interactive')
         
         if not query:
             return jsonify({'error': 'query is required'}), 400
         
         if not semantic_search:
             return jsonify({
-                'error': 'OPENAI_API_KEY is not set. Recall Mode requires an OpenAI API key to search for tasks.'
+                'error': 'Semantic search is not available. Recall Mode needs an embedding backend to search for tasks.'
             }), 400
         
         # Search for the most relevant task
@@ -697,30 +1119,40 @@ def recall_and_execute():
         best_match = results[0]
         task_id = best_match['task_id']
         similarity_score = best_match.get('similarity_score', 0)
+        threshold = data.get('similarity_threshold', semantic_search.recall_threshold)
         
-        # If auto_execute is True and similarity is high enough, execute immediately
-        if auto_execute and similarity_score > 0.7:
+        # If auto_execute is True and the cosine similarity clears the backend recall threshold, execute immediately
+        if auto_execute and similarity_score >= threshold:
             # Execute the task
             task = LearnedTask.get_by_id(task_id)
             code = task.playwright_code
             
             # Create test history entry
-            conn = sqlite3.connect('automation.db')
-            c = conn.cursor()
-            c.execute('INSERT INTO test_history (command, generated_code, browser, mode, execution_location, status) VALUES (?, ?, ?, ?, ?, ?)',
-                      (query, code, browser, mode, execution_location, 'pending'))
-            test_id = c.lastrowid
-            conn.commit()
-            conn.close()
+            test_id = get_db().execute(
+                'INSERT INTO test_history (command, generated_code, browser, mode, execution_location, status) VALUES (?, ?, ?, ?, ?, ?)',
+                (query, code, browser, mode, execution_location, 'pending')
+            ).lastrowid
+            track_learned_task_run(test_id, task_id)
             
             # Execute
+            queue_position = 0
             if execution_location == 'server':
-                socketio.start_background_task(execute_on_server, test_id, code, browser, mode)
+                target, slot = execute_on_server, browser
+            elif len(agent_registry):
+                target, slot = execute_on_agent, 'agent'
+            else:
+                return no_agent_response(test_id)
+            try:
+                queue_position = scheduler.submit(test_id, slot, target, test_id, code,
+                                                  browser, mode, priority=priority)
+            except QueueFullError as e:
+                return queue_full_response(e, test_id)
             
             return jsonify({
                 'found': True,
                 'executed': True,
                 'test_id': test_id,
+                'queue_position': queue_position,
                 'task': best_match,
                 'similarity_score': similarity_score
             })
@@ -731,6 +1163,7 @@ def recall_and_execute():
                 'executed': False,
                 'task': best_match,
                 'similarity_score': similarity_score,
+                'threshold': threshold,
                 'message': 'Task found. Please confirm execution or adjust the query.'
             })
     except Exception as e:
@@ -922,58 +1355,95 @@ def stop_teaching_recording():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+def agents_changed():
+    """Tell web clients about the agent pool and start agent jobs waiting for capacity."""
+    socketio.emit('agents_update', {'agents': agent_registry.agents()})
+    scheduler.dispatch()
+
+def handle_lost_tests(test_ids):
+    """Tests whose agent dropped out: wake healing runs so they move to another agent."""
+    for test_id in test_ids:
+        healing_executor = active_healing_executors.get(test_id)
+        if healing_executor and healing_executor.execution_mode == 'agent':
+            healing_executor.mark_agent_lost()
+    # Plain agent runs notice through agent_registry.wait()
+
+def run_agent_eviction():
+    """Drop agents that stopped sending heartbeats."""
+    while True:
+        socketio.sleep(max(agent_registry.heartbeat_timeout / 3, 1))
+        evicted = agent_registry.evict_stale()
+        for sid, test_ids in evicted.items():
+            print(f"💀 Evicted agent {sid} (no heartbeat for {agent_registry.heartbeat_timeout:.0f}s), "
+                  f"{len(test_ids)} test(s) to redispatch")
+            handle_lost_tests(test_ids)
+        if evicted:
+            agents_changed()
+
+socketio.start_background_task(run_agent_eviction)
+
 @socketio.on('connect')
 def handle_connect():
     print(f'Client connected: {request.sid}')
     emit('connected', {'sid': request.sid})
     # Send current list of connected agents to newly connected web client
-    socketio.emit('agents_update', {'agents': list(connected_agents.values())})
+    emit('agents_update', {'agents': agent_registry.agents()})
 
 @socketio.on('disconnect')
 def handle_disconnect():
     print(f'Client disconnected: {request.sid}')
-    if request.sid in connected_agents:
-        del connected_agents[request.sid]
-        print(f'Updated connected_agents after disconnect: {connected_agents}')
-        socketio.emit('agents_update', {'agents': list(connected_agents.values())})
+    if request.sid in agent_registry:
+        lost = agent_registry.unregister(request.sid)
+        print(f'Agent disconnected: {request.sid} ({len(lost)} running test(s) to redispatch)')
+        handle_lost_tests(lost)
+        agents_changed()
 
 @socketio.on('agent_register')
 def handle_agent_register(data):
     agent_id = data.get('agent_id')
-    connected_agents[request.sid] = {
-        'agent_id': agent_id,
-        'browsers': data.get('browsers', []),
-        'connected_at': datetime.now().isoformat()
-    }
-    print(f'Agent registered: {agent_id}')
-    print(f'Updated connected_agents after register: {connected_agents}')
+    agent_registry.register(request.sid, agent_id, data.get('browsers', []), data.get('max_concurrency'))
+    print(f'Agent registered: {agent_id} (max_concurrency={data.get("max_concurrency") or agent_registry.default_concurrency})')
     emit('agent_registered', {'status': 'success'})
-    print(f'Emitting agents_update: {list(connected_agents.values())}')
-    socketio.emit('agents_update', {'agents': list(connected_agents.values())})
+    agents_changed()
+
+@socketio.on('agent_heartbeat')
+def handle_agent_heartbeat(data):
+    if not agent_registry.heartbeat(request.sid, load=data.get('load'), max_concurrency=data.get('max_concurrency'),
+                                    browsers=data.get('browsers')):
+        # Evicted (or the server restarted) while the connection stayed up
+        agent_registry.register(request.sid, data.get('agent_id'), data.get('browsers', []),
+                                data.get('max_concurrency'))
+        agent_registry.heartbeat(request.sid, load=data.get('load'))
+        print(f"Agent re-registered from heartbeat: {data.get('agent_id')}")
+        agents_changed()
+    else:
+        # An idle heartbeat frees slots held by abandoned runs
+        scheduler.dispatch()
+
+def agent_screenshot_path(data):
+    """Artifact path for an agent result: the uploaded artifact ref, or an inline base64 image (older agents)."""
+    if ArtifactStore.is_artifact(data.get('screenshot_ref')):
+        return data['screenshot_ref']
+    if data.get('screenshot'):
+        return artifact_store.store(base64.b64decode(data['screenshot']))
+    return None
 
 @socketio.on('agent_result')
 def handle_agent_result(data):
     test_id = data.get('test_id')
+    if not agent_registry.release(test_id, request.sid):
+        print(f"⚠️ Ignoring result for test {test_id} from {request.sid}: the test was moved to another agent or timed out")
+        agents_changed()
+        return
     success = data.get('success')
     logs = data.get('logs', [])
-    screenshot_data = data.get('screenshot')
-    
-    screenshot_path = None
-    if screenshot_data:
-        screenshot_path = f"screenshots/test_{test_id}.png"
-        screenshot_bytes = base64.b64decode(screenshot_data)
-        with open(os.path.join(app.config['UPLOAD_FOLDER'], screenshot_path), 'wb') as f:
-            f.write(screenshot_bytes)
+    screenshot_path = agent_screenshot_path(data)
     
     logs_json = json.dumps(logs)
     status = 'success' if success else 'failed'
     
-    conn = sqlite3.connect('automation.db')
-    c = conn.cursor()
-    c.execute('UPDATE test_history SET status=?, logs=?, screenshot_path=? WHERE id=?',
-              (status, logs_json, screenshot_path, test_id))
-    conn.commit()
-    conn.close()
+    write_queue.update_test_history(test_id, status=status, logs=logs_json, screenshot_path=screenshot_path)
+    completion_registry.complete(test_id, status, logs)
     
     socketio.emit('execution_complete', {
         'test_id': test_id,
@@ -1002,14 +1472,10 @@ def handle_element_selected(data):
     print(f"  failed_locator: {failed_locator}", flush=True)
     
     # Get the generated code from database
-    conn = sqlite3.connect('automation.db')
-    c = conn.cursor()
-    c.execute('SELECT generated_code FROM test_history WHERE id=?', (test_id,))
-    row = c.fetchone()
+    row = get_db().query_one('SELECT generated_code FROM test_history WHERE id=?', (test_id,))
     
     if not row:
         print(f"  ❌ Test {test_id} not found in database", flush=True)
-        conn.close()
         socketio.emit('error', {
             'test_id': test_id,
             'message': 'Test not found in database'
@@ -1026,6 +1492,8 @@ def handle_element_selected(data):
     
     # Heal the script
     healed_code = generated_code.replace(failed_locator, selector) if failed_locator else generated_code
+    if healed_code != generated_code:
+        code_cache.invalidate_code(generated_code)
     
     print(f"\n🔧 HEALING SCRIPT IN handle_element_selected:")
     print(f"  Failed locator: '{failed_locator}'")
@@ -1034,11 +1502,9 @@ def handle_element_selected(data):
     print(f"  Healed code length: {len(healed_code)}", flush=True)
     
     # Save healed code to database
-    c.execute('UPDATE test_history SET healed_code=? WHERE id=?', (healed_code, test_id))
-    conn.commit()
-    conn.close()
+    write_queue.update_test_history(test_id, healed_code=healed_code)
     
-    print(f"  ✅ Healed code saved to database for test {test_id}", flush=True)
+    print(f"  ✅ Healed code queued for saving for test {test_id}", flush=True)
     
     # Update healing executor if it exists
     if test_id in active_healing_executors:
@@ -1058,12 +1524,17 @@ def handle_healing_attempt_result(data):
     """Handle result from agent healing attempt execution."""
     test_id = data.get('test_id')
     
+    if not agent_registry.owns(test_id, request.sid):
+        print(f"⚠️ Ignoring healing result for test {test_id} from {request.sid}: the test was moved to another agent")
+        return
+    
     if test_id in active_healing_executors:
         healing_executor = active_healing_executors[test_id]
         healing_executor.set_agent_result({
             'success': data.get('success'),
             'logs': data.get('logs', []),
-            'screenshot': data.get('screenshot')
+            'screenshot': data.get('screenshot'),
+            'screenshot_ref': data['screenshot_ref'] if ArtifactStore.is_artifact(data.get('screenshot_ref')) else None
         })
 
 if __name__ == '__main__':
@@ -0,0 +1,429 @@
+"""
+Content-addressed store for run screenshots.
+
+Images are keyed by the SHA-256 of the bytes the browser produced, so a
+screenshot that was already stored (a retried or healed run ending on the same
+page) is never encoded or written twice. New images are re-encoded as WebP or
+JPEG with a thumbnail for the history list; the encoding runs on a real OS
+thread pool so it never blocks the gevent hub. Paths are relative to the
+uploads folder, e.g. ``artifacts/3f/3fa9....webp``.
+
+Agents send screenshots through a chunked HTTP upload (``begin_upload``,
+``write_chunk``, ``finish_upload``) and put only the returned path in their
+result event, so large images never travel over the Socket.IO connection.
+"""
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from models import ExecutionHistory
+
+
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+UPLOAD_ENCODINGS = ('identity', 'gzip')
+ARTIFACT_PATH = re.compile(r'^artifacts/[0-9a-f]{2}/[0-9a-f]{64}(\.thumb)?\.(webp|jpg)$')
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def _thread_pool(max_workers):
+    """OS threads for CPU-bound work: gevent's pool when threading is monkey-patched."""
+    if _gevent_patched():
+        from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+        return GeventThreadPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='artifacts')
+
+
+def _os_lock():
+    """A lock that is safe to share between greenlets and the pool's OS threads."""
+    if _gevent_patched():
+        from gevent import monkey
+        return monkey.get_original('threading', 'Lock')()
+    return threading.Lock()
+
+
+class ArtifactStore:
+    """
+    Screenshot storage under ``<upload_folder>/artifacts``.
+
+    ``store`` hashes the raw image, returns its final path straight away and
+    queues the encode/write; ``wait`` blocks until a queued path is on disk, so
+    the file route can serve an artifact that is still being written. ``gc``
+    applies the retention policy.
+    """
+
+    SUBDIR = 'artifacts'
+
+    def __init__(self, upload_folder='uploads', image_format='webp', quality=80,
+                 thumbnail_width=320, thumbnail_quality=60, retention_days=30,
+                 max_workers=2, chunk_size=256 * 1024, max_upload_bytes=25 * 1024 * 1024,
+                 db_path='automation.db'):
+        if image_format not in FORMATS:
+            raise ValueError(f"Unknown artifact format: {image_format} (expected one of {sorted(FORMATS)})")
+        self.upload_folder = upload_folder
+        self.root = os.path.join(upload_folder, self.SUBDIR)
+        self.image_format = image_format
+        self.quality = quality
+        self.thumbnail_width = thumbnail_width
+        self.thumbnail_quality = thumbnail_quality
+        self.retention_days = retention_days
+        self.chunk_size = chunk_size
+        self.max_upload_bytes = max_upload_bytes
+        self.db_path = db_path
+        self._uploads = {}
+        self._pool = _thread_pool(max_workers)
+        self._pending = {}
+        self._lock = _os_lock()
+        self.stats = {
+            'stored': 0,
+            'deduplicated': 0,
+            'failed': 0,
+            'uploads_started': 0,
+            'uploads_skipped': 0,
+            'uploads_completed': 0,
+            'upload_bytes_received': 0,
+            'bytes_in': 0,
+            'bytes_written': 0,
+            'encode_ms': 0.0,
+            'gc_runs': 0,
+            'gc_expired_runs': 0,
+            'gc_removed_files': 0,
+            'gc_freed_bytes': 0,
+            'uploads_expired': 0,
+        }
+        os.makedirs(self.root, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, upload_folder='uploads'):
+        """Build a store from ARTIFACT_* environment variables."""
+        return cls(
+            upload_folder,
+            image_format=os.environ.get('ARTIFACT_FORMAT', 'webp').lower(),
+            quality=int(os.environ.get('ARTIFACT_QUALITY', 80)),
+            thumbnail_width=int(os.environ.get('ARTIFACT_THUMBNAIL_WIDTH', 320)),
+            thumbnail_quality=int(os.environ.get('ARTIFACT_THUMBNAIL_QUALITY', 60)),
+            retention_days=int(os.environ.get('ARTIFACT_RETENTION_DAYS', 30)),
+            max_workers=int(os.environ.get('ARTIFACT_WORKERS', 2)),
+            chunk_size=int(os.environ.get('ARTIFACT_CHUNK_SIZE', 256 * 1024)),
+            max_upload_bytes=int(os.environ.get('ARTIFACT_MAX_UPLOAD_MB', 25)) * 1024 * 1024,
+        )
+
+    # ---------------- Paths ----------------
+
+    @property
+    def extension(self):
+        return 'jpg' if self.image_format == 'jpeg' else self.image_format
+
+    def path_for(self, digest):
+        """Upload-relative path of the full image for a content hash."""
+        return f'{self.SUBDIR}/{digest[:2]}/{digest}.{self.extension}'
+
+    @classmethod
+    def is_artifact(cls, path):
+        return isinstance(path, str) and ARTIFACT_PATH.match(path) is not None
+
+    @classmethod
+    def thumbnail_for(cls, path):
+        """Upload-relative thumbnail path for an artifact path (None for legacy screenshots)."""
+        if not cls.is_artifact(path):
+            return None
+        stem, extension = path.rsplit('.', 1)
+        return f'{stem}.thumb.{extension}'
+
+    def _abs(self, path):
+        return os.path.join(self.upload_folder, path)
+
+    # ---------------- Writes ----------------
+
+    def store(self, image_bytes) -> Optional[str]:
+        """
+        Queue a screenshot for storage and return its upload-relative path.
+
+        Hashing is the only work done on the caller's greenlet; decoding,
+        re-encoding and writing happen on the pool.
+        """
+        if not image_bytes:
+            return None
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        path = self.path_for(digest)
+        with self._lock:
+            self.stats['bytes_in'] += len(image_bytes)
+            if path in self._pending or os.path.exists(self._abs(path)):
+                self.stats['deduplicated'] += 1
+                return path
+            # Reserve the path; submitting may wait for a free worker, which
+            # must not happen while holding a lock the workers also take
+            self._pending[path] = None
+        future = self._pool.submit(self._write, path, image_bytes)
+        with self._lock:
+            if path in self._pending:
+                self._pending[path] = future
+        return path
+
+    def wait(self, path, timeout=30):
+        """Block until a queued artifact has been written (no-op otherwise)."""
+        path = self._full_path(path)
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if path not in self._pending:
+                    return
+                future = self._pending[path]
+            if future is not None:
+                break
+            if time.monotonic() > deadline:
+                return
+            time.sleep(0.01)  # Reserved but not yet submitted
+        try:
+            future.result(timeout=max(0, deadline - time.monotonic()))
+        except Exception:
+            pass
+
+    def _full_path(self, path):
+        if path and '.thumb.' in path:
+            return path.replace('.thumb.', '.')
+        return path
+
+    def _encode(self, image, quality):
+        buffer = io.BytesIO()
+        if self.image_format == 'jpeg':
+            image = image.convert('RGB')
+            image.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+        else:
+            image.save(buffer, 'WEBP', quality=quality, method=4)
+        return buffer.getvalue()
+
+    def _write_file(self, path, data):
+        target = self._abs(path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp = f'{target}.{uuid.uuid4().hex}.tmp'
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, target)
+        return len(data)
+
+    def _write(self, path, image_bytes):
+        from PIL import Image
+
+        started = time.perf_counter()
+        try:
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                image.load()
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+                full = self._encode(image, self.quality)
+                thumbnail = image.copy()
+                thumbnail.thumbnail((self.thumbnail_width, self.thumbnail_width * 4))
+                thumb = self._encode(thumbnail, self.thumbnail_quality)
+            # Thumbnail first: once the full image exists the artifact counts as stored
+            written = self._write_file(self.thumbnail_for(path), thumb)
+            written += self._write_file(path, full)
+            self._count(stored=1, bytes_written=written, encode_ms=(time.perf_counter() - started) * 1000)
+        except Exception as e:
+            self._count(failed=1)
+            print(f"⚠️ Failed to store screenshot {path}: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(path, None)
+
+    def _count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self.stats[name] += amount
+
+    # ---------------- Chunked uploads ----------------
+
+    def _part_file(self, upload_id):
+        return os.path.join(self.root, '.uploads', f'{upload_id}.part')
+
+    def begin_upload(self, digest, size, encoding='identity'):
+        """
+        Start an upload of an image with the given SHA-256 and decoded size.
+
+        Returns ``(path, None)`` when the image is already stored, so the
+        client can skip sending it, otherwise ``(None, upload_id)``.
+        """
+        if not isinstance(digest, str) or not re.fullmatch(r'[0-9a-f]{64}', digest):
+            raise ValueError("sha256 must be a lowercase hex digest")
+        if not isinstance(size, int) or not 0 < size <= self.max_upload_bytes:
+            raise ValueError(f"size must be between 1 and {self.max_upload_bytes} bytes")
+        if encoding not in UPLOAD_ENCODINGS:
+            raise ValueError(f"Unknown encoding: {encoding} (expected one of {list(UPLOAD_ENCODINGS)})")
+
+        path = self.path_for(digest)
+        with self._lock:
+            if path in self._pending or os.path.exists(self._abs(path)):
+                self.stats['uploads_skipped'] += 1
+                self.stats['deduplicated'] += 1
+                return path, None
+            upload_id = uuid.uuid4().hex
+            self._uploads[upload_id] = {'digest': digest, 'size': size, 'encoding': encoding, 'received': 0,
+                                        'updated_at': time.monotonic()}
+            self.stats['uploads_started'] += 1
+        part = self._part_file(upload_id)
+        os.makedirs(os.path.dirname(part), exist_ok=True)
+        open(part, 'wb').close()
+        return None, upload_id
+
+    def write_chunk(self, upload_id, offset, data):
+        """Append a chunk at ``offset``; a resent chunk that was already received is ignored."""
+        upload = self._uploads.get(upload_id)
+        if upload is None:
+            raise KeyError(upload_id)
+        if offset + len(data) <= upload['received']:
+            return upload['received']
+        if offset != upload['received']:
+            raise ValueError(f"Expected offset {upload['received']}, got {offset}")
+        if offset + len(data) > self.max_upload_bytes:
+            raise ValueError(f"Upload exceeds {self.max_upload_bytes} bytes")
+        with open(self._part_file(upload_id), 'ab') as f:
+            f.write(data)
+        upload['received'] += len(data)
+        upload['updated_at'] = time.monotonic()
+        self._count(upload_bytes_received=len(data))
+        return upload['received']
+
+    def finish_upload(self, upload_id) -> str:
+        """Verify a completed upload against its declared hash and store it; returns the path."""
+        with self._lock:
+            upload = self._uploads.pop(upload_id, None)
+        if upload is None:
+            raise KeyError(upload_id)
+        part = self._part_file(upload_id)
+        try:
+            with open(part, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            raise ValueError(f"Upload {upload_id} has expired") from e
+        finally:
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+
+        if upload['encoding'] == 'gzip':
+            # Never inflate past the declared size: the payload comes from the client
+            decompressor = zlib.decompressobj(wbits=31)
+            try:
+                data = decompressor.decompress(data, upload['size'] + 1)
+            except zlib.error as e:
+                raise ValueError(f"Invalid gzip payload: {e}") from e
+            if (len(data) > upload['size'] or decompressor.unconsumed_tail or decompressor.unused_data
+                    or not decompressor.eof):
+                raise ValueError("gzip payload does not decode to exactly the declared size")
+        if len(data) != upload['size'] or hashlib.sha256(data).hexdigest() != upload['digest']:
+            raise ValueError("Uploaded bytes do not match the declared size and sha256")
+        self._count(uploads_completed=1)
+        return self.store(data)
+
+    def expire_uploads(self, max_idle_seconds=3600):
+        """Drop uploads that received nothing for ``max_idle_seconds``; returns how many."""
+        cutoff = time.monotonic() - max_idle_seconds
+        with self._lock:
+            stale = [upload_id for upload_id, upload in self._uploads.items() if upload['updated_at'] < cutoff]
+            for upload_id in stale:
+                del self._uploads[upload_id]
+            self.stats['uploads_expired'] += len(stale)
+        for upload_id in stale:
+            try:
+                os.remove(self._part_file(upload_id))
+            except OSError:
+                pass
+        return len(stale)
+
+    # ---------------- Retention ----------------
+
+    def gc(self, retention_days=None, grace_seconds=3600) -> Dict:
+        """
+        Apply the retention policy.
+
+        Runs older than ``retention_days`` lose their screenshot reference, then
+        every artifact (and legacy ``screenshots/`` file) that no run references
+        and that is older than ``grace_seconds`` is deleted. The grace period
+        covers screenshots whose history row is still in the write-behind queue.
+        """
+        retention_days = self.retention_days if retention_days is None else retention_days
+        self.expire_uploads(grace_seconds)
+        expired = 0
+        if retention_days > 0:
+            # created_at is CURRENT_TIMESTAMP, i.e. UTC
+            cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+            expired = ExecutionHistory.expire_screenshots(cutoff, db_path=self.db_path)
+
+        referenced = set()
+        for path in ExecutionHistory.screenshot_paths(db_path=self.db_path):
+            referenced.add(path)
+            if self.is_artifact(path):
+                referenced.add(self.thumbnail_for(path))
+
+        removed = freed = 0
+        newest_allowed = time.time() - grace_seconds
+        for directory in (self.root, os.path.join(self.upload_folder, 'screenshots')):
+            for dirpath, _, filenames in os.walk(directory):
+                for name in filenames:
+                    target = os.path.join(dirpath, name)
+                    path = os.path.relpath(target, self.upload_folder).replace(os.sep, '/')
+                    if path in referenced:
+                        continue
+                    with self._lock:
+                        if self._full_path(path) in self._pending:
+                            continue
+                    try:
+                        info = os.stat(target)
+                        if info.st_mtime > newest_allowed:
+                            continue
+                        os.remove(target)
+                    except OSError:
+                        continue
+                    removed += 1
+                    freed += info.st_size
+
+        self._count(gc_runs=1, gc_expired_runs=expired, gc_removed_files=removed, gc_freed_bytes=freed)
+        if expired or removed:
+            print(f"🧹 Artifact GC: expired {expired} run screenshot(s), removed {removed} file(s), "
+                  f"freed {freed / (1024 * 1024):.1f} MB")
+        return {'expired_runs': expired, 'removed_files': removed, 'freed_bytes': freed}
+
+    # ---------------- Stats ----------------
+
+    def disk_usage(self):
+        files = size = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                try:
+                    size += os.path.getsize(os.path.join(dirpath, name))
+                    files += 1
+                except OSError:
+                    pass
+        return files, size
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['pending'] = len(self._pending)
+        stats['encode_ms'] = round(stats['encode_ms'], 1)
+        stats['avg_encode_ms'] = round(stats['encode_ms'] / stats['stored'], 1) if stats['stored'] else 0.0
+        stats['files'], stats['disk_bytes'] = self.disk_usage()
+        stats['format'] = self.image_format
+        stats['quality'] = self.quality
+        stats['thumbnail_width'] = self.thumbnail_width
+        stats['retention_days'] = self.retention_days
+        return stats
+
+    def shutdown(self):
+        """Finish queued writes."""
+        self._pool.shutdown(wait=True)
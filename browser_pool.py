@@ -0,0 +1,459 @@
+import asyncio
+import inspect
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+from playwright.async_api import async_playwright
+
+
+SUPPORTED_BROWSERS = ('chromium', 'firefox', 'webkit')
+
+
+class PooledBrowser:
+    """A launched browser tracked by the pool."""
+
+    def __init__(self, browser_name: str, headless: bool, browser):
+        self.browser_name = browser_name
+        self.headless = headless
+        self.browser = browser
+        self.uses = 0
+        self.active_contexts = 0
+        self.retiring = False
+        self.launched_at = time.time()
+
+    def is_healthy(self) -> bool:
+        try:
+            return self.browser.is_connected()
+        except Exception:
+            return False
+
+
+class BrowserLease:
+    """A fresh, isolated BrowserContext checked out of the pool."""
+
+    def __init__(self, pooled: PooledBrowser, context):
+        self.pooled = pooled
+        self.context = context
+        self.extra_contexts = []
+        self.released = False
+
+    @property
+    def browser(self):
+        return self.pooled.browser
+
+
+class BrowserPool:
+    """
+    Long-lived pool of launched browsers that hands out isolated contexts.
+
+    Browsers are keyed by (browser_name, headless). Each browser serves up to
+    ``max_contexts_per_browser`` concurrent contexts and is recycled after
+    ``max_uses`` contexts. At most ``max_browsers_per_type`` browsers are kept
+    per key; callers wait for a free slot once the cap is reached.
+
+    All coroutine methods must run on the loop the pool was started on. Use
+    ``start_background()`` to give the pool its own loop thread and ``run()``
+    to execute coroutines on it from synchronous code.
+    """
+
+    def __init__(self, max_browsers_per_type=2, max_contexts_per_browser=4,
+                 max_uses=50, launch_timeout=30.0):
+        self.max_browsers_per_type = max_browsers_per_type
+        self.max_contexts_per_browser = max_contexts_per_browser
+        self.max_uses = max_uses
+        self.launch_timeout = launch_timeout
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread = None
+        self._playwright = None
+        self._browsers: Dict[Tuple[str, bool], List[PooledBrowser]] = {}
+        self._launching: Dict[Tuple[str, bool], int] = {}
+        self._condition: Optional[asyncio.Condition] = None
+        self._closed = False
+
+        self.stats = {
+            'launches': 0,
+            'contexts_served': 0,
+            'recycled': 0,
+            'unhealthy_discarded': 0,
+            'wait_count': 0,
+        }
+
+    # ---------------- Lifecycle ----------------
+
+    async def start(self):
+        """Start Playwright on the current loop."""
+        if self._playwright is None:
+            self.loop = asyncio.get_running_loop()
+            self._condition = asyncio.Condition()
+            self._playwright = await async_playwright().start()
+        return self
+
+    def start_background(self):
+        """Run the pool on a dedicated event loop thread."""
+        if self._thread is not None:
+            return self
+
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def _run_loop():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            ready.set()
+            loop.run_forever()
+            loop.close()
+
+        self._thread = threading.Thread(target=_run_loop, name='browser-pool', daemon=True)
+        self._thread.start()
+        ready.wait(timeout=self.launch_timeout)
+        return self
+
+    def submit(self, coro):
+        """Schedule a coroutine on the pool loop and return a concurrent future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the pool loop and block until it finishes."""
+        return self.submit(coro).result(timeout=timeout)
+
+    async def close(self):
+        """Close every pooled browser and stop Playwright."""
+        self._closed = True
+        for browsers in self._browsers.values():
+            for pooled in browsers:
+                await self._close_browser(pooled)
+        self._browsers = {}
+        if self._playwright:
+            try:
+                await self._playwright.stop()
+            except Exception as e:
+                print(f"Browser pool shutdown error: {e}")
+            self._playwright = None
+
+    def shutdown(self, timeout=10):
+        """Synchronous shutdown for the background loop thread."""
+        if not self.loop or self._closed:
+            return
+        try:
+            if self._thread is not None:
+                self.run(self.close(), timeout=timeout)
+                self.loop.call_soon_threadsafe(self.loop.stop)
+        except Exception as e:
+            print(f"Browser pool shutdown error: {e}")
+
+    # ---------------- Leasing ----------------
+
+    async def acquire(self, browser_name='chromium', headless=True) -> BrowserLease:
+        """Check out a fresh context, launching a browser only if needed."""
+        if browser_name not in SUPPORTED_BROWSERS:
+            raise ValueError(f"Unsupported browser: {browser_name}")
+        if self._closed:
+            raise RuntimeError("Browser pool is closed")
+
+        key = (browser_name, headless)
+        pooled = None
+        async with self._condition:
+            while True:
+                pooled = self._find_available(key)
+                if pooled:
+                    self._check_out(pooled)
+                    break
+                if self._can_launch(key):
+                    self._launching[key] = self._launching.get(key, 0) + 1
+                    break
+                self.stats['wait_count'] += 1
+                await self._condition.wait()
+
+        if pooled is None:
+            # Launch outside the lock so other keys and releases are not blocked.
+            try:
+                pooled = await self._launch(browser_name, headless)
+            finally:
+                async with self._condition:
+                    self._launching[key] -= 1
+                    if pooled:
+                        self._browsers.setdefault(key, []).append(pooled)
+                        self._check_out(pooled)
+                    self._condition.notify_all()
+
+        try:
+            context = await pooled.browser.new_context()
+        except Exception:
+            await self._return(pooled)
+            raise
+
+        self.stats['contexts_served'] += 1
+        return BrowserLease(pooled, context)
+
+    async def release(self, lease: BrowserLease):
+        """Close the lease's contexts and return its browser slot to the pool."""
+        if lease.released:
+            return
+        lease.released = True
+        for context in [lease.context] + lease.extra_contexts:
+            try:
+                await context.close()
+            except Exception:
+                pass
+        await self._return(lease.pooled)
+
+    @asynccontextmanager
+    async def context(self, browser_name='chromium', headless=True):
+        """Async context manager yielding an isolated BrowserContext."""
+        lease = await self.acquire(browser_name, headless)
+        try:
+            yield lease.context
+        finally:
+            await self.release(lease)
+
+    def _check_out(self, pooled: PooledBrowser):
+        pooled.uses += 1
+        pooled.active_contexts += 1
+        if pooled.uses >= self.max_uses:
+            pooled.retiring = True
+
+    def _find_available(self, key) -> Optional[PooledBrowser]:
+        browsers = self._browsers.get(key, [])
+        for pooled in list(browsers):
+            if pooled.retiring or pooled.active_contexts >= self.max_contexts_per_browser:
+                continue
+            if not pooled.is_healthy():
+                self.stats['unhealthy_discarded'] += 1
+                browsers.remove(pooled)
+                continue
+            return pooled
+        return None
+
+    def _can_launch(self, key) -> bool:
+        live = [b for b in self._browsers.get(key, []) if not b.retiring]
+        return len(live) + self._launching.get(key, 0) < self.max_browsers_per_type
+
+    async def _launch(self, browser_name, headless) -> PooledBrowser:
+        browser_type = getattr(self._playwright, browser_name)
+        browser = await asyncio.wait_for(browser_type.launch(headless=headless),
+                                         timeout=self.launch_timeout)
+        self.stats['launches'] += 1
+        print(f"🚀 Browser pool launched {browser_name} (headless={headless})")
+        return PooledBrowser(browser_name, headless, browser)
+
+    async def _return(self, pooled: PooledBrowser):
+        async with self._condition:
+            pooled.active_contexts -= 1
+            if pooled.retiring and pooled.active_contexts <= 0:
+                browsers = self._browsers.get((pooled.browser_name, pooled.headless), [])
+                if pooled in browsers:
+                    browsers.remove(pooled)
+                self.stats['recycled'] += 1
+                await self._close_browser(pooled)
+            self._condition.notify_all()
+
+    async def _close_browser(self, pooled: PooledBrowser):
+        try:
+            await pooled.browser.close()
+        except Exception:
+            pass
+
+    # ---------------- Stats ----------------
+
+    def get_stats(self) -> Dict:
+        """Pool counters, including how many browser launches were avoided."""
+        stats = dict(self.stats)
+        stats['launches_saved'] = max(0, stats['contexts_served'] - stats['launches'])
+        stats['browsers'] = {
+            f"{name}:{'headless' if headless else 'headful'}": [
+                {'uses': b.uses, 'active_contexts': b.active_contexts, 'retiring': b.retiring}
+                for b in browsers
+            ]
+            for (name, headless), browsers in self._browsers.items()
+        }
+        return stats
+
+
+class _LeasedBrowser:
+    """Browser stand-in returned by the pooled ``launch()``; close() releases the lease."""
+
+    def __init__(self, pool: BrowserPool, lease: BrowserLease):
+        self._pool = pool
+        self._lease = lease
+        self._default_context_used = False
+
+    async def new_page(self, **kwargs):
+        if not self._default_context_used and not kwargs:
+            self._default_context_used = True
+            return await self._lease.context.new_page()
+        context = await self.new_context(**kwargs)
+        return await context.new_page()
+
+    async def new_context(self, **kwargs):
+        if not self._default_context_used and not kwargs:
+            self._default_context_used = True
+            return self._lease.context
+        context = await self._lease.browser.new_context(**kwargs)
+        self._lease.extra_contexts.append(context)
+        return context
+
+    @property
+    def contexts(self):
+        return [self._lease.context] + self._lease.extra_contexts
+
+    async def close(self):
+        await self._pool.release(self._lease)
+
+    def __getattr__(self, name):
+        return getattr(self._lease.browser, name)
+
+
+class _PooledBrowserType:
+    def __init__(self, playwright: 'PooledPlaywright', browser_name: str):
+        self._playwright = playwright
+        self.name = browser_name
+
+    async def launch(self, headless=True, **kwargs):
+        # Extra launch options are ignored: pooled browsers share one launch config.
+        return await self._playwright.launch(self.name, headless)
+
+
+class PooledPlaywright:
+    """
+    Drop-in stand-in for ``async_playwright()`` backed by a BrowserPool.
+
+    Scripts written against the classic ``async with async_playwright() as p:
+    browser = await p.chromium.launch()`` pattern get a pooled browser instead of
+    a cold launch. Any lease still open when the script finishes is released.
+    """
+
+    def __init__(self, pool: BrowserPool):
+        self._pool = pool
+        self._browsers: List[_LeasedBrowser] = []
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    async def start(self):
+        return self
+
+    async def stop(self):
+        for browser in self._browsers:
+            await browser.close()
+        self._browsers = []
+
+    async def launch(self, browser_name, headless=True):
+        lease = await self._pool.acquire(browser_name, headless)
+        browser = _LeasedBrowser(self._pool, lease)
+        self._browsers.append(browser)
+        return browser
+
+    @property
+    def chromium(self):
+        return _PooledBrowserType(self, 'chromium')
+
+    @property
+    def firefox(self):
+        return _PooledBrowserType(self, 'firefox')
+
+    @property
+    def webkit(self):
+        return _PooledBrowserType(self, 'webkit')
+
+    def import_hook(self, name, globals=None, locals=None, fromlist=(), level=0):
+        """``__import__`` replacement that serves the pooled ``async_playwright``."""
+        if name == 'playwright.async_api' and fromlist:
+            return _PooledAsyncApi(self)
+        return __import__(name, globals, locals, fromlist, level)
+
+
+class _PooledAsyncApi:
+    """Module proxy for ``playwright.async_api`` with a pooled ``async_playwright``."""
+
+    def __init__(self, playwright: PooledPlaywright):
+        self.async_playwright = playwright
+
+    def __getattr__(self, name):
+        import playwright.async_api
+        return getattr(playwright.async_api, name)
+
+
+def accepts_injected_page(run_test) -> bool:
+    """True if run_test declares a ``page`` or ``context`` parameter."""
+    try:
+        params = inspect.signature(run_test).parameters
+    except (TypeError, ValueError):
+        return False
+    return 'page' in params or 'context' in params
+
+
+async def run_pooled(pool: BrowserPool, run_test, pooled_playwright: PooledPlaywright,
+                     browser_name='chromium', headless=True):
+    """
+    Run a generated ``run_test`` against the pool.
+
+    Scripts that accept ``page``/``context`` get a fresh pooled context injected;
+    legacy scripts run unchanged through the PooledPlaywright import hook.
+    """
+    if accepts_injected_page(run_test):
+        params = inspect.signature(run_test).parameters
+        async with pool.context(browser_name, headless) as context:
+            kwargs = {}
+            if 'browser_name' in params:
+                kwargs['browser_name'] = browser_name
+            if 'headless' in params:
+                kwargs['headless'] = headless
+            if 'context' in params:
+                kwargs['context'] = context
+            if 'page' in params:
+                kwargs['page'] = await context.new_page()
+            try:
+                return await run_test(**kwargs)
+            finally:
+                await pooled_playwright.stop()
+
+    try:
+        return await run_test(browser_name=browser_name, headless=headless)
+    finally:
+        await pooled_playwright.stop()
+
+
+_shared_pool = None
+_shared_pool_pid = None
+_shared_pool_lock = threading.Lock()
+
+
+def browser_pool_enabled() -> bool:
+    return os.environ.get('BROWSER_POOL_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+
+
+def get_browser_pool() -> BrowserPool:
+    """Return this worker process's shared pool, starting it on first use."""
+    global _shared_pool, _shared_pool_pid
+    with _shared_pool_lock:
+        if _shared_pool is None or _shared_pool_pid != os.getpid():
+            _shared_pool = BrowserPool(
+                max_browsers_per_type=int(os.environ.get('BROWSER_POOL_MAX_BROWSERS', 2)),
+                max_contexts_per_browser=int(os.environ.get('BROWSER_POOL_MAX_CONTEXTS', 4)),
+                max_uses=int(os.environ.get('BROWSER_POOL_MAX_USES', 50)),
+            ).start_background()
+            _shared_pool_pid = os.getpid()
+        return _shared_pool
+
+
+def shared_browser_pool_stats() -> Optional[Dict]:
+    """Counters of this process's shared pool, or None if it has not started one."""
+    if _shared_pool is not None and _shared_pool_pid == os.getpid():
+        return _shared_pool.get_stats()
+    return None
+
+
+def shutdown_browser_pool():
+    """Close the shared pool if this process started one."""
+    if _shared_pool is not None and _shared_pool_pid == os.getpid():
+        _shared_pool.shutdown()
@@ -0,0 +1,110 @@
+import hashlib
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+from db_pool import get_db
+
+
+class CodeGenerationCache:
+    """
+    Persistent cache of generated Playwright code, stored in automation.db.
+
+    Entries are keyed on (normalized command, browser, prompt version), expire
+    after ``ttl_seconds`` and are evicted least-recently-used beyond
+    ``max_entries``. Cached code is dropped when a run of it has to be healed.
+    """
+
+    def __init__(self, db_path='automation.db', ttl_seconds=7 * 24 * 3600, max_entries=1000):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+
+    @staticmethod
+    def normalize_command(command: str) -> str:
+        """Lowercase, collapse whitespace and drop trailing punctuation."""
+        normalized = re.sub(r'\s+', ' ', command.strip().lower())
+        return normalized.rstrip('.!?; ')
+
+    @staticmethod
+    def hash_code(code: str) -> str:
+        return hashlib.sha256(code.encode('utf-8')).hexdigest()
+
+    def make_key(self, command: str, browser: str, prompt_version: str) -> str:
+        raw = '\x1f'.join([self.normalize_command(command), browser, prompt_version])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, command: str, browser: str, prompt_version: str) -> Optional[str]:
+        """Return cached code, or None on a miss or expired entry."""
+        key = self.make_key(command, browser, prompt_version)
+        now = time.time()
+
+        db = get_db(self.db_path)
+        row = db.query_one('SELECT code, created_at FROM codegen_cache WHERE cache_key=?', (key,))
+
+        if row and now - row[1] > self.ttl_seconds:
+            db.execute('DELETE FROM codegen_cache WHERE cache_key=?', (key,))
+            self._count('expired')
+            row = None
+
+        if row:
+            db.execute('UPDATE codegen_cache SET hit_count=hit_count+1, last_used_at=? WHERE cache_key=?',
+                       (now, key))
+
+        self._count('hits' if row else 'misses')
+        return row[0] if row else None
+
+    def put(self, command: str, browser: str, prompt_version: str, code: str):
+        """Store validated code and evict least-recently-used entries past the cap."""
+        key = self.make_key(command, browser, prompt_version)
+        now = time.time()
+
+        with get_db(self.db_path).transaction() as conn:
+            conn.execute('''INSERT OR REPLACE INTO codegen_cache
+                            (cache_key, command, browser, prompt_version, code, code_hash,
+                             hit_count, created_at, last_used_at)
+                            VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?)''',
+                         (key, self.normalize_command(command), browser, prompt_version,
+                          code, self.hash_code(code), now, now))
+            evicted = conn.execute('''DELETE FROM codegen_cache WHERE cache_key IN
+                                    (SELECT cache_key FROM codegen_cache ORDER BY last_used_at DESC
+                                     LIMIT -1 OFFSET ?)''', (self.max_entries,)).rowcount
+
+        if evicted > 0:
+            self._count('evictions', evicted)
+
+    def invalidate_code(self, code: str) -> int:
+        """Drop every entry that produced this exact script. Returns rows removed."""
+        if not code:
+            return 0
+        removed = get_db(self.db_path).execute('DELETE FROM codegen_cache WHERE code_hash=?',
+                                               (self.hash_code(code),)).rowcount
+
+        if removed > 0:
+            self._count('invalidations', removed)
+        return removed
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def get_stats(self) -> Dict:
+        entries = get_db(self.db_path).query_one('SELECT COUNT(*) FROM codegen_cache')[0]
+
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['entries'] = entries
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['ttl_seconds'] = self.ttl_seconds
+        stats['max_entries'] = self.max_entries
+        return stats
@@ -112,6 +112,23 @@ class CodeValidator:
                     if node.func.id in ['eval', 'exec', 'compile', '__import__', 'open']:
                         self.errors.append(f"Dangerous function call: {node.func.id}")
                         return False
+            
+            elif isinstance(node, ast.AsyncFunctionDef) and node.name == 'run_test':
+                if not self._check_injected_params(node):
+                    return False
+        
+        return True
+    
+    def _check_injected_params(self, node):
+        # Pooled runs inject page/context; agents and unpooled runs call run_test(browser_name, headless)
+        args = node.args
+        positional = args.posonlyargs + args.args
+        defaulted = {arg.arg for arg in positional[len(positional) - len(args.defaults):]}
+        defaulted |= {arg.arg for arg, default in zip(args.kwonlyargs, args.kw_defaults) if default is not None}
+        for arg in positional + args.kwonlyargs:
+            if arg.arg in ('page', 'context') and arg.arg not in defaulted:
+                self.errors.append(f"run_test parameter '{arg.arg}' must default to None")
+                return False
         
         return True
     
@@ -0,0 +1,94 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class CompletedTest:
+    """Outcome of a finished test run, passed to completion listeners."""
+
+    def __init__(self, test_id, status, logs=None, execution_time_ms=0):
+        self.test_id = test_id
+        self.status = status
+        self.logs = logs or []
+        self.execution_time_ms = execution_time_ms
+
+    @property
+    def success(self):
+        return self.status == 'success'
+
+
+class CompletionRegistry:
+    """
+    Listeners that run as soon as a test finishes.
+
+    Code that starts a test registers listeners under its test_id; whichever
+    path finishes the test (server run, healing run or agent result) calls
+    ``complete`` and the listeners fire immediately, with the run time measured
+    from ``mark_started`` (or from registration if the run never reported a
+    start). Entries for tests that never complete are dropped after ``max_age``.
+    """
+
+    def __init__(self, max_age=3600):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries: Dict[int, Dict] = {}
+        self.stats = {
+            'registered': 0,
+            'completed': 0,
+            'listener_errors': 0,
+            'expired': 0,
+        }
+
+    def add_listener(self, test_id, listener: Callable[[CompletedTest], None]):
+        now = time.monotonic()
+        with self._lock:
+            self._prune_locked(now)
+            entry = self._entries.setdefault(test_id, {'listeners': [], 'registered_at': now,
+                                                       'started_at': None})
+            entry['listeners'].append(listener)
+            self.stats['registered'] += 1
+
+    def mark_started(self, test_id):
+        """Record when the run actually began (after any queueing)."""
+        with self._lock:
+            entry = self._entries.get(test_id)
+            if entry and entry['started_at'] is None:
+                entry['started_at'] = time.monotonic()
+
+    def discard(self, test_id):
+        """Forget a test that will never run (e.g. rejected by the scheduler)."""
+        with self._lock:
+            self._entries.pop(test_id, None)
+
+    def complete(self, test_id, status, logs: Optional[List] = None):
+        """Fire and remove the listeners registered for ``test_id``."""
+        with self._lock:
+            entry = self._entries.pop(test_id, None)
+            if entry:
+                self.stats['completed'] += 1
+        if not entry:
+            return
+
+        started = entry['started_at'] or entry['registered_at']
+        completion = CompletedTest(test_id, status, logs,
+                                   execution_time_ms=int((time.monotonic() - started) * 1000))
+        for listener in entry['listeners']:
+            try:
+                listener(completion)
+            except Exception as e:
+                print(f"Completion listener for test {test_id} failed: {e}")
+                with self._lock:
+                    self.stats['listener_errors'] += 1
+
+    def _prune_locked(self, now):
+        stale = [test_id for test_id, entry in self._entries.items()
+                 if now - entry['registered_at'] > self.max_age]
+        for test_id in stale:
+            del self._entries[test_id]
+        self.stats['expired'] += len(stale)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['pending'] = len(self._entries)
+        return stats
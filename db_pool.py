@@ -0,0 +1,238 @@
+"""
+Shared SQLite access layer.
+
+Every model and route goes through ``get_db(db_path)``, which returns one
+``ConnectionPool`` per database file and process. Connections run in WAL mode
+with tuned pragmas and a per-connection statement cache, are handed out one per
+thread/greenlet, and statements that hit SQLITE_BUSY are retried with backoff.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+def _is_busy(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+class ConnectionPool:
+    """
+    Bounded pool of SQLite connections for one database file.
+
+    A thread (or greenlet, under gevent) that already holds a connection gets
+    the same one back on nested use, so helpers can call each other without
+    exhausting the pool. Connections are in autocommit mode; use
+    ``transaction()`` to group writes.
+    """
+
+    def __init__(self, db_path='automation.db', max_connections=8, busy_timeout=5.0,
+                 max_retries=5, retry_delay=0.05, cached_statements=256,
+                 synchronous='NORMAL', cache_size_kb=20000, mmap_size=256 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self.busy_timeout = busy_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.cached_statements = cached_statements
+        self.synchronous = synchronous
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+
+        self._idle = []
+        self._open = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self.stats = {
+            'connections_opened': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'busy_retries': 0,
+            'busy_failures': 0,
+        }
+
+    @classmethod
+    def from_env(cls, db_path):
+        """Build a pool from SQLITE_* environment variables."""
+        return cls(
+            db_path,
+            max_connections=int(os.environ.get('SQLITE_POOL_SIZE', 8)),
+            busy_timeout=float(os.environ.get('SQLITE_BUSY_TIMEOUT', 5.0)),
+            synchronous=os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+            cache_size_kb=int(os.environ.get('SQLITE_CACHE_SIZE_KB', 20000)),
+            mmap_size=int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None,
+                               check_same_thread=False, cached_statements=self.cached_statements)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        # INSERT OR REPLACE only fires delete triggers (which keep the FTS index in sync) with this on
+        conn.execute('PRAGMA recursive_triggers=ON')
+        return conn
+
+    def _checkout(self):
+        started = time.perf_counter()
+        waited = False
+        conn = None
+        with self._cond:
+            while not self._idle and self._open >= self.max_connections:
+                waited = True
+                self._cond.wait()
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                self._open += 1
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+            opened = 1
+        else:
+            opened = 0
+
+        wait_ms = (time.perf_counter() - started) * 1000
+        with self._cond:
+            self.stats['checkouts'] += 1
+            self.stats['connections_opened'] += opened
+            self.stats['waits'] += 1 if waited else 0
+            self.stats['total_wait_ms'] += wait_ms
+            self.stats['max_wait_ms'] = max(self.stats['max_wait_ms'], wait_ms)
+        return conn
+
+    def _checkin(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Borrow this thread's connection (re-entrant)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._checkout()
+        self._local.conn = conn
+        self._local.depth = 1
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            self._checkin(conn)
+
+    def _retry(self, fn):
+        """Run ``fn`` again with backoff while the database reports busy."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn()
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == self.max_retries:
+                    if _is_busy(e):
+                        self._count('busy_failures')
+                    raise
+                self._count('busy_retries')
+                time.sleep(self.retry_delay * (2 ** attempt))
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run a block in one write transaction.
+
+        ``BEGIN IMMEDIATE`` takes the write lock up front, so a busy database is
+        detected (and retried) before any statement of the block has run. Nested
+        use joins the outer transaction.
+        """
+        with self.connection() as conn:
+            if conn.in_transaction:
+                yield conn
+                return
+            self._retry(lambda: conn.execute('BEGIN IMMEDIATE'))
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def execute(self, sql, params=()):
+        """Run one statement; returns the cursor (for lastrowid/rowcount)."""
+        with self.connection() as conn:
+            return self._retry(lambda: conn.execute(sql, params))
+
+    def executemany(self, sql, seq_of_params):
+        """Run one statement for many parameter sets in a single transaction."""
+        seq_of_params = list(seq_of_params)
+        with self.transaction() as conn:
+            return conn.executemany(sql, seq_of_params)
+
+    def query(self, sql, params=()):
+        """Run a SELECT and return all rows."""
+        with self.connection() as conn:
+            return self._retry(lambda: conn.execute(sql, params).fetchall())
+
+    def query_one(self, sql, params=()):
+        """Run a SELECT and return the first row, or None."""
+        with self.connection() as conn:
+            return self._retry(lambda: conn.execute(sql, params).fetchone())
+
+    def _count(self, name, amount=1):
+        with self._cond:
+            self.stats[name] += amount
+
+    def get_stats(self) -> Dict:
+        with self._cond:
+            stats = dict(self.stats)
+            stats['open'] = self._open
+            stats['idle'] = len(self._idle)
+        checkouts = stats['checkouts']
+        stats['avg_wait_ms'] = round(stats['total_wait_ms'] / checkouts, 3) if checkouts else 0.0
+        stats['total_wait_ms'] = round(stats['total_wait_ms'], 3)
+        stats['max_wait_ms'] = round(stats['max_wait_ms'], 3)
+        stats['max_connections'] = self.max_connections
+        stats['db_path'] = self.db_path
+        return stats
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_db(db_path='automation.db') -> ConnectionPool:
+    """Return the process-wide pool for ``db_path``."""
+    key = (os.getpid(), os.path.abspath(db_path))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool.from_env(db_path)
+            _pools[key] = pool
+        return pool
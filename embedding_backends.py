@@ -0,0 +1,113 @@
+"""
+Embedding backends for semantic search.
+
+A backend turns a batch of texts into a float32 matrix and reports a
+``model_id`` and ``dimension``; the model id is recorded with the vector index
+and used as the embedding cache key, so vectors from different backends are
+never mixed. ``create_embedding_backend`` picks one from EMBEDDING_BACKEND.
+
+Each backend also carries cosine-similarity thresholds for its score
+distribution: ``recall_threshold`` gates auto-execution in Recall Mode and
+``reuse_threshold`` gates running a learned task instead of generating code.
+The local values come from the labeled pairs in embedding_calibration.py; the
+OpenAI values are uncalibrated defaults. SEMANTIC_RECALL_THRESHOLD and
+SEMANTIC_REUSE_THRESHOLD override either.
+"""
+import os
+from typing import List, Optional
+
+import numpy as np
+
+
+class EmbeddingBackend:
+    """Interface: ``embed(texts)`` returns an array of shape (len(texts), dimension)."""
+
+    model_id = None
+    dimension = None
+    # False when embedding is cheaper than a cache lookup
+    cacheable = True
+    recall_threshold = 0.8
+    reuse_threshold = 0.9
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """OpenAI embeddings API (one request per batch)."""
+
+    # Uncalibrated: not yet run through embedding_calibration.py, so tune with
+    # SEMANTIC_RECALL_THRESHOLD / SEMANTIC_REUSE_THRESHOLD
+    recall_threshold = 0.8
+    reuse_threshold = 0.9
+
+    def __init__(self, api_key: Optional[str] = None, model='text-embedding-3-small', dimension=1536):
+        from openai import OpenAI
+
+        api_key = api_key or os.environ.get('OPENAI_API_KEY')
+        if not api_key:
+            raise ValueError("OpenAI API key is required for embedding generation")
+        self.client = OpenAI(api_key=api_key)
+        self.model_id = model
+        self.dimension = dimension
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        response = self.client.embeddings.create(model=self.model_id, input=texts)
+        # The API may return items out of order; place each by its index
+        ordered = sorted(response.data, key=lambda item: item.index)
+        return np.array([item.embedding for item in ordered], dtype=np.float32)
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """
+    On-box embeddings from scikit-learn hashing vectorizers; no network, no fitting.
+
+    Word unigrams/bigrams, character 3-5 grams and numbers are hashed into
+    ``dimension`` buckets and L2-normalized, so related phrasings, URLs and selectors share
+    features. Encoding is stateless, so vectors stay stable across restarts.
+    """
+
+    VERSION = 2
+    cacheable = False
+
+    # From embedding_calibration.py: non-matching pairs score up to 0.68 against a
+    # task's text, matches 0.55-0.83; synonyms ("log out"/"sign out") score low
+    recall_threshold = 0.69
+    reuse_threshold = 0.74
+
+    def __init__(self, dimension=512):
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self.dimension = dimension
+        self.model_id = f'local-hashing-v{self.VERSION}-{dimension}'
+        # Keep 1-character tokens: numbers ("site 3" vs "site 21") and single letters distinguish tasks
+        self._word = HashingVectorizer(n_features=dimension, analyzer='word', ngram_range=(1, 2),
+                                       token_pattern=r'(?u)\b\w+\b',
+                                       alternate_sign=False, norm=None, lowercase=True)
+        self._char = HashingVectorizer(n_features=dimension, analyzer='char_wb', ngram_range=(3, 5),
+                                       alternate_sign=False, norm=None, lowercase=True)
+        # Numbers get their own weighted features; as char n-grams they barely move the score
+        self._numbers = HashingVectorizer(n_features=dimension, analyzer='word', token_pattern=r'\d+',
+                                          alternate_sign=False, norm=None)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        # Sublinear term weighting so long code strings do not swamp names
+        counts = (self._word.transform(texts) + 0.5 * self._char.transform(texts)
+                  + 2.0 * self._numbers.transform(texts))
+        counts.data = np.log1p(counts.data)
+        vectors = counts.toarray().astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+def create_embedding_backend(api_key: Optional[str] = None) -> EmbeddingBackend:
+    """
+    Pick a backend from EMBEDDING_BACKEND: ``openai``, ``local`` or ``auto``
+    (the default: OpenAI when an API key is set, local otherwise).
+    """
+    backend = os.environ.get('EMBEDDING_BACKEND', 'auto').lower()
+    api_key = api_key or os.environ.get('OPENAI_API_KEY')
+    if backend == 'openai' or (backend == 'auto' and api_key):
+        return OpenAIEmbeddingBackend(api_key)
+    return LocalEmbeddingBackend(dimension=int(os.environ.get('EMBEDDING_DIMENSION', 512)))
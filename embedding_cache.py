@@ -0,0 +1,139 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from db_pool import get_db
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of embedding vectors.
+
+    Entries are keyed on (model, sha256(text)). A bounded in-memory LRU sits in
+    front of the ``embedding_cache`` table in automation.db, where vectors are
+    stored as float32 BLOBs so they survive restarts. Rows unused for
+    ``ttl_seconds`` expire and the table is trimmed least-recently-used to
+    ``max_entries`` whenever new vectors are stored.
+    """
+
+    def __init__(self, db_path='automation.db', max_memory_entries=2048, max_entries=50000,
+                 ttl_seconds=30 * 24 * 3600):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'expired': 0,
+            'evictions': 0,
+        }
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _remember(self, key, vector):
+        """Insert into the LRU, evicting the oldest entries. Caller holds the lock."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        """Return the cached vector for ``text``, or None on a miss."""
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Look up many texts at once; missing entries come back as None."""
+        keys = [(model, self.hash_text(text)) for text in texts]
+        results = [None] * len(texts)
+        disk_lookup = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                    self.stats['memory_hits'] += 1
+                else:
+                    disk_lookup.setdefault(key[1], []).append(i)
+
+        if disk_lookup:
+            db = get_db(self.db_path)
+            hashes = list(disk_lookup)
+            rows = []
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows.extend(db.query(f'''SELECT text_hash, vector FROM embedding_cache
+                                        WHERE model=? AND text_hash IN ({placeholders})''',
+                                     [model] + chunk))
+            if rows:
+                db.executemany('UPDATE embedding_cache SET last_used_at=? WHERE model=? AND text_hash=?',
+                               [(time.time(), model, text_hash) for text_hash, _ in rows])
+
+            with self._lock:
+                for text_hash, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32).copy()
+                    self._remember((model, text_hash), vector)
+                    for i in disk_lookup.pop(text_hash):
+                        results[i] = vector
+                        self.stats['disk_hits'] += 1
+                self.stats['misses'] += sum(len(indices) for indices in disk_lookup.values())
+
+        return results
+
+    def put(self, model: str, text: str, vector: np.ndarray):
+        self.put_many(model, [text], [vector])
+
+    def put_many(self, model: str, texts: List[str], vectors):
+        """Store vectors in memory and on disk, then expire and evict old disk entries."""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                vector = np.asarray(vector, dtype=np.float32)
+                text_hash = self.hash_text(text)
+                self._remember((model, text_hash), vector)
+                rows.append((model, text_hash, vector.shape[0], vector.tobytes(), now, now))
+            self.stats['stores'] += len(rows)
+
+        with get_db(self.db_path).transaction() as conn:
+            conn.executemany('''INSERT OR REPLACE INTO embedding_cache
+                                (model, text_hash, dimension, vector, created_at, last_used_at)
+                                VALUES (?, ?, ?, ?, ?, ?)''', rows)
+            expired = conn.execute('DELETE FROM embedding_cache WHERE last_used_at < ?',
+                                   (now - self.ttl_seconds,)).rowcount
+            evicted = conn.execute('''DELETE FROM embedding_cache WHERE rowid IN
+                                    (SELECT rowid FROM embedding_cache ORDER BY last_used_at DESC
+                                     LIMIT -1 OFFSET ?)''', (self.max_entries,)).rowcount
+
+        with self._lock:
+            self.stats['expired'] += max(expired, 0)
+            self.stats['evictions'] += max(evicted, 0)
+
+    def get_stats(self) -> Dict:
+        disk_entries = get_db(self.db_path).query_one('SELECT COUNT(*) FROM embedding_cache')[0]
+
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._memory)
+        hits = stats['memory_hits'] + stats['disk_hits']
+        lookups = hits + stats['misses']
+        stats['disk_entries'] = disk_entries
+        stats['hit_rate'] = round(hits / lookups, 4) if lookups else 0.0
+        stats['max_memory_entries'] = self.max_memory_entries
+        stats['max_entries'] = self.max_entries
+        stats['ttl_seconds'] = self.ttl_seconds
+        return stats
@@ -0,0 +1,117 @@
+"""
+Similarity threshold calibration for the embedding backends.
+
+Scores a labeled set of (command, learned task) pairs the way Recall Mode does
+(the command against ``EmbeddingService.task_text``), then reports the score
+distributions and the thresholds that keep every non-matching pair out:
+``recall_threshold`` is the lowest such cutoff and ``reuse_threshold`` adds
+REUSE_MARGIN on top, since reuse skips code generation. The chosen values are
+what the backend classes in embedding_backends.py carry.
+
+    python embedding_calibration.py --backend local
+    python embedding_calibration.py --backend openai   # needs OPENAI_API_KEY
+"""
+import argparse
+import math
+
+import numpy as np
+
+from embedding_backends import LocalEmbeddingBackend, OpenAIEmbeddingBackend
+from vector_store import EmbeddingService, normalize_vectors
+
+REUSE_MARGIN = 0.05
+
+# (command, (task_name, description, tags), same task?)
+# Non-matching pairs are deliberately hard: same verbs and site, different object.
+LABELED_PAIRS = [
+    # Same task: exact names, rewordings, casing and punctuation
+    ('login to github', ('Login to GitHub', 'Open github.com and sign in with the test account', ['auth', 'github']), True),
+    ('log into github with the test account', ('Login to GitHub', 'Open github.com and sign in with the test account', ['auth', 'github']), True),
+    ('Login to GitHub', ('Login to GitHub', 'Open github.com and sign in with the test account', ['auth', 'github']), True),
+    ('add a laptop to the cart', ('Add laptop to cart', 'Search for a laptop and add the first result to the cart', ['shop', 'cart']), True),
+    ('search for a laptop and add it to the cart', ('Add laptop to cart', 'Search for a laptop and add the first result to the cart', ['shop', 'cart']), True),
+    ('open site 3 and check the title', ('Open site 3', 'Open site 3 and check the page title', ['smoke']), True),
+    ('open site 3', ('Open site 3', 'Open site 3 and check the page title', ['smoke']), True),
+    ('fill the contact form', ('Fill contact form', 'Fill the contact form with name, email and message and submit it', ['forms']), True),
+    ('submit the contact form with name and email', ('Fill contact form', 'Fill the contact form with name, email and message and submit it', ['forms']), True),
+    ('search google for playwright docs', ('Search Google for Playwright', 'Go to google.com and search for playwright docs', ['search']), True),
+    ('go to google and search playwright', ('Search Google for Playwright', 'Go to google.com and search for playwright docs', ['search']), True),
+    ('sign out of the dashboard', ('Sign out of dashboard', 'Open the dashboard user menu and sign out', ['auth']), True),
+    ('log out from the dashboard', ('Sign out of dashboard', 'Open the dashboard user menu and sign out', ['auth']), True),
+    ('download the monthly invoice', ('Download monthly invoice', 'Open billing and download the latest monthly invoice PDF', ['billing']), True),
+    ('go to billing and download the latest invoice', ('Download monthly invoice', 'Open billing and download the latest monthly invoice PDF', ['billing']), True),
+    ('select Canada in the country dropdown', ('Select country Canada', 'Pick Canada from the country dropdown on the signup form', ['forms', 'dropdown']), True),
+    ('pick canada from the country dropdown', ('Select country Canada', 'Pick Canada from the country dropdown on the signup form', ['forms', 'dropdown']), True),
+    ('go to page 12 of the results', ('Go to results page 12', 'Paginate the search results to page 12', ['pagination']), True),
+    ('upload a profile picture', ('Upload profile picture', 'Open settings and upload a new profile picture', ['settings']), True),
+    ('change the profile picture in settings', ('Upload profile picture', 'Open settings and upload a new profile picture', ['settings']), True),
+
+    # Different task: same site or verb, different object
+    ('add a phone to the cart', ('Add laptop to cart', 'Search for a laptop and add the first result to the cart', ['shop', 'cart']), False),
+    ('remove the laptop from the cart', ('Add laptop to cart', 'Search for a laptop and add the first result to the cart', ['shop', 'cart']), False),
+    ('login to gitlab', ('Login to GitHub', 'Open github.com and sign in with the test account', ['auth', 'github']), False),
+    ('log out of github', ('Login to GitHub', 'Open github.com and sign in with the test account', ['auth', 'github']), False),
+    ('log in', ('Sign out of dashboard', 'Open the dashboard user menu and sign out', ['auth']), False),
+    ('sign in to the dashboard', ('Sign out of dashboard', 'Open the dashboard user menu and sign out', ['auth']), False),
+    ('open site 21 and check the title', ('Open site 3', 'Open site 3 and check the page title', ['smoke']), False),
+    ('open site 4', ('Open site 3', 'Open site 3 and check the page title', ['smoke']), False),
+    ('search bing for playwright docs', ('Search Google for Playwright', 'Go to google.com and search for playwright docs', ['search']), False),
+    ('search google for selenium docs', ('Search Google for Playwright', 'Go to google.com and search for playwright docs', ['search']), False),
+    ('fill the signup form', ('Fill contact form', 'Fill the contact form with name, email and message and submit it', ['forms']), False),
+    ('download the yearly tax report', ('Download monthly invoice', 'Open billing and download the latest monthly invoice PDF', ['billing']), False),
+    ('select Mexico in the country dropdown', ('Select country Canada', 'Pick Canada from the country dropdown on the signup form', ['forms', 'dropdown']), False),
+    ('go to page 2 of the results', ('Go to results page 12', 'Paginate the search results to page 12', ['pagination']), False),
+    ('delete the profile picture', ('Upload profile picture', 'Open settings and upload a new profile picture', ['settings']), False),
+    ('upload a cover photo', ('Upload profile picture', 'Open settings and upload a new profile picture', ['settings']), False),
+]
+
+
+def score_pairs(backend, pairs=LABELED_PAIRS):
+    """Cosine similarity of each command against its task text; returns (scores, labels)."""
+    commands = [command for command, _, _ in pairs]
+    tasks = [EmbeddingService.task_text(*task) for _, task, _ in pairs]
+    queries = normalize_vectors(backend.embed(commands))
+    targets = normalize_vectors(backend.embed(tasks))
+    scores = np.sum(queries * targets, axis=1)
+    labels = np.array([label for _, _, label in pairs])
+    return scores, labels
+
+
+def calibrate(scores, labels):
+    """Lowest two-decimal cutoff above every non-matching score, and the stricter reuse cutoff."""
+    recall = math.floor(float(scores[~labels].max()) * 100 + 1) / 100
+    return recall, round(recall + REUSE_MARGIN, 2)
+
+
+def report(backend, pairs=LABELED_PAIRS):
+    scores, labels = score_pairs(backend, pairs)
+    recall, reuse = calibrate(scores, labels)
+    print(f"📏 {backend.model_id}: {int(labels.sum())} matching / {int((~labels).sum())} non-matching pairs")
+    print(f"   matching     min {scores[labels].min():.3f}  median {np.median(scores[labels]):.3f}")
+    print(f"   non-matching max {scores[~labels].max():.3f}  median {np.median(scores[~labels]):.3f}")
+    for name, current, proposed in (('recall', backend.recall_threshold, recall),
+                                    ('reuse', backend.reuse_threshold, reuse)):
+        print(f"   {name}_threshold {proposed:.2f} (current {current:.2f}): "
+              f"{np.mean(scores[labels] >= proposed):.0%} of matches kept, "
+              f"{int(np.sum(scores[~labels] >= current))} non-matches pass the current value")
+    worst = sorted(zip(scores, labels, pairs), key=lambda item: -item[0])
+    print("   hardest non-matching pairs:")
+    for score, label, (command, task, _) in [item for item in worst if not item[1]][:3]:
+        print(f"     {score:.3f}  {command!r} vs {task[0]!r}")
+    return recall, reuse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--backend', choices=['local', 'openai'], default='local')
+    parser.add_argument('--dimension', type=int, default=512, help='Local backend dimension')
+    args = parser.parse_args()
+
+    if args.backend == 'openai':
+        report(OpenAIEmbeddingBackend())
+    else:
+        report(LocalEmbeddingBackend(dimension=args.dimension))
+
+
+if __name__ == '__main__':
+    main()
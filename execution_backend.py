@@ -0,0 +1,378 @@
+"""
+Execution backends for server-side test runs.
+
+``InlineExecutionBackend`` runs executors in the web process (the original
+behaviour). ``ProcessExecutionBackend`` dispatches runs to a pool of worker
+processes, each owning a persistent asyncio loop and a warm BrowserPool, and
+streams Socket.IO events and results back to the web process. Run this module
+directly (``python -m execution_backend``) to start a worker.
+"""
+import asyncio
+import itertools
+import os
+import pickle
+import queue
+import struct
+import subprocess
+import sys
+import threading
+
+from browser_pool import shared_browser_pool_stats
+from executor import ServerExecutor
+from healing_executor import HealingExecutor
+
+
+# ---------------- Framing ----------------
+
+_HEADER = struct.Struct('>I')
+
+
+def write_frame(stream, message):
+    """Write one length-prefixed pickle frame."""
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(_HEADER.pack(len(payload)) + payload)
+    stream.flush()
+
+
+def read_frame(stream):
+    """Read one frame, or return None at EOF."""
+    header = stream.read(_HEADER.size)
+    if not header or len(header) < _HEADER.size:
+        return None
+    (length,) = _HEADER.unpack(header)
+    payload = stream.read(length)
+    if len(payload) < length:
+        return None
+    return pickle.loads(payload)
+
+
+# ---------------- Inline backend ----------------
+
+class InlineExecutionBackend:
+    """Runs executions inside the web process."""
+
+    name = 'inline'
+
+    def __init__(self, socketio, api_key=None):
+        self.socketio = socketio
+        self.api_key = api_key
+
+    def run_server(self, test_id, code, browser, headless):
+        return ServerExecutor().execute(code, browser, headless)
+
+    def create_healing_handle(self, test_id):
+        return HealingExecutor(self.socketio, api_key=self.api_key)
+
+    def run_healing(self, handle, test_id, code, browser, headless):
+        return asyncio.run(handle.execute_with_healing(code, browser, headless, test_id))
+
+    def get_stats(self):
+        return {'backend': self.name}
+
+    def get_browser_pool_stats(self):
+        stats = shared_browser_pool_stats()
+        if stats is None:
+            return {'backend': self.name, 'started': False}
+        stats.update(backend=self.name, started=True)
+        return stats
+
+    def shutdown(self):
+        pass
+
+
+# ---------------- Process backend (web process side) ----------------
+
+class RemoteHealingHandle:
+    """
+    Stand-in for a HealingExecutor running in a worker process.
+
+    Registered in ``active_healing_executors`` so Socket.IO handlers can forward
+    user element selections to the worker.
+    """
+
+    def __init__(self, backend, test_id):
+        self.backend = backend
+        self.test_id = test_id
+        self.worker = None
+        self.failed_locators = []
+        self.healed_script = None
+
+    def set_user_selector(self, selector):
+        if self.worker:
+            self.worker.send({'type': 'user_selector', 'test_id': self.test_id, 'selector': selector})
+
+
+class WorkerProcess:
+    """A worker process plus the pipe reader that relays its frames."""
+
+    def __init__(self, backend, index):
+        self.backend = backend
+        self.index = index
+        self.proc = None
+        self._write_lock = threading.Lock()
+        self._pending = {}
+        self.jobs_completed = 0
+
+    def start(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, '-m', 'execution_backend'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self.backend.socketio.start_background_task(self._read_loop, self.proc)
+        print(f"✅ Execution worker {self.index} started (pid {self.proc.pid})")
+
+    def is_alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def send(self, message):
+        with self._write_lock:
+            write_frame(self.proc.stdin, message)
+
+    def submit(self, job):
+        done = threading.Event()
+        slot = {'done': done, 'result': None}
+        self._pending[job['job_id']] = slot
+        try:
+            self.send(job)
+        except Exception:
+            self._pending.pop(job['job_id'], None)
+            raise
+        done.wait()
+        return slot['result']
+
+    def request_stats(self, job_id, timeout=5):
+        """The worker's browser pool counters, or None if it does not answer in time."""
+        done = threading.Event()
+        slot = {'done': done, 'result': None}
+        self._pending[job_id] = slot
+        try:
+            self.send({'type': 'stats', 'job_id': job_id})
+        except Exception:
+            self._pending.pop(job_id, None)
+            return None
+        if not done.wait(timeout):
+            self._pending.pop(job_id, None)
+        return slot['result']
+
+    def _read_loop(self, proc):
+        while True:
+            try:
+                message = read_frame(proc.stdout)
+            except Exception as e:
+                print(f"Execution worker {self.index} read error: {e}")
+                message = None
+            if message is None:
+                break
+            if message['type'] == 'emit':
+                self.backend.socketio.emit(message['event'], message['data'], **message.get('kwargs', {}))
+            elif message['type'] in ('result', 'stats'):
+                slot = self._pending.pop(message['job_id'], None)
+                if message['type'] == 'result':
+                    self.jobs_completed += 1
+                if slot:
+                    slot['result'] = message['result']
+                    slot['done'].set()
+        self._fail_pending('Execution worker exited unexpectedly')
+
+    def _fail_pending(self, reason):
+        pending, self._pending = self._pending, {}
+        for slot in pending.values():
+            slot['result'] = {'success': False, 'logs': [f'💥 {reason}'], 'screenshot': None}
+            slot['done'].set()
+
+    def stop(self):
+        if not self.is_alive():
+            return
+        try:
+            self.send({'type': 'shutdown'})
+            self.proc.wait(timeout=10)
+        except Exception:
+            self.proc.kill()
+
+
+class ProcessExecutionBackend:
+    """
+    Dispatches runs to worker processes so one server can use every core.
+
+    Workers are started lazily and restarted if they die. Each worker runs one
+    job at a time; callers block cooperatively until a worker is idle. The
+    ExecutionScheduler still decides how many runs are admitted.
+    """
+
+    name = 'process'
+
+    def __init__(self, socketio, workers=None):
+        self.socketio = socketio
+        self.num_workers = workers or min(4, os.cpu_count() or 1)
+        self._workers = []
+        self._idle = queue.Queue()
+        self._start_lock = threading.Lock()
+        self._job_ids = itertools.count(1)
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._workers:
+                return
+            for index in range(self.num_workers):
+                worker = WorkerProcess(self, index)
+                worker.start()
+                self._workers.append(worker)
+                self._idle.put(worker)
+
+    def _checkout(self):
+        self._ensure_started()
+        worker = self._idle.get()
+        if not worker.is_alive():
+            print(f"⚠️ Execution worker {worker.index} died, restarting")
+            worker.start()
+        return worker
+
+    def _dispatch(self, job, handle=None):
+        worker = self._checkout()
+        if handle:
+            handle.worker = worker
+        try:
+            job['job_id'] = next(self._job_ids)
+            return worker.submit(job)
+        except Exception as e:
+            return {'success': False, 'logs': [f'Execution dispatch error: {e}'], 'screenshot': None}
+        finally:
+            if handle:
+                handle.worker = None
+            self._idle.put(worker)
+
+    def run_server(self, test_id, code, browser, headless):
+        return self._dispatch({'type': 'job', 'kind': 'server', 'test_id': test_id,
+                               'code': code, 'browser': browser, 'headless': headless})
+
+    def create_healing_handle(self, test_id):
+        return RemoteHealingHandle(self, test_id)
+
+    def run_healing(self, handle, test_id, code, browser, headless):
+        result = self._dispatch({'type': 'job', 'kind': 'healing', 'test_id': test_id,
+                                 'code': code, 'browser': browser, 'headless': headless}, handle)
+        handle.failed_locators = result.get('failed_locators', [])
+        handle.healed_script = result.get('healed_script')
+        return result
+
+    def get_stats(self):
+        return {
+            'backend': self.name,
+            'workers': [
+                {'index': w.index, 'pid': w.proc.pid if w.proc else None,
+                 'alive': w.is_alive(), 'jobs_completed': w.jobs_completed}
+                for w in self._workers
+            ],
+            'idle': self._idle.qsize(),
+        }
+
+    def get_browser_pool_stats(self):
+        """Ask each live worker for its pool counters and add them up; does not start workers."""
+        workers = []
+        totals = {}
+        for worker in self._workers:
+            stats = worker.request_stats(next(self._job_ids)) if worker.is_alive() else None
+            workers.append({'index': worker.index, 'pool': stats})
+            for key, value in (stats or {}).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+        totals.update(backend=self.name, started=bool(self._workers), workers=workers)
+        return totals
+
+    def shutdown(self):
+        for worker in self._workers:
+            worker.stop()
+
+
+def create_execution_backend(socketio, api_key=None):
+    """Pick the backend from EXECUTION_BACKEND (process | inline)."""
+    backend = os.environ.get('EXECUTION_BACKEND', 'process').lower()
+    if backend == 'inline':
+        return InlineExecutionBackend(socketio, api_key=api_key)
+    workers = os.environ.get('EXECUTION_WORKERS')
+    return ProcessExecutionBackend(socketio, workers=int(workers) if workers else None)
+
+
+# ---------------- Worker process side ----------------
+
+class _EventForwarder:
+    """Minimal socketio stand-in that relays emits to the web process."""
+
+    def __init__(self, worker):
+        self._worker = worker
+
+    def emit(self, event, data=None, **kwargs):
+        self._worker.send({'type': 'emit', 'event': event, 'data': data, 'kwargs': kwargs})
+
+
+class ExecutionWorker:
+    """Worker loop: one persistent asyncio loop and BrowserPool per process."""
+
+    def __init__(self, stdin, stdout):
+        self.stdin = stdin
+        self.stdout = stdout
+        self._write_lock = threading.Lock()
+        self.pool = None
+        self.healing = {}
+
+    def send(self, message):
+        with self._write_lock:
+            write_frame(self.stdout, message)
+
+    async def run(self):
+        from browser_pool import BrowserPool
+
+        self.pool = await BrowserPool(
+            max_browsers_per_type=int(os.environ.get('BROWSER_POOL_MAX_BROWSERS', 1)),
+            max_contexts_per_browser=int(os.environ.get('BROWSER_POOL_MAX_CONTEXTS', 4)),
+            max_uses=int(os.environ.get('BROWSER_POOL_MAX_USES', 50)),
+        ).start()
+        loop = asyncio.get_running_loop()
+
+        try:
+            while True:
+                message = await loop.run_in_executor(None, read_frame, self.stdin)
+                if message is None or message['type'] == 'shutdown':
+                    break
+                if message['type'] == 'stats':
+                    self.send({'type': 'stats', 'job_id': message['job_id'], 'result': self.pool.get_stats()})
+                elif message['type'] == 'user_selector':
+                    executor = self.healing.get(message['test_id'])
+                    if executor:
+                        executor.set_user_selector(message['selector'])
+                elif message['type'] == 'job':
+                    loop.create_task(self._run_job(message))
+        finally:
+            await self.pool.close()
+
+    async def _run_job(self, job):
+        test_id = job['test_id']
+        try:
+            if job['kind'] == 'server':
+                executor = ServerExecutor(pool=self.pool)
+                result = await executor.execute_async(job['code'], job['browser'], job['headless'])
+            else:
+                executor = HealingExecutor(_EventForwarder(self))
+                executor.browser_pool = self.pool
+                self.healing[test_id] = executor
+                try:
+                    result = await executor.execute_with_healing(job['code'], job['browser'],
+                                                                 job['headless'], test_id)
+                finally:
+                    self.healing.pop(test_id, None)
+        except Exception as e:
+            result = {'success': False, 'logs': [f'Execution error: {e}'], 'screenshot': None}
+        self.send({'type': 'result', 'job_id': job['job_id'], 'result': result})
+
+
+def worker_main():
+    # The pipe carries frames; send everything printed by executors to stderr
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    sys.stdout = sys.stderr
+    asyncio.run(ExecutionWorker(stdin, stdout).run())
+
+
+if __name__ == '__main__':
+    worker_main()
@@ -2,9 +2,29 @@ import asyncio
 import sys
 from io import StringIO
 from code_validator import CodeValidator
+from browser_pool import PooledPlaywright, browser_pool_enabled, get_browser_pool, run_pooled
 
 class ServerExecutor:
+    def __init__(self, pool=None):
+        # Reuse the worker's warm browser pool unless pooling is disabled
+        if pool is None and browser_pool_enabled():
+            pool = get_browser_pool()
+        self.pool = pool
+
     def execute(self, code, browser_name='chromium', headless=True):
+        try:
+            if self.pool:
+                return self.pool.run(self.execute_async(code, browser_name, headless))
+            return asyncio.run(self.execute_async(code, browser_name, headless))
+        except Exception as e:
+            return {
+                'success': False,
+                'logs': [f'Execution error: {str(e)}'],
+                'screenshot': None
+            }
+
+    async def execute_async(self, code, browser_name='chromium', headless=True):
+        """Validate and run generated code on the current loop (the pool's loop when pooled)."""
         try:
             validator = CodeValidator()
             if not validator.validate(code):
@@ -43,6 +63,11 @@ class ServerExecutor:
                 }
             }
             
+            pooled_playwright = None
+            if self.pool:
+                pooled_playwright = PooledPlaywright(self.pool)
+                restricted_globals['__builtins__']['__import__'] = pooled_playwright.import_hook
+            
             local_vars = {}
             exec(code, restricted_globals, local_vars)
             
@@ -55,9 +80,9 @@ class ServerExecutor:
             
             run_test = local_vars['run_test']
             
-            result = asyncio.run(run_test(browser_name=browser_name, headless=headless))
-            
-            return result
+            if self.pool:
+                return await run_pooled(self.pool, run_test, pooled_playwright, browser_name, headless)
+            return await run_test(browser_name=browser_name, headless=headless)
         except Exception as e:
             return {
                 'success': False,
@@ -7,7 +7,8 @@ bind = "0.0.0.0:5000"
 # Worker class for async support with SocketIO
 worker_class = "gevent"
 
-# Number of workers
+# Number of workers (with more than one, set VECTOR_INDEX_SHARED=1 so workers
+# memory-map one vector index and pick up each other's writes)
 workers = 1
 
 # Set log level to WARNING to suppress SIGWINCH INFO messages
@@ -2,6 +2,7 @@ import asyncio
 import json
 import re
 from code_validator import CodeValidator
+from browser_pool import PooledPlaywright, browser_pool_enabled, get_browser_pool, run_pooled
 from openai import OpenAI
 import os
 
@@ -21,6 +22,11 @@ class HealingExecutor:
         self.agent_result = None
         self.agent_result_event = None
         self.agent_sid = None  # Agent session ID for targeted emits
+        self.agent_lost = False
+        self.agent_abandoned = False  # An attempt got no result; the agent may still be running it
+        self.redispatch_agent = None  # Callable returning a replacement agent sid (or None)
+        self.max_redispatches = 0
+        self.browser_pool = None  # Resolved lazily for server-side attempts
         
     def improve_locator_with_ai(self, failed_locator, error_message, page_html_snippet=''):
         """Use AI to suggest better locator strategies."""
@@ -98,52 +104,80 @@ Suggest a better locator:"""}
         self.agent_result = result
         if self.agent_result_event:
             self.agent_result_event.set()
+    
+    def mark_agent_lost(self):
+        """Called when this test's agent disconnects; the current attempt is sent to another agent."""
+        self.agent_lost = True
+        if self.agent_result_event:
+            self.agent_result_event.set()
 
     async def _execute_on_agent(self, code, browser_name, headless, test_id, attempt_num, logs):
         """Execute code on agent and wait for result."""
         import base64
 
-        # Setup event to wait for agent result
-        self.agent_result_event = asyncio.Event()
-        self.agent_result = None
-
         # For headful mode, use modified code that keeps browser open
         execution_code = code
         if not headless:
             # Add a small delay to ensure browser is ready for widget injection
-            execution_code = code.replace(
-                "async def run_test(browser_name='chromium', headless=True):",
-                "async def run_test(browser_name='chromium', headless=True):\n    import asyncio\n    await asyncio.sleep(1)  # Ensure browser is ready"
+            execution_code = re.sub(
+                r"(async def run_test\([^)]*\):)",
+                r"\1\n    import asyncio\n    await asyncio.sleep(1)  # Ensure browser is ready",
+                code, count=1
             )
 
-        # Emit execution request to agent (targeted to specific agent)
         mode = 'headless' if headless else 'headful'
-        if self.agent_sid:
-            self.socketio.emit('execute_healing_attempt', {
-                'test_id': test_id,
-                'code': execution_code,
-                'browser': browser_name,
-                'mode': mode,
-                'attempt': attempt_num + 1
-            }, to=self.agent_sid)
-        else:
-            # Fallback to broadcast if no specific agent
-            self.socketio.emit('execute_healing_attempt', {
-                'test_id': test_id,
-                'code': execution_code,
-                'browser': browser_name,
-                'mode': mode,
-                'attempt': attempt_num + 1
-            })
+        for dispatch in range(self.max_redispatches + 1):
+            if self.agent_lost:
+                # The agent dropped out; run the attempt again on another one
+                self.agent_lost = False
+                self.agent_sid = self.redispatch_agent() if self.redispatch_agent else None
+                if not self.agent_sid:
+                    break
+                logs.append("🔁 Agent disconnected, re-running the attempt on another agent")
 
-        # Wait for agent result with extended timeout for headful mode
-        timeout = 180 if not headless else 120  # 3 minutes for headful, 2 for headless
-        try:
-            await asyncio.wait_for(self.agent_result_event.wait(), timeout=timeout)
-        except asyncio.TimeoutError:
+            # Setup event to wait for agent result
+            self.agent_result_event = asyncio.Event()
+            self.agent_result = None
+
+            # Emit execution request to agent (targeted to specific agent)
+            if self.agent_sid:
+                self.socketio.emit('execute_healing_attempt', {
+                    'test_id': test_id,
+                    'code': execution_code,
+                    'browser': browser_name,
+                    'mode': mode,
+                    'attempt': attempt_num + 1
+                }, to=self.agent_sid)
+            else:
+                # Fallback to broadcast if no specific agent
+                self.socketio.emit('execute_healing_attempt', {
+                    'test_id': test_id,
+                    'code': execution_code,
+                    'browser': browser_name,
+                    'mode': mode,
+                    'attempt': attempt_num + 1
+                })
+
+            # Wait for agent result with extended timeout for headful mode
+            timeout = 180 if not headless else 120  # 3 minutes for headful, 2 for headless
+            try:
+                await asyncio.wait_for(self.agent_result_event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.agent_abandoned = True
+                return {
+                    'success': False,
+                    'logs': logs + ['❌ Agent execution timeout'],
+                    'screenshot': None,
+                    'can_heal': False
+                }
+            if not self.agent_lost:
+                break
+
+        if self.agent_lost or (not self.agent_sid and self.redispatch_agent):
+            self.agent_abandoned = True
             return {
                 'success': False,
-                'logs': logs + ['❌ Agent execution timeout'],
+                'logs': logs + ['❌ Agent disconnected and no other agent is available'],
                 'screenshot': None,
                 'can_heal': False
             }
@@ -157,9 +191,10 @@ Suggest a better locator:"""}
                 'can_heal': False
             }
         
-        # Decode screenshot if present
+        # Agents upload the screenshot and send its artifact path; older agents send base64
         screenshot = None
-        if result.get('screenshot'):
+        screenshot_path = result.get('screenshot_ref')
+        if not screenshot_path and result.get('screenshot'):
             try:
                 screenshot = base64.b64decode(result['screenshot'])
             except:
@@ -172,7 +207,8 @@ Suggest a better locator:"""}
             return {
                 'success': True,
                 'logs': logs,
-                'screenshot': screenshot
+                'screenshot': screenshot,
+                'screenshot_path': screenshot_path
             }
         else:
             # Extract failed locator from error
@@ -190,6 +226,7 @@ Suggest a better locator:"""}
                     'success': False,
                     'logs': logs,
                     'screenshot': screenshot,
+                    'screenshot_path': screenshot_path,
                     'can_heal': True,
                     'failed_locator': failed_locator,
                     'error_message': error_msg,
@@ -200,6 +237,7 @@ Suggest a better locator:"""}
                     'success': False,
                     'logs': logs,
                     'screenshot': screenshot,
+                    'screenshot_path': screenshot_path,
                     'can_heal': False
                 }
     
@@ -225,6 +263,7 @@ Suggest a better locator:"""}
                     'success': True,
                     'logs': result['logs'],
                     'screenshot': result['screenshot'],
+                    'screenshot_path': result.get('screenshot_path'),
                     'healed_script': self.healed_script if self.healed_script != code else None,
                     'failed_locators': self.failed_locators
                 }
@@ -334,6 +373,7 @@ Suggest a better locator:"""}
             'success': False,
             'logs': result.get('logs', []) + [f'❌ Failed after {self.max_retries} healing attempts'],
             'screenshot': result.get('screenshot'),
+            'screenshot_path': result.get('screenshot_path'),
             'healed_script': self.healed_script,
             'failed_locators': self.failed_locators
         }
@@ -365,6 +405,12 @@ Suggest a better locator:"""}
                 }
             }
             
+            pool = self._get_browser_pool()
+            pooled_playwright = None
+            if pool:
+                pooled_playwright = PooledPlaywright(pool)
+                restricted_globals['__builtins__']['__import__'] = pooled_playwright.import_hook
+            
             local_vars = {}
             
             try:
@@ -379,7 +425,12 @@ Suggest a better locator:"""}
                         'can_heal': False
                     }
                 
-                result = await local_vars['run_test'](browser_name=browser_name, headless=headless)
+                if pool:
+                    # Run on the pool's loop; pooled browsers are bound to it
+                    result = await asyncio.wrap_future(pool.submit(run_pooled(
+                        pool, local_vars['run_test'], pooled_playwright, browser_name, headless)))
+                else:
+                    result = await local_vars['run_test'](browser_name=browser_name, headless=headless)
                 logs.extend(result.get('logs', []))
                 screenshot = result.get('screenshot')
                 
@@ -487,6 +538,12 @@ Suggest a better locator:"""}
                 'can_heal': False
             }
     
+    def _get_browser_pool(self):
+        """Shared warm browser pool for server attempts, or None when disabled."""
+        if self.browser_pool is None and browser_pool_enabled():
+            self.browser_pool = get_browser_pool()
+        return self.browser_pool
+    
     def extract_failed_locator(self, error_message):
         """Extract the failed locator from error message."""
         patterns = [
@@ -2,13 +2,20 @@ import os
 import sys
 import uuid
 import base64
+import gzip
+import hashlib
 import time
 import socketio
 import asyncio
 from playwright.async_api import async_playwright
 
 SERVER_URL = os.environ.get('AGENT_SERVER_URL', 'http://127.0.0.1:7890')
+# Screenshots go over HTTP in chunks; 'gzip' compresses them first (PNG gains little)
+SCREENSHOT_COMPRESSION = os.environ.get('AGENT_SCREENSHOT_COMPRESSION', 'none').lower()
 agent_id = str(uuid.uuid4())
+# Tests this agent accepts at once, and how often it reports its load to the server
+AGENT_MAX_CONCURRENCY = int(os.environ.get('AGENT_MAX_CONCURRENCY', 1))
+HEARTBEAT_INTERVAL = float(os.environ.get('AGENT_HEARTBEAT_INTERVAL', 10))
 
 # Socket.IO client
 sio = socketio.Client(
@@ -21,11 +28,11 @@ sio = socketio.Client(
 )
 
 # Global state
-active_page = None
-active_playwright_instance = None  # Playwright instance for cleanup
 pending_selector_event = None
 event_loop = None  # Will hold reference to main event loop
-widget_injection_complete = None  # Event to coordinate browser cleanup with widget lifecycle
+available_browsers = []
+jobs = {}  # test_id -> Job for every test running on this agent; len(jobs) is reported as load
+job_slots = asyncio.Semaphore(AGENT_MAX_CONCURRENCY)
 
 
 def detect_browsers():
@@ -61,13 +68,210 @@ def detect_browsers():
     return browsers
 
 
+# ---------------- Per-job Browser Contexts ----------------
+# Kept inline (rather than imported from the server's browser_pool) so this file
+# stays a single download.
+
+class SharedBrowsers:
+    """One launched browser per (browser, headless), shared by every job on the agent's loop."""
+
+    def __init__(self):
+        self._playwright = None
+        self._browsers = {}
+        self._lock = asyncio.Lock()
+
+    async def get(self, browser_name, headless):
+        async with self._lock:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            key = (browser_name, headless)
+            browser = self._browsers.get(key)
+            if browser is None or not browser.is_connected():
+                browser = await getattr(self._playwright, browser_name).launch(headless=headless)
+                self._browsers[key] = browser
+                print(f"🚀 Launched shared {browser_name} (headless={headless})")
+            return browser
+
+    async def close(self):
+        for browser in self._browsers.values():
+            try:
+                await browser.close()
+            except Exception:
+                pass
+        self._browsers = {}
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+shared_browsers = SharedBrowsers()
+
+
+class Job:
+    """
+    Execution state for one test, keyed by test_id.
+
+    The test's pages live in its own browser contexts on a shared browser, so
+    closing a job never touches another job. ``keep_open`` holds the contexts
+    open after the script finishes (headful healing needs the page for the
+    element selector widget).
+    """
+
+    def __init__(self, test_id, keep_open=False):
+        self.test_id = test_id
+        self.keep_open = keep_open
+        self.contexts = []
+        self.page = None
+        self.widget_done = None  # Set when element selection finishes
+
+    async def close(self):
+        if self.widget_done:
+            self.widget_done.set()
+        for context in self.contexts:
+            try:
+                await context.close()
+            except Exception:
+                pass
+        self.contexts = []
+        self.page = None
+
+
+class JobBrowser:
+    """Browser stand-in handed to a script: its pages open in the job's own contexts."""
+
+    def __init__(self, job, browser):
+        self._job = job
+        self._browser = browser
+
+    async def new_context(self, **kwargs):
+        context = await self._browser.new_context(**kwargs)
+        self._job.contexts.append(context)
+        return context
+
+    async def new_page(self, **kwargs):
+        context = await self.new_context(**kwargs)
+        page = await context.new_page()
+        if self._job.page is None:
+            self._job.page = page
+        return page
+
+    @property
+    def contexts(self):
+        return list(self._job.contexts)
+
+    async def close(self):
+        # The shared browser stays up; only this job's contexts go
+        if not self._job.keep_open:
+            await self._job.close()
+
+    def __getattr__(self, name):
+        return getattr(self._browser, name)
+
+
+class JobBrowserType:
+    def __init__(self, job, browser_name):
+        self._job = job
+        self.name = browser_name
+
+    async def launch(self, headless=True, **kwargs):
+        # Extra launch options are ignored: jobs share one browser per (browser, headless)
+        return JobBrowser(self._job, await shared_browsers.get(self.name, headless))
+
+
+class JobPlaywright:
+    """Stand-in for ``async_playwright()`` that serves shared browsers with per-job contexts."""
+
+    def __init__(self, job):
+        self._job = job
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    async def start(self):
+        return self
+
+    async def stop(self):
+        if not self._job.keep_open:
+            await self._job.close()
+
+    @property
+    def chromium(self):
+        return JobBrowserType(self._job, 'chromium')
+
+    @property
+    def firefox(self):
+        return JobBrowserType(self._job, 'firefox')
+
+    @property
+    def webkit(self):
+        return JobBrowserType(self._job, 'webkit')
+
+
+class JobAsyncApi:
+    """Module proxy for ``playwright.async_api`` with the job's ``async_playwright``."""
+
+    def __init__(self, playwright):
+        self.async_playwright = playwright
+
+    def __getattr__(self, name):
+        import playwright.async_api
+        return getattr(playwright.async_api, name)
+
+
+def load_run_test(code, job):
+    """Exec a generated script with ``async_playwright`` bound to the job; returns its run_test or None."""
+    import builtins
+
+    api = JobAsyncApi(JobPlaywright(job))
+
+    def job_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if name == 'playwright.async_api' and fromlist:
+            return api
+        return __import__(name, globals, locals, fromlist, level)
+
+    namespace = {'__builtins__': {**builtins.__dict__, '__import__': job_import}}
+    exec(code, namespace)
+    return namespace.get('run_test')
+
+
+async def close_job(test_id):
+    """Close the browser contexts of one test (other tests are untouched)."""
+    job = jobs.pop(test_id, None)
+    if job:
+        await job.close()
+
+
 # ---------------- Socket.IO Events ----------------
 
 @sio.event
 def connect():
+    global available_browsers
     print(f"Connected to server: {SERVER_URL}")
     available_browsers = detect_browsers()
-    sio.emit('agent_register', {'agent_id': agent_id, 'browsers': available_browsers})
+    sio.emit('agent_register', {'agent_id': agent_id, 'browsers': available_browsers,
+                                'max_concurrency': AGENT_MAX_CONCURRENCY})
+
+
+def heartbeat_loop():
+    """Report liveness and load; the server evicts agents whose heartbeats stop."""
+    while True:
+        sio.sleep(HEARTBEAT_INTERVAL)
+        if sio.connected:
+            try:
+                sio.emit('agent_heartbeat', {
+                    'agent_id': agent_id,
+                    'load': len(jobs),
+                    'max_concurrency': AGENT_MAX_CONCURRENCY,
+                    'browsers': available_browsers
+                })
+            except Exception as e:
+                print(f"Heartbeat error: {e}")
 
 
 @sio.event
@@ -107,9 +311,11 @@ def handle_element_selector_needed(data):
     Local agent detects failures and injects immediately for speed.
     This handler only triggers if local detection somehow fails.
     """
-    global pending_selector_event, active_page, event_loop
+    global pending_selector_event, event_loop
     pending_selector_event = data
     mode = data.get('mode', 'headless')
+    job = jobs.get(data['test_id'])
+    active_page = job.page if job else None
     
     print(f"\n🔔 SERVER FALLBACK: Received element_selector_needed event (should be rare)")
     print(f"   Test ID: {data['test_id']}")
@@ -126,40 +332,83 @@ def handle_element_selector_needed(data):
         print(f"❌ FALLBACK: Cannot inject widget (mode={mode}, page={'yes' if active_page else 'no'})")
 
 
+# ---------------- Screenshot Upload ----------------
+
+def upload_screenshot(screenshot):
+    """Upload screenshot bytes to the server's artifact store in chunks; returns the artifact ref."""
+    import requests
+
+    payload = gzip.compress(screenshot) if SCREENSHOT_COMPRESSION == 'gzip' else screenshot
+    uploads_url = f'{SERVER_URL}/api/artifacts/uploads'
+    with requests.Session() as http:
+        response = http.post(uploads_url, json={
+            'sha256': hashlib.sha256(screenshot).hexdigest(),
+            'size': len(screenshot),
+            'encoding': 'gzip' if SCREENSHOT_COMPRESSION == 'gzip' else 'identity'
+        }, timeout=30)
+        response.raise_for_status()
+        upload = response.json()
+        if upload.get('artifact'):
+            return upload['artifact']  # Server already has this image
+
+        upload_url = f"{uploads_url}/{upload['upload_id']}"
+        chunk_size = upload['chunk_size']
+        for offset in range(0, len(payload), chunk_size):
+            http.put(upload_url, params={'offset': offset}, data=payload[offset:offset + chunk_size],
+                     headers={'Content-Type': 'application/octet-stream'}, timeout=60).raise_for_status()
+
+        response = http.post(f'{upload_url}/complete', timeout=60)
+        response.raise_for_status()
+        return response.json()['artifact']
+
+
+async def screenshot_fields(screenshot):
+    """Result event fields for a screenshot: an artifact ref, or inline base64 if the upload fails."""
+    if not screenshot:
+        return {'screenshot': None}
+    try:
+        return {'screenshot_ref': await asyncio.to_thread(upload_screenshot, screenshot)}
+    except Exception as e:
+        print(f"⚠️ Screenshot upload failed, sending it inline: {e}")
+        return {'screenshot': base64.b64encode(screenshot).decode('utf-8')}
+
+
 # ---------------- Task Execution ----------------
 
 async def execute_test(test_id, code, browser_name, mode):
-    global active_page
     headless = mode == 'headless'
 
-    try:
-        sio.emit('agent_log', {'test_id': test_id, 'message': f'Preparing to execute test in {mode} mode...'})
+    async with job_slots:
+        job = Job(test_id)
+        jobs[test_id] = job
+        try:
+            sio.emit('agent_log', {'test_id': test_id, 'message': f'Preparing to execute test in {mode} mode...'})
 
-        local_vars = {}
-        exec(code, {}, local_vars)
-        if 'run_test' not in local_vars:
-            sio.emit('agent_result', {'test_id': test_id, 'success': False, 'logs': ['Error: run_test missing'], 'screenshot': None})
-            return
+            run_test = load_run_test(code, job)
+            if run_test is None:
+                sio.emit('agent_result', {'test_id': test_id, 'success': False, 'logs': ['Error: run_test missing'], 'screenshot': None})
+                return
 
-        run_test = local_vars['run_test']
-        result = await run_test(browser_name=browser_name, headless=headless)
+            result = await run_test(browser_name=browser_name, headless=headless)
 
-        screenshot_b64 = None
-        if result.get('screenshot'):
-            screenshot_b64 = base64.b64encode(result['screenshot']).decode('utf-8')
+            screenshot = await screenshot_fields(result.get('screenshot'))
 
-        sio.emit('agent_result', {
-            'test_id': test_id,
-            'success': result.get('success', False),
-            'logs': result.get('logs', []),
-            'screenshot': screenshot_b64
-        })
+            sio.emit('agent_result', {
+                'test_id': test_id,
+                'success': result.get('success', False),
+                'logs': result.get('logs', []),
+                **screenshot
+            })
 
-        print(f"Test {test_id} completed: {'SUCCESS' if result.get('success') else 'FAILED'}")
+            print(f"Test {test_id} completed: {'SUCCESS' if result.get('success') else 'FAILED'}")
 
-    except Exception as e:
-        print(f"Execution error: {e}")
-        sio.emit('agent_result', {'test_id': test_id, 'success': False, 'logs': [str(e)], 'screenshot': None})
+        except Exception as e:
+            print(f"Execution error: {e}")
+            sio.emit('agent_result', {'test_id': test_id, 'success': False, 'logs': [str(e)], 'screenshot': None})
+        finally:
+            if jobs.get(test_id) is job:
+                del jobs[test_id]
+            await job.close()
 
 
 def extract_failed_locator_local(error_message):
@@ -182,227 +431,110 @@ def extract_failed_locator_local(error_message):
     return None
 
 
-def modify_code_for_healing(code):
-    """Transform code to keep browser open by removing async with context manager.
-    The async with automatically closes browser/playwright on exit, so we replace it with direct calls."""
-    import re
-    
-    # Step 1: Find the async with line and its indentation
-    lines = code.split('\n')
-    new_lines = []
-    in_async_with_block = False
-    async_with_indent = 0
-    block_indent = 0
-    
-    for i, line in enumerate(lines):
-        # Check if this line contains 'async with async_playwright() as var:'
-        async_with_match = re.match(r'^(\s*)async with async_playwright\(\) as (\w+):\s*$', line)
-        
-        if async_with_match and not in_async_with_block:
-            # Found the async with line - replace it
-            indent = async_with_match.group(1)
-            var_name = async_with_match.group(2)
-            async_with_indent = len(indent)
-            
-            # Replace with two lines at the same indentation
-            new_lines.append(f'{indent}{var_name} = await async_playwright().start()')
-            new_lines.append(f'{indent}globals()["__p_instance__"] = {var_name}')
-            
-            in_async_with_block = True
-            # Determine the block indentation (typically async_with_indent + 4)
-            # We'll detect it from the next non-empty line
-            if i + 1 < len(lines) and lines[i + 1].strip():
-                block_indent = len(lines[i + 1]) - len(lines[i + 1].lstrip())
-            else:
-                block_indent = async_with_indent + 4  # default assumption
-            
-        elif in_async_with_block:
-            # Check if this line is still part of the async with block
-            if line.strip():  # Non-empty line
-                current_indent = len(line) - len(line.lstrip())
-                
-                # If indentation decreased to or below async_with level, we've exited the block
-                if current_indent <= async_with_indent:
-                    in_async_with_block = False
-                    new_lines.append(line)
-                else:
-                    # Dedent by one level (typically 4 spaces)
-                    dedent_amount = block_indent - async_with_indent
-                    if current_indent >= block_indent:
-                        dedented_line = line[dedent_amount:]
-                        new_lines.append(dedented_line)
-                    else:
-                        # Line with unexpected indentation, keep as is
-                        new_lines.append(line)
-            else:
-                # Empty line - keep as is
-                new_lines.append(line)
-        else:
-            # Not in async with block, keep line as is
-            new_lines.append(line)
-    
-    modified_code = '\n'.join(new_lines)
-    
-    # Step 2: Inject page capture after page creation
-    lines = modified_code.split('\n')
-    new_lines = []
-    page_captured = False
-    
-    for line in lines:
-        new_lines.append(line)
-        # Match any variable name pattern: var = await browser.new_page()
-        if re.search(r'(\w+)\s*=\s*await\s+\w+\.new_page\(\)', line) and not page_captured:
-            indent = len(line) - len(line.lstrip())
-            var_match = re.search(r'(\w+)\s*=\s*await\s+\w+\.new_page\(\)', line)
-            if var_match:
-                var_name = var_match.group(1)
-                new_lines.append(f'{" " * indent}globals()["__healing_page__"] = {var_name}')
-                page_captured = True
-                print(f"✅ Added page capture injection for variable '{var_name}'")
-    
-    modified_code = '\n'.join(new_lines)
-    
-    # Step 3: Replace browser.close() with pass to keep browser open for healing
-    modified_code = re.sub(
-        r'^(\s*)(await\s+)?browser\.close\(\)',
-        r'\1pass  # browser.close() commented for healing',
-        modified_code,
-        flags=re.MULTILINE
-    )
-    
-    print("✅ Code transformation: async with removed, body dedented, browser stays open for healing")
-    return modified_code
-
 async def execute_healing_attempt(test_id, code, browser_name, mode, attempt):
-    global active_page, widget_injection_complete, active_playwright_instance
     headless = mode == 'headless'
 
-    try:
-        print(
-            f"🎯 Starting healing attempt {attempt} for test {test_id} in {'headless' if headless else 'headful'} mode")
+    # Close what this test's previous attempt left open (other tests keep running)
+    await close_job(test_id)
 
-        # Clean up any previous instances
-        await cleanup_browser()
+    async with job_slots:
+        # Headful attempts keep their page open for the element selector widget
+        job = Job(test_id, keep_open=not headless)
+        jobs[test_id] = job
+        try:
+            print(
+                f"🎯 Starting healing attempt {attempt} for test {test_id} in {'headless' if headless else 'headful'} mode")
 
-        # Use original code for headless, modified for headful
-        if headless:
-            modified_code = code
-        else:
-            modified_code = modify_code_for_healing(code)
-            print("✅ Code modified for headful healing mode")
-            print("\n" + "="*80)
-            print("MODIFIED CODE FOR DEBUGGING:")
-            print("="*80)
-            print(modified_code)
-            print("="*80 + "\n")
-
-        global_vars = {'__healing_page__': None, '__p_instance__': None}
-        local_vars = {}
-
-        # Execute the code
-        exec(modified_code, global_vars, local_vars)
-
-        if 'run_test' not in local_vars:
-            sio.emit('healing_attempt_result',
-                     {'test_id': test_id, 'success': False, 'logs': ['Error: run_test missing'], 'screenshot': None})
-            return
+            run_test = load_run_test(code, job)
+            if run_test is None:
+                sio.emit('healing_attempt_result',
+                         {'test_id': test_id, 'success': False, 'logs': ['Error: run_test missing'], 'screenshot': None})
+                return
 
-        run_test = local_vars['run_test']
+            # Execute with timeout
+            try:
+                result = await asyncio.wait_for(
+                    run_test(browser_name=browser_name, headless=headless),
+                    timeout=60.0  # 60 second timeout
+                )
+            except asyncio.TimeoutError:
+                print(f"⏱️  Execution timeout for test {test_id}")
+                result = {
+                    'success': False,
+                    'logs': ['Execution timeout - browser took too long to respond'],
+                    'screenshot': None
+                }
 
-        # Execute with timeout
-        try:
-            result = await asyncio.wait_for(
-                run_test(browser_name=browser_name, headless=headless),
-                timeout=60.0  # 60 second timeout
-            )
-        except asyncio.TimeoutError:
-            print(f"⏱️  Execution timeout for test {test_id}")
-            result = {
-                'success': False,
-                'logs': ['Execution timeout - browser took too long to respond'],
-                'screenshot': None
-            }
-
-        # Store page reference for headful mode
-        if not headless and global_vars.get('__healing_page__'):
-            active_page = global_vars['__healing_page__']
-            print(
-                f"✅ Page captured for healing - URL: {active_page.url if not active_page.is_closed() else 'CLOSED'}")
-        else:
-            print(
-                f"ℹ️  No page captured (headless: {headless}, page available: {bool(global_vars.get('__healing_page__'))})")
-
-        # Handle screenshot
-        screenshot_b64 = None
-        if result.get('screenshot'):
-            screenshot_b64 = base64.b64encode(result['screenshot']).decode('utf-8')
-
-        print(f"Healing attempt {attempt} for test {test_id}: {'SUCCESS' if result.get('success') else 'FAILED'}")
-
-        # Emit result to server for tracking (but don't wait for response)
-        sio.emit('healing_attempt_result', {
-            'test_id': test_id,
-            'success': result.get('success', False),
-            'logs': result.get('logs', []),
-            'screenshot': screenshot_b64
-        })
-
-        # LOCAL-FIRST HEALING: Detect failure and inject widget immediately
-        if not headless and not result.get('success') and active_page:
-            # Extract failed locator from error message
-            error_msg = ' '.join(result.get('logs', []))
-            failed_locator = extract_failed_locator_local(error_msg)
-            
-            if failed_locator:
-                print(f"🎯 LOCAL: Failed locator detected: {failed_locator}")
-                print(f"🚀 LOCAL: Injecting widget immediately (no server delay)")
-                
-                # Inject widget immediately - no waiting for server
-                global widget_injection_complete
-                widget_injection_complete = asyncio.Event()
-                
-                try:
-                    # Inject widget NOW
+            active_page = job.page if job.page and not job.page.is_closed() else None
+            if not headless and active_page:
+                print(f"✅ Page captured for healing - URL: {active_page.url}")
+            else:
+                print(f"ℹ️  No page captured (headless: {headless}, page available: {bool(active_page)})")
+
+            # Upload the screenshot; the result event only carries its artifact ref
+            screenshot = await screenshot_fields(result.get('screenshot'))
+
+            print(f"Healing attempt {attempt} for test {test_id}: {'SUCCESS' if result.get('success') else 'FAILED'}")
+
+            # Emit result to server for tracking (but don't wait for response)
+            sio.emit('healing_attempt_result', {
+                'test_id': test_id,
+                'success': result.get('success', False),
+                'logs': result.get('logs', []),
+                **screenshot
+            })
+
+            # LOCAL-FIRST HEALING: Detect failure and inject widget immediately
+            if not headless and not result.get('success') and active_page:
+                # Extract failed locator from error message
+                error_msg = ' '.join(result.get('logs', []))
+                failed_locator = extract_failed_locator_local(error_msg)
+
+                if failed_locator:
+                    print(f"🎯 LOCAL: Failed locator detected: {failed_locator}")
+                    print(f"🚀 LOCAL: Injecting widget immediately (no server delay)")
+
+                    # Inject widget immediately - no waiting for server
+                    job.widget_done = asyncio.Event()
                     await inject_element_selector(test_id, failed_locator)
-                    
+
                     # Wait for user interaction (5 minutes timeout)
                     print(f"⏳ Waiting for user to select element (300s timeout)...")
                     try:
-                        await asyncio.wait_for(widget_injection_complete.wait(), timeout=300.0)
+                        await asyncio.wait_for(job.widget_done.wait(), timeout=300.0)
                         print(f"✅ User selection completed")
                     except asyncio.TimeoutError:
                         print(f"⏱️  User selection timeout (300s)")
-                finally:
-                    # Always cleanup browser after widget interaction or timeout
-                    widget_injection_complete = None
-                    print(f"🧹 Cleaning up browser after widget interaction...")
-                    await cleanup_browser()
-            else:
-                print(f"ℹ️  No locator error detected in headful mode - browser will close normally")
+                else:
+                    print(f"ℹ️  No locator error detected in headful mode - browser will close normally")
 
-    except Exception as e:
-        print(f"💥 Healing attempt error: {e}")
-        import traceback
-        traceback.print_exc()
-        sio.emit('healing_attempt_result', {'test_id': test_id, 'success': False, 'logs': [str(e)], 'screenshot': None})
-        await cleanup_browser()
+        except Exception as e:
+            print(f"💥 Healing attempt error: {e}")
+            import traceback
+            traceback.print_exc()
+            sio.emit('healing_attempt_result', {'test_id': test_id, 'success': False, 'logs': [str(e)], 'screenshot': None})
+        finally:
+            # Always close this attempt's contexts after widget interaction, timeout or error
+            if jobs.get(test_id) is job:
+                del jobs[test_id]
+            await job.close()
 
 
 async def inject_element_selector(test_id, failed_locator):
-    global active_page, widget_injection_complete
+    job = jobs.get(test_id)
+    active_page = job.page if job else None
     if not active_page:
         print(f"❌ No active page for element selection (test {test_id})")
-        if widget_injection_complete:
-            widget_injection_complete.set()
+        if job and job.widget_done:
+            job.widget_done.set()
         return
 
     try:
         # Check if page is still valid
         if active_page.is_closed():
             print(f"❌ Page already closed for test {test_id}")
-            active_page = None
-            if widget_injection_complete:
-                widget_injection_complete.set()
+            if job.widget_done:
+                job.widget_done.set()
             return
 
         print(f"🎯 Injecting element selector widget for test {test_id} on page: {active_page.url}")
@@ -609,8 +741,8 @@ async def inject_element_selector(test_id, failed_locator):
                     'failed_locator': failed_locator
                 })
                 # Signal completion - browser will be cleaned up by caller
-                if widget_injection_complete:
-                    widget_injection_complete.set()
+                if job.widget_done:
+                    job.widget_done.set()
                 return
         
         print("⏱️  Element selection polling complete (300s)")
@@ -619,30 +751,8 @@ async def inject_element_selector(test_id, failed_locator):
         print(f"❌ Element selector injection error: {e}")
     finally:
         # Signal completion (browser stays open, will be cleaned up by caller)
-        if widget_injection_complete:
-            widget_injection_complete.set()
-
-async def cleanup_browser():
-    """Clean up browser, playwright instance, and page references."""
-    global active_page, active_playwright_instance
-    if active_page:
-        try:
-            browser = active_page.context.browser
-            await browser.close()
-            print("✅ Browser closed after healing attempt")
-        except Exception as e:
-            print(f"Browser cleanup error: {e}")
-        finally:
-            active_page = None
-    
-    if active_playwright_instance:
-        try:
-            await active_playwright_instance.stop()
-            print("✅ Playwright instance stopped")
-        except Exception as e:
-            print(f"Playwright cleanup error: {e}")
-        finally:
-            active_playwright_instance = None
+        if job.widget_done:
+            job.widget_done.set()
 
 
 # ---------------- Dummy Test on Startup ----------------
@@ -674,6 +784,7 @@ def main():
     try:
         print("Connecting to server...")
         sio.connect(SERVER_URL)
+        sio.start_background_task(heartbeat_loop)
         print("Connection established! Waiting for tasks...\n")
 
         # Create and store event loop reference (use global keyword)
@@ -689,6 +800,7 @@ def main():
         if sio.connected:
             sio.disconnect()
         if event_loop:
+            event_loop.run_until_complete(shared_browsers.close())
             event_loop.close()
     except Exception as e:
         print(f"Connection error: {e}")
@@ -1,7 +1,58 @@
-import sqlite3
+import base64
 import json
+import re
+import sqlite3
 from datetime import datetime
 
+from db_pool import get_db
+
+
+def encode_cursor(created_at, row_id):
+    """Opaque keyset cursor pointing just past the row (created_at, id)."""
+    return base64.urlsafe_b64encode(json.dumps([created_at, row_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return created_at, int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def timestamp_param(value):
+    """Normalize an ISO date/datetime to SQLite's CURRENT_TIMESTAMP format for comparisons."""
+    try:
+        return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid date: {value}") from e
+
+
+def keyset_page(table, columns, where=(), params=(), limit=50, cursor=None, db_path='automation.db'):
+    """
+    One page of ``table`` rows, newest first, as (list of column dicts, next cursor).
+
+    Pages are addressed by the (created_at, id) of the last row seen rather than
+    an OFFSET, so every page is an index range scan however deep it is. The
+    next cursor is None on the last page.
+    """
+    clauses = list(where)
+    params = list(params)
+    if cursor:
+        clauses.append('(created_at, id) < (?, ?)')
+        params.extend(decode_cursor(cursor))
+
+    selected = ['id', 'created_at'] + [column for column in columns if column not in ('id', 'created_at')]
+    sql = f'SELECT {", ".join(selected)} FROM {table}'
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    sql += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+    rows = get_db(db_path).query(sql, params + [limit + 1])
+
+    next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+    return [dict(zip(selected, row)) for row in rows[:limit]], next_cursor
+
+
 class Database:
     def __init__(self, db_path='automation.db'):
         self.db_path = db_path
@@ -9,66 +60,147 @@ class Database:
     
     def init_db(self):
         """Initialize all database tables."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        # Existing test_history table
-        c.execute('''CREATE TABLE IF NOT EXISTS test_history
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      command TEXT NOT NULL,
-                      generated_code TEXT NOT NULL,
-                      healed_code TEXT,
-                      browser TEXT,
-                      mode TEXT,
-                      execution_location TEXT,
-                      status TEXT,
-                      logs TEXT,
-                      screenshot_path TEXT,
-                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        
-        # New learned_tasks table for persistent learning
-        c.execute('''CREATE TABLE IF NOT EXISTS learned_tasks
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      task_id TEXT UNIQUE NOT NULL,
-                      task_name TEXT NOT NULL,
-                      description TEXT,
-                      steps TEXT,
-                      playwright_code TEXT NOT NULL,
-                      tags TEXT,
-                      embedding_vector BLOB,
-                      version INTEGER DEFAULT 1,
-                      parent_task_id TEXT,
-                      success_count INTEGER DEFAULT 0,
-                      failure_count INTEGER DEFAULT 0,
-                      last_executed TIMESTAMP,
-                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                      updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        
-        # Task execution history for feedback loop
-        c.execute('''CREATE TABLE IF NOT EXISTS task_executions
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      task_id TEXT NOT NULL,
-                      execution_result TEXT,
-                      success BOOLEAN,
-                      error_message TEXT,
-                      execution_time_ms INTEGER,
-                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                      FOREIGN KEY (task_id) REFERENCES learned_tasks(task_id))''')
-        
-        # Create indices for faster queries
-        c.execute('CREATE INDEX IF NOT EXISTS idx_task_id ON learned_tasks(task_id)')
-        c.execute('CREATE INDEX IF NOT EXISTS idx_task_name ON learned_tasks(task_name)')
-        c.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON learned_tasks(created_at)')
-        
-        conn.commit()
-        conn.close()
+        with get_db(self.db_path).transaction() as conn:
+            c = conn.cursor()
+        
+            # Existing test_history table
+            c.execute('''CREATE TABLE IF NOT EXISTS test_history
+                         (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                          command TEXT NOT NULL,
+                          generated_code TEXT NOT NULL,
+                          healed_code TEXT,
+                          browser TEXT,
+                          mode TEXT,
+                          execution_location TEXT,
+                          status TEXT,
+                          logs TEXT,
+                          screenshot_path TEXT,
+                          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        
+            # New learned_tasks table for persistent learning
+            c.execute('''CREATE TABLE IF NOT EXISTS learned_tasks
+                         (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                          task_id TEXT UNIQUE NOT NULL,
+                          task_name TEXT NOT NULL,
+                          description TEXT,
+                          steps TEXT,
+                          playwright_code TEXT NOT NULL,
+                          tags TEXT,
+                          embedding_vector BLOB,
+                          version INTEGER DEFAULT 1,
+                          parent_task_id TEXT,
+                          success_count INTEGER DEFAULT 0,
+                          failure_count INTEGER DEFAULT 0,
+                          last_executed TIMESTAMP,
+                          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                          updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                          embedding_model TEXT)''')
+            
+            # Embedding model of the stored vector; older databases lack the column
+            c.execute('PRAGMA table_info(learned_tasks)')
+            if 'embedding_model' not in [column[1] for column in c.fetchall()]:
+                c.execute('ALTER TABLE learned_tasks ADD COLUMN embedding_model TEXT')
+        
+            # Task execution history for feedback loop
+            c.execute('''CREATE TABLE IF NOT EXISTS task_executions
+                         (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                          task_id TEXT NOT NULL,
+                          execution_result TEXT,
+                          success BOOLEAN,
+                          error_message TEXT,
+                          execution_time_ms INTEGER,
+                          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                          FOREIGN KEY (task_id) REFERENCES learned_tasks(task_id))''')
+        
+            # Cache of LLM-generated Playwright code keyed on normalized command
+            c.execute('''CREATE TABLE IF NOT EXISTS codegen_cache
+                         (cache_key TEXT PRIMARY KEY,
+                          command TEXT NOT NULL,
+                          browser TEXT NOT NULL,
+                          prompt_version TEXT NOT NULL,
+                          code TEXT NOT NULL,
+                          code_hash TEXT NOT NULL,
+                          hit_count INTEGER DEFAULT 0,
+                          created_at REAL NOT NULL,
+                          last_used_at REAL NOT NULL)''')
+        
+            # Embedding vectors keyed on (model, sha256 of the embedded text)
+            c.execute('''CREATE TABLE IF NOT EXISTS embedding_cache
+                         (model TEXT NOT NULL,
+                          text_hash TEXT NOT NULL,
+                          dimension INTEGER NOT NULL,
+                          vector BLOB NOT NULL,
+                          created_at REAL NOT NULL,
+                          last_used_at REAL NOT NULL,
+                          PRIMARY KEY (model, text_hash))''')
+        
+            # Create indices for faster queries
+            c.execute('CREATE INDEX IF NOT EXISTS idx_task_id ON learned_tasks(task_id)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_task_name ON learned_tasks(task_name)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON learned_tasks(created_at)')
+            # Keyset pagination of the history list, overall and per status
+            c.execute('CREATE INDEX IF NOT EXISTS idx_test_history_created ON test_history(created_at, id)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_test_history_status ON test_history(status, created_at, id)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_codegen_code_hash ON codegen_cache(code_hash)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_codegen_last_used ON codegen_cache(last_used_at)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache(last_used_at)')
+            
+            # Normalized task tags, kept in sync by LearnedTask.save
+            c.execute('''CREATE TABLE IF NOT EXISTS task_tags
+                         (task_id TEXT NOT NULL,
+                          tag TEXT NOT NULL,
+                          PRIMARY KEY (task_id, tag))''')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_task_tags_tag ON task_tags(tag, task_id)')
+            
+            # Backfill tags for libraries created before task_tags existed
+            c.execute('SELECT 1 FROM task_tags LIMIT 1')
+            if c.fetchone() is None:
+                c.execute("SELECT task_id, tags FROM learned_tasks WHERE tags IS NOT NULL AND tags != '[]'")
+                c.executemany('INSERT OR IGNORE INTO task_tags (task_id, tag) VALUES (?, ?)',
+                              [(task_id, tag) for task_id, tags in c.fetchall()
+                               for tag in LearnedTask.normalize_tags(json.loads(tags))])
+            
+            self._init_fts(c)
+    
+    def _init_fts(self, c):
+        """Full-text index over learned tasks, maintained by triggers."""
+        c.execute("SELECT 1 FROM sqlite_master WHERE name='learned_tasks_fts'")
+        exists = c.fetchone() is not None
+        try:
+            c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS learned_tasks_fts USING fts5
+                         (task_name, description, steps, playwright_code,
+                          content='learned_tasks', content_rowid='id')''')
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ SQLite FTS5 is not available, keyword search disabled: {e}")
+            return
+        
+        c.execute('''CREATE TRIGGER IF NOT EXISTS learned_tasks_fts_insert AFTER INSERT ON learned_tasks BEGIN
+                         INSERT INTO learned_tasks_fts (rowid, task_name, description, steps, playwright_code)
+                         VALUES (new.id, new.task_name, new.description, new.steps, new.playwright_code);
+                     END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS learned_tasks_fts_delete AFTER DELETE ON learned_tasks BEGIN
+                         INSERT INTO learned_tasks_fts (learned_tasks_fts, rowid, task_name, description, steps, playwright_code)
+                         VALUES ('delete', old.id, old.task_name, old.description, old.steps, old.playwright_code);
+                     END''')
+        # Counter updates (success_count etc.) do not touch indexed text
+        c.execute('''CREATE TRIGGER IF NOT EXISTS learned_tasks_fts_update
+                     AFTER UPDATE OF task_name, description, steps, playwright_code ON learned_tasks BEGIN
+                         INSERT INTO learned_tasks_fts (learned_tasks_fts, rowid, task_name, description, steps, playwright_code)
+                         VALUES ('delete', old.id, old.task_name, old.description, old.steps, old.playwright_code);
+                         INSERT INTO learned_tasks_fts (rowid, task_name, description, steps, playwright_code)
+                         VALUES (new.id, new.task_name, new.description, new.steps, new.playwright_code);
+                     END''')
+        
+        if not exists:
+            c.execute("INSERT INTO learned_tasks_fts (learned_tasks_fts) VALUES ('rebuild')")
 
 
 class LearnedTask:
     """Model for a learned automation task."""
     
     def __init__(self, task_id, task_name, playwright_code, description='', steps=None, 
-                 tags=None, embedding_vector=None, version=1, parent_task_id=None):
+                 tags=None, embedding_vector=None, version=1, parent_task_id=None,
+                 embedding_model=None):
         self.task_id = task_id
         self.task_name = task_name
         self.description = description
@@ -76,6 +208,7 @@ class LearnedTask:
         self.playwright_code = playwright_code
         self.tags = tags or []
         self.embedding_vector = embedding_vector
+        self.embedding_model = embedding_model  # Model that produced embedding_vector
         self.version = version
         self.parent_task_id = parent_task_id
         self.success_count = 0
@@ -103,10 +236,12 @@ class LearnedTask:
         }
     
     def save(self, db_path='automation.db'):
-        """Save task to database."""
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
+        """
+        Insert the task, or update its content columns if it exists.
         
+        The row keeps its id and created_at, and an existing row keeps its
+        execution counters, which the write-behind queue maintains.
+        """
         # Serialize complex fields
         steps_json = json.dumps(self.steps)
         tags_json = json.dumps(self.tags)
@@ -117,92 +252,346 @@ class LearnedTask:
             import numpy as np
             embedding_blob = self.embedding_vector.tobytes()
         
-        c.execute('''INSERT OR REPLACE INTO learned_tasks 
-                     (task_id, task_name, description, steps, playwright_code, tags, 
-                      embedding_vector, version, parent_task_id, success_count, 
-                      failure_count, last_executed, updated_at)
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                  (self.task_id, self.task_name, self.description, steps_json, 
-                   self.playwright_code, tags_json, embedding_blob, self.version,
-                   self.parent_task_id, self.success_count, self.failure_count,
-                   self.last_executed, datetime.now()))
-        
-        conn.commit()
-        conn.close()
+        with get_db(db_path).transaction() as conn:
+            conn.execute('''INSERT INTO learned_tasks 
+                            (task_id, task_name, description, steps, playwright_code, tags, 
+                             embedding_vector, version, parent_task_id, success_count, 
+                             failure_count, last_executed, updated_at, embedding_model)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            ON CONFLICT(task_id) DO UPDATE SET
+                                task_name=excluded.task_name,
+                                description=excluded.description,
+                                steps=excluded.steps,
+                                playwright_code=excluded.playwright_code,
+                                tags=excluded.tags,
+                                embedding_vector=excluded.embedding_vector,
+                                version=excluded.version,
+                                parent_task_id=excluded.parent_task_id,
+                                updated_at=excluded.updated_at,
+                                embedding_model=excluded.embedding_model''',
+                         (self.task_id, self.task_name, self.description, steps_json, 
+                          self.playwright_code, tags_json, embedding_blob, self.version,
+                          self.parent_task_id, self.success_count, self.failure_count,
+                          self.last_executed, datetime.now(),
+                          self.embedding_model if embedding_blob is not None else None))
+            
+            # Keep the tag index in step with the tags column
+            conn.execute('DELETE FROM task_tags WHERE task_id=?', (self.task_id,))
+            conn.executemany('INSERT INTO task_tags (task_id, tag) VALUES (?, ?)',
+                             [(self.task_id, tag) for tag in LearnedTask.normalize_tags(self.tags)])
+    
+    @staticmethod
+    def delete(task_id, db_path='automation.db'):
+        """Delete a task and its tag index rows."""
+        with get_db(db_path).transaction() as conn:
+            conn.execute('DELETE FROM task_tags WHERE task_id=?', (task_id,))
+            conn.execute('DELETE FROM learned_tasks WHERE task_id=?', (task_id,))
+    
+    @staticmethod
+    def normalize_tags(tags):
+        """Trimmed, lowercased, de-duplicated tags in their original order."""
+        seen = []
+        for tag in tags or []:
+            tag = str(tag).strip().lower()
+            if tag and tag not in seen:
+                seen.append(tag)
+        return seen
     
     @staticmethod
     def get_by_id(task_id, db_path='automation.db'):
         """Retrieve task by ID."""
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        c.execute('SELECT * FROM learned_tasks WHERE task_id=?', (task_id,))
-        row = c.fetchone()
-        conn.close()
+        columns = LearnedTask.DETAIL_COLUMNS
+        row = get_db(db_path).query_one(f'SELECT {", ".join(columns)} FROM learned_tasks WHERE task_id=?',
+                                        (task_id,))
         
         if not row:
             return None
         
-        return LearnedTask._from_row(row)
+        return LearnedTask._from_row(dict(zip(columns, row)))
+    
+    SUMMARY_COLUMNS = ('task_id', 'task_name', 'description', 'steps', 'tags', 'version',
+                       'parent_task_id', 'success_count', 'failure_count', 'last_executed',
+                       'created_at', 'updated_at')
+    DETAIL_COLUMNS = SUMMARY_COLUMNS + ('playwright_code', 'embedding_vector', 'embedding_model')
+    
+    @staticmethod
+    def get_many(task_ids, db_path='automation.db', include_code=False):
+        """
+        Retrieve several tasks in one query, in the order of ``task_ids``.
+        
+        The embedding BLOB is never loaded and ``playwright_code`` only when
+        ``include_code`` is set. Unknown IDs are skipped.
+        """
+        task_ids = list(task_ids)
+        if not task_ids:
+            return []
+        
+        columns = list(LearnedTask.SUMMARY_COLUMNS)
+        if include_code:
+            columns.append('playwright_code')
+        
+        placeholders = ','.join('?' * len(task_ids))
+        rows = get_db(db_path).query(
+            f'SELECT {", ".join(columns)} FROM learned_tasks WHERE task_id IN ({placeholders})', task_ids
+        )
+        
+        by_id = {}
+        for row in rows:
+            task = LearnedTask._from_summary_row(dict(zip(columns, row)))
+            by_id[task.task_id] = task
+        return [by_id[task_id] for task_id in task_ids if task_id in by_id]
     
     @staticmethod
     def get_all(db_path='automation.db', limit=100):
         """Retrieve all tasks."""
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        c.execute('SELECT * FROM learned_tasks ORDER BY created_at DESC LIMIT ?', (limit,))
-        rows = c.fetchall()
-        conn.close()
+        columns = LearnedTask.DETAIL_COLUMNS
+        rows = get_db(db_path).query(f'SELECT {", ".join(columns)} FROM learned_tasks ORDER BY created_at DESC LIMIT ?',
+                                     (limit,))
         
-        return [LearnedTask._from_row(row) for row in rows]
+        return [LearnedTask._from_row(dict(zip(columns, row))) for row in rows]
     
     @staticmethod
-    def search_by_tags(tags, db_path='automation.db'):
-        """Search tasks by tags."""
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
+    def list_page(tags=None, match='any', since=None, until=None, limit=50, cursor=None,
+                  db_path='automation.db'):
+        """
+        A page of task summaries (no code or embedding), newest first, and the next cursor.
         
-        # Simple tag search - checks if any tag is present in the tags JSON
-        tasks = []
-        c.execute('SELECT * FROM learned_tasks')
-        rows = c.fetchall()
+        Optionally narrowed to tasks carrying ``tags`` and created in [since, until).
+        """
+        where, params = [], []
+        if LearnedTask.normalize_tags(tags):
+            subquery, tag_params = LearnedTask._tag_filter(tags, match)
+            where.append(f'task_id IN ({subquery})')
+            params.extend(tag_params)
+        if since:
+            where.append('created_at >= ?')
+            params.append(timestamp_param(since))
+        if until:
+            where.append('created_at < ?')
+            params.append(timestamp_param(until))
         
-        for row in rows:
-            task_tags = json.loads(row[6]) if row[6] else []
-            if any(tag in task_tags for tag in tags):
-                tasks.append(LearnedTask._from_row(row))
+        rows, next_cursor = keyset_page('learned_tasks', LearnedTask.SUMMARY_COLUMNS, where, params,
+                                        limit, cursor, db_path)
+        return [LearnedTask._from_summary_row(row) for row in rows], next_cursor
+    
+    @staticmethod
+    def get_totals(db_path='automation.db'):
+        """Task count and summed run counters across the whole library."""
+        total, successes, failures = get_db(db_path).query_one(
+            'SELECT COUNT(*), COALESCE(SUM(success_count), 0), COALESCE(SUM(failure_count), 0) FROM learned_tasks'
+        )
+        return {'total_tasks': total, 'success_count': successes, 'failure_count': failures}
+    
+    @staticmethod
+    def get_index_fields(db_path='automation.db'):
+        """Fetch only the fields used to build search text, for every task."""
+        rows = get_db(db_path).query('SELECT task_id, task_name, description, tags FROM learned_tasks ORDER BY id')
         
-        conn.close()
-        return tasks
+        return [{
+            'task_id': row[0],
+            'task_name': row[1],
+            'description': row[2] or '',
+            'tags': json.loads(row[3]) if row[3] else []
+        } for row in rows]
     
     @staticmethod
-    def _from_row(row):
-        """Create LearnedTask from database row."""
+    def bulk_update_embeddings(embeddings, db_path='automation.db', model=None):
+        """Store many (task_id, embedding) pairs from ``model`` in one transaction."""
+        get_db(db_path).executemany(
+            'UPDATE learned_tasks SET embedding_vector=?, embedding_model=? WHERE task_id=?',
+            [(embedding.astype('float32').tobytes(), model, task_id) for task_id, embedding in embeddings]
+        )
+    
+    @staticmethod
+    def get_stored_embeddings(model, dimension, db_path='automation.db'):
+        """
+        Stored vectors usable by ``model``, as (task_ids, float32 matrix of shape (n, dimension)).
+        
+        BLOBs of the wrong size or from another model are skipped. Vectors saved
+        before the model was recorded are accepted when their size matches.
+        """
         import numpy as np
         
-        task = LearnedTask(
-            task_id=row[1],
-            task_name=row[2],
-            description=row[3],
-            steps=json.loads(row[4]) if row[4] else [],
-            playwright_code=row[5],
-            tags=json.loads(row[6]) if row[6] else [],
-            version=row[8],
-            parent_task_id=row[9]
+        rows = get_db(db_path).query(
+            '''SELECT task_id, embedding_vector FROM learned_tasks
+               WHERE length(embedding_vector) = ? AND (embedding_model = ? OR embedding_model IS NULL)
+               ORDER BY id''',
+            (dimension * 4, model)
         )
+        if not rows:
+            return [], np.zeros((0, dimension), dtype=np.float32)
+        # One copy for the whole matrix instead of one array per row
+        matrix = np.frombuffer(b''.join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), dimension)
+        return [row[0] for row in rows], matrix
+    
+    @staticmethod
+    def _tag_filter(tags, match):
+        """SQL selecting task_ids that carry any (or, for match='all', every) tag."""
+        tags = LearnedTask.normalize_tags(tags)
+        placeholders = ','.join('?' * len(tags))
+        if match == 'all':
+            return (f'SELECT task_id FROM task_tags WHERE tag IN ({placeholders}) '
+                    f'GROUP BY task_id HAVING COUNT(*) = ?', tags + [len(tags)])
+        return f'SELECT task_id FROM task_tags WHERE tag IN ({placeholders})', tags
+    
+    @staticmethod
+    def search_by_tags(tags, db_path='automation.db', match='any', limit=None, offset=0):
+        """
+        Search tasks by tags using the task_tags index.
+        
+        ``match`` is 'any' (OR) or 'all' (AND). Results are newest first and
+        never load the embedding or code columns.
+        """
+        if not LearnedTask.normalize_tags(tags):
+            return []
+        
+        subquery, params = LearnedTask._tag_filter(tags, match)
+        sql = (f'SELECT {", ".join(LearnedTask.SUMMARY_COLUMNS)} FROM learned_tasks '
+               f'WHERE task_id IN ({subquery}) ORDER BY created_at DESC, id DESC')
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params = params + [limit, offset]
+        
+        rows = get_db(db_path).query(sql, params)
+        return [LearnedTask._from_summary_row(dict(zip(LearnedTask.SUMMARY_COLUMNS, row))) for row in rows]
+    
+    @staticmethod
+    def count_by_tags(tags, db_path='automation.db', match='any'):
+        """Number of tasks search_by_tags would return without paging."""
+        if not LearnedTask.normalize_tags(tags):
+            return 0
+        subquery, params = LearnedTask._tag_filter(tags, match)
+        return get_db(db_path).query_one(f'SELECT COUNT(*) FROM ({subquery})', params)[0]
+    
+    @staticmethod
+    def tag_facets(tags=None, db_path='automation.db', match='any', limit=50):
+        """
+        Tag counts as (tag, count) pairs, most common first.
+        
+        When ``tags`` is given, counts cover only the tasks matching that filter.
+        """
+        if LearnedTask.normalize_tags(tags):
+            subquery, params = LearnedTask._tag_filter(tags, match)
+            sql = f'SELECT tag, COUNT(*) FROM task_tags WHERE task_id IN ({subquery}) GROUP BY tag'
+        else:
+            sql, params = 'SELECT tag, COUNT(*) FROM task_tags GROUP BY tag', []
+        sql += ' ORDER BY COUNT(*) DESC, tag LIMIT ?'
+        return [(tag, count) for tag, count in get_db(db_path).query(sql, params + [limit])]
+    
+    @staticmethod
+    def keyword_search(query, limit=20, db_path='automation.db'):
+        """
+        BM25 keyword search over name, description, steps and code.
+        
+        Returns (task_id, score) pairs, best first; higher scores are better.
+        Any query word may match, with name and description weighted highest.
+        """
+        words = re.findall(r'\w+', query.lower())
+        if not words:
+            return []
+        match = ' OR '.join(f'"{word}"' for word in dict.fromkeys(words))
+        try:
+            rows = get_db(db_path).query(
+                '''SELECT t.task_id, -bm25(learned_tasks_fts, 10.0, 5.0, 2.0, 1.0) AS score
+                   FROM learned_tasks_fts JOIN learned_tasks t ON t.id = learned_tasks_fts.rowid
+                   WHERE learned_tasks_fts MATCH ? ORDER BY score DESC LIMIT ?''',
+                (match, limit)
+            )
+        except sqlite3.OperationalError as e:
+            print(f"Keyword search failed: {e}")
+            return []
+        return [(task_id, float(score)) for task_id, score in rows]
+    
+    @staticmethod
+    def _from_row(row):
+        """Create LearnedTask from a ``DETAIL_COLUMNS`` row keyed by column name."""
+        import numpy as np
+        
+        task = LearnedTask._from_summary_row(row)
         
         # Deserialize embedding vector
-        if row[7]:
-            task.embedding_vector = np.frombuffer(row[7], dtype=np.float32)
+        if row['embedding_vector']:
+            task.embedding_vector = np.frombuffer(row['embedding_vector'], dtype=np.float32)
+            task.embedding_model = row['embedding_model']
         
-        task.success_count = row[10] or 0
-        task.failure_count = row[11] or 0
-        task.last_executed = datetime.fromisoformat(row[12]) if row[12] else None
-        task.created_at = datetime.fromisoformat(row[13]) if row[13] else datetime.now()
-        task.updated_at = datetime.fromisoformat(row[14]) if row[14] else datetime.now()
+        return task
+    
+    @staticmethod
+    def _from_summary_row(row):
+        """Create LearnedTask from a column-name keyed projection."""
+        task = LearnedTask(
+            task_id=row['task_id'],
+            task_name=row['task_name'],
+            description=row['description'],
+            steps=json.loads(row['steps']) if row['steps'] else [],
+            playwright_code=row.get('playwright_code'),
+            tags=json.loads(row['tags']) if row['tags'] else [],
+            version=row['version'],
+            parent_task_id=row['parent_task_id']
+        )
+        task.success_count = row['success_count'] or 0
+        task.failure_count = row['failure_count'] or 0
+        task.last_executed = datetime.fromisoformat(row['last_executed']) if row['last_executed'] else None
+        task.created_at = datetime.fromisoformat(row['created_at']) if row['created_at'] else datetime.now()
+        task.updated_at = datetime.fromisoformat(row['updated_at']) if row['updated_at'] else datetime.now()
         
         return task
 
 
+class ExecutionHistory:
+    """Reads of ``test_history``; rows are written by the execution paths in app.py."""
+    
+    SUMMARY_COLUMNS = ('id', 'command', 'browser', 'mode', 'execution_location', 'status',
+                       'screenshot_path', 'created_at')
+    DETAIL_COLUMNS = SUMMARY_COLUMNS + ('generated_code', 'healed_code', 'logs')
+    FILTERS = ('status', 'browser', 'mode', 'execution_location')
+    
+    @staticmethod
+    def list_page(filters=None, since=None, until=None, limit=50, cursor=None, db_path='automation.db'):
+        """
+        A page of run summaries, newest first, and the next cursor.
+        
+        ``filters`` maps FILTERS columns to required values; code and logs are
+        left to ``get``.
+        """
+        where, params = [], []
+        for column, value in (filters or {}).items():
+            if column not in ExecutionHistory.FILTERS:
+                raise ValueError(f"Unknown filter: {column}")
+            where.append(f'{column} = ?')
+            params.append(value)
+        if since:
+            where.append('created_at >= ?')
+            params.append(timestamp_param(since))
+        if until:
+            where.append('created_at < ?')
+            params.append(timestamp_param(until))
+        
+        return keyset_page('test_history', ExecutionHistory.SUMMARY_COLUMNS, where, params,
+                           limit, cursor, db_path)
+    
+    @staticmethod
+    def get(test_id, db_path='automation.db'):
+        """Full record of one run, or None."""
+        columns = ExecutionHistory.DETAIL_COLUMNS
+        row = get_db(db_path).query_one(f'SELECT {", ".join(columns)} FROM test_history WHERE id=?', (test_id,))
+        return dict(zip(columns, row)) if row else None
+    
+    @staticmethod
+    def screenshot_paths(db_path='automation.db'):
+        """Every screenshot path still referenced by a run."""
+        rows = get_db(db_path).query('SELECT DISTINCT screenshot_path FROM test_history WHERE screenshot_path IS NOT NULL')
+        return [row[0] for row in rows]
+    
+    @staticmethod
+    def expire_screenshots(before, db_path='automation.db'):
+        """Drop the screenshot reference of runs created before ``before``; returns the count."""
+        return get_db(db_path).execute(
+            'UPDATE test_history SET screenshot_path = NULL WHERE screenshot_path IS NOT NULL AND created_at < ?',
+            (before.strftime('%Y-%m-%d %H:%M:%S'),)
+        ).rowcount
+
+
 class TaskExecution:
     """Model for task execution record."""
     
@@ -216,14 +605,8 @@ class TaskExecution:
     
     def save(self, db_path='automation.db'):
         """Save execution record to database."""
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        
-        c.execute('''INSERT INTO task_executions 
-                     (task_id, execution_result, success, error_message, execution_time_ms)
-                     VALUES (?, ?, ?, ?, ?)''',
-                  (self.task_id, self.execution_result, self.success, 
-                   self.error_message, self.execution_time_ms))
-        
-        conn.commit()
-        conn.close()
+        get_db(db_path).execute('''INSERT INTO task_executions 
+                                   (task_id, execution_result, success, error_message, execution_time_ms)
+                                   VALUES (?, ?, ?, ?, ?)''',
+                                (self.task_id, self.execution_result, self.success, 
+                                 self.error_message, self.execution_time_ms))
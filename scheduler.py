@@ -0,0 +1,200 @@
+import bisect
+import itertools
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+
+PRIORITIES = {
+    'interactive': 0,
+    'batch': 10,
+}
+
+
+class QueueFullError(Exception):
+    """Raised when the execution queue cannot accept another job."""
+
+    def __init__(self, queue_length, retry_after=5):
+        super().__init__(f"Execution queue is full ({queue_length} jobs waiting)")
+        self.queue_length = queue_length
+        self.retry_after = retry_after
+
+
+class ExecutionJob:
+    """A queued unit of work bound to one concurrency slot (browser type or agent)."""
+
+    def __init__(self, seq, test_id, slot, priority, fn, args, on_error=None):
+        self.seq = seq
+        self.test_id = test_id
+        self.slot = slot
+        self.priority = priority
+        self.fn = fn
+        self.args = args
+        self.on_error = on_error
+        self.enqueued_at = time.time()
+        self.started_at = None
+
+    def sort_key(self):
+        return (self.priority, self.seq)
+
+    def __lt__(self, other):
+        return self.sort_key() < other.sort_key()
+
+
+class ExecutionScheduler:
+    """
+    Bounded, priority-ordered admission control for test executions.
+
+    Jobs wait in a single queue ordered by (priority, arrival) and are started as
+    background tasks once their slot has capacity. Each slot - a browser type for
+    server runs, or ``agent`` for agent-coordinated runs - has its own concurrency
+    limit, so a burst of firefox jobs cannot starve chromium ones. Queue positions
+    are pushed to clients via the ``queue_position`` Socket.IO event. A job that
+    raises is reported to its ``on_error(test_id, error)`` callback, which defaults
+    to the scheduler's ``on_error``.
+    """
+
+    def __init__(self, socketio, max_queue_size=50, default_concurrency=2,
+                 concurrency_limits: Optional[Dict[str, int]] = None, on_error=None):
+        self.socketio = socketio
+        self.on_error = on_error
+        self.max_queue_size = max_queue_size
+        self.default_concurrency = default_concurrency
+        self.concurrency_limits = concurrency_limits or {}
+
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._waiting = []  # Sorted by (priority, seq)
+        self._running: Dict[str, int] = {}
+
+        self.stats = {
+            'submitted': 0,
+            'started': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'total_wait_ms': 0,
+        }
+
+    @classmethod
+    def from_env(cls, socketio):
+        """Build a scheduler from EXECUTION_* environment variables."""
+        limits = {}
+        for slot in ('chromium', 'firefox', 'webkit', 'agent'):
+            value = os.environ.get(f'EXECUTION_CONCURRENCY_{slot.upper()}')
+            if value:
+                limits[slot] = int(value)
+        return cls(
+            socketio,
+            max_queue_size=int(os.environ.get('EXECUTION_QUEUE_SIZE', 50)),
+            default_concurrency=int(os.environ.get('EXECUTION_CONCURRENCY', 2)),
+            concurrency_limits=limits,
+        )
+
+    def limit_for(self, slot):
+        limit = self.concurrency_limits.get(slot, self.default_concurrency)
+        # A callable limit follows capacity that changes at runtime (e.g. connected agents)
+        return limit() if callable(limit) else limit
+
+    def is_full(self):
+        with self._lock:
+            return len(self._waiting) >= self.max_queue_size
+
+    def submit(self, test_id, slot, fn, *args, priority='interactive', on_error=None):
+        """
+        Queue ``fn(*args)`` for execution; ``on_error`` overrides the scheduler's.
+
+        Returns the job's queue position (0 when it started immediately).
+        Raises QueueFullError when the queue is at capacity.
+        """
+        with self._lock:
+            if len(self._waiting) >= self.max_queue_size:
+                self.stats['rejected'] += 1
+                raise QueueFullError(len(self._waiting))
+
+            job = ExecutionJob(next(self._seq), test_id, slot,
+                               PRIORITIES.get(priority, PRIORITIES['interactive']), fn, args,
+                               on_error or self.on_error)
+            bisect.insort(self._waiting, job)
+            self.stats['submitted'] += 1
+            started = self._dispatch_locked()
+            position = self._position_locked(job)
+
+        self._start(started)
+        self._emit_positions()
+        return position
+
+    def dispatch(self):
+        """Start waiting jobs after a slot's capacity grew."""
+        with self._lock:
+            started = self._dispatch_locked()
+        self._start(started)
+        if started:
+            self._emit_positions()
+
+    def _dispatch_locked(self):
+        """Pop every waiting job whose slot has capacity. Caller holds the lock."""
+        started = []
+        for job in list(self._waiting):
+            if self._running.get(job.slot, 0) < self.limit_for(job.slot):
+                self._waiting.remove(job)
+                self._running[job.slot] = self._running.get(job.slot, 0) + 1
+                job.started_at = time.time()
+                self.stats['started'] += 1
+                self.stats['total_wait_ms'] += int((job.started_at - job.enqueued_at) * 1000)
+                started.append(job)
+        return started
+
+    def _position_locked(self, job):
+        try:
+            return self._waiting.index(job) + 1
+        except ValueError:
+            return 0
+
+    def _start(self, jobs):
+        for job in jobs:
+            self.socketio.start_background_task(self._run, job)
+
+    def _run(self, job):
+        try:
+            job.fn(*job.args)
+        except Exception as e:
+            print(f"Execution job for test {job.test_id} failed: {e}")
+            with self._lock:
+                self.stats['failed'] += 1
+            if job.on_error:
+                try:
+                    job.on_error(job.test_id, e)
+                except Exception as handler_error:
+                    print(f"Error handler for test {job.test_id} failed: {handler_error}")
+        finally:
+            with self._lock:
+                self._running[job.slot] -= 1
+                self.stats['completed'] += 1
+                started = self._dispatch_locked()
+            self._start(started)
+            if started:
+                self._emit_positions()
+
+    def _emit_positions(self):
+        with self._lock:
+            waiting = list(self._waiting)
+        for position, job in enumerate(waiting, start=1):
+            self.socketio.emit('queue_position', {
+                'test_id': job.test_id,
+                'position': position,
+                'queue_length': len(waiting)
+            })
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['queued'] = len(self._waiting)
+            stats['running'] = dict(self._running)
+            stats['max_queue_size'] = self.max_queue_size
+            stats['limits'] = {slot: self.limit_for(slot) for slot in
+                               set(self._running) | set(self.concurrency_limits)}
+        started = stats['started']
+        stats['avg_wait_ms'] = int(stats['total_wait_ms'] / started) if started else 0
+        return stats
@@ -0,0 +1,88 @@
+"""
+Recall vs. latency benchmark for the vector index types.
+
+Generates clustered synthetic vectors, uses an exact flat index as ground
+truth, and reports recall@k, per-query latency, build time and index size for
+HNSW at several efSearch values and IVF-PQ at several nprobe values.
+
+    python vector_benchmark.py --n 50000 --dim 512 --queries 500 --k 5
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from vector_store import DEFAULT_INDEX_PARAMS, apply_search_params, build_faiss_index, normalize_vectors
+
+
+def synthetic_vectors(n, dim, clusters=100, seed=0):
+    """Normalized Gaussian clusters, which are closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype('float32')
+    labels = rng.integers(0, clusters, size=n)
+    return normalize_vectors(centers[labels] + 0.3 * rng.normal(size=(n, dim)).astype('float32'))
+
+
+def index_size_mb(index):
+    return len(faiss.serialize_index(index)) / (1024 * 1024)
+
+
+def timed_search(index, queries, k):
+    started = time.perf_counter()
+    _, labels = index.search(queries, k)
+    return labels, (time.perf_counter() - started) * 1000 / len(queries)
+
+
+def recall_at_k(labels, truth):
+    k = truth.shape[1]
+    return float(np.mean([len(set(row) & set(expected)) / k for row, expected in zip(labels, truth)]))
+
+
+def build(index_type, data, ids, params):
+    started = time.perf_counter()
+    index = build_faiss_index(index_type, data.shape[1], params,
+                              training_vectors=data if index_type == 'ivfpq' else None)
+    index.add_with_ids(data, ids)
+    return index, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--n', type=int, default=20000, help='Number of indexed vectors')
+    parser.add_argument('--dim', type=int, default=512, help='Vector dimension')
+    parser.add_argument('--queries', type=int, default=200, help='Number of queries')
+    parser.add_argument('--k', type=int, default=5, help='Neighbours per query')
+    parser.add_argument('--ef-search', type=int, nargs='+', default=[16, 32, 64, 128, 256])
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--threads', type=int, default=1, help='FAISS OpenMP threads')
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    data = synthetic_vectors(args.n + args.queries, args.dim)
+    data, queries = data[:args.n], data[args.n:]
+    ids = np.arange(1, args.n + 1, dtype='int64')
+
+    print(f"{args.n} vectors x {args.dim} dims, {args.queries} queries, k={args.k}\n")
+    print(f"{'index':<22}{'recall@k':>10}{'ms/query':>10}{'build s':>10}{'size MB':>10}")
+
+    flat, flat_build = build('flat', data, ids, {})
+    truth, flat_ms = timed_search(flat, queries, args.k)
+    print(f"{'flat (exact)':<22}{1.0:>10.3f}{flat_ms:>10.3f}{flat_build:>10.2f}{index_size_mb(flat):>10.1f}")
+
+    runs = [('hnsw', 'ef_search', value) for value in args.ef_search] + \
+           [('ivfpq', 'nprobe', value) for value in args.nprobe]
+    built = {}
+    for index_type, knob, value in runs:
+        if index_type not in built:
+            built[index_type] = build(index_type, data, ids, {})
+        index, build_s = built[index_type]
+        apply_search_params(index, index_type, {**DEFAULT_INDEX_PARAMS, knob: value})
+        labels, ms = timed_search(index, queries, args.k)
+        label = f"{index_type} {knob}={value}"
+        print(f"{label:<22}{recall_at_k(labels, truth):>10.3f}{ms:>10.3f}{build_s:>10.2f}"
+              f"{index_size_mb(index):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,188 +1,759 @@
 import numpy as np
 import faiss
+import atexit
 import json
 import os
-from typing import List, Dict, Tuple, Optional
-from openai import OpenAI
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, List, Dict, Tuple, Optional
+
+from embedding_backends import EmbeddingBackend, OpenAIEmbeddingBackend, create_embedding_backend
+from embedding_cache import EmbeddingCache
+
+try:
+    import fcntl
+except ImportError:  # Windows: shared mode falls back to in-process locking
+    fcntl = None
+
+
+# ---------------- Index types ----------------
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivfpq')
+
+DEFAULT_INDEX_PARAMS = {
+    'hnsw_m': 32,            # HNSW graph degree
+    'ef_construction': 80,   # HNSW build-time candidate list
+    'ef_search': 64,         # HNSW query-time candidate list
+    'nlist': None,           # IVF cells (default: about 4 * sqrt(n))
+    'pq_m': None,            # PQ sub-quantizers (default: largest divisor of dim <= 64)
+    'nprobe': 16,            # IVF cells visited per query
+}
+
+
+def index_options_from_env() -> Dict:
+    """Read VECTOR_INDEX_TYPE, VECTOR_INDEX_SHARED and VECTOR_* tuning parameters from the environment."""
+    params = {}
+    for name in DEFAULT_INDEX_PARAMS:
+        value = os.environ.get(f'VECTOR_{name.upper()}')
+        if value:
+            params[name] = int(value)
+    return {
+        'index_type': os.environ.get('VECTOR_INDEX_TYPE', 'flat').lower(),
+        'index_params': params,
+        'shared': os.environ.get('VECTOR_INDEX_SHARED', 'false').lower() in ('1', 'true', 'yes'),
+    }
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def ivf_training_size(dimension: int, n_vectors: int, params: Dict) -> Tuple[int, int, int]:
+    """(nlist, pq_m, minimum training vectors) for an IVF-PQ index over ``n_vectors``."""
+    nlist = params.get('nlist') or max(1, min(4 * int(np.sqrt(max(n_vectors, 1))), n_vectors // 39 or 1))
+    pq_m = params.get('pq_m') or _pq_subquantizers(dimension)
+    # k-means wants ~39 points per centroid: nlist coarse centroids, 256 per 8-bit PQ codebook
+    return nlist, pq_m, 39 * max(nlist, 256)
+
+
+def last_occurrences(task_ids: List[str], vectors: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    """Drop repeated task_ids from a batch, keeping each one's last vector."""
+    last_row = {task_id: row for row, task_id in enumerate(task_ids)}
+    if len(last_row) == len(task_ids):
+        return list(task_ids), vectors
+    return list(last_row), vectors[list(last_row.values())]
+
+
+def normalize_vectors(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalized float32 copy, so inner product equals cosine similarity."""
+    vectors = np.array(vectors, dtype='float32', copy=True).reshape(-1, vectors.shape[-1])
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def build_faiss_index(index_type: str, dimension: int, params: Optional[Dict] = None,
+                      training_vectors: Optional[np.ndarray] = None):
+    """
+    Create an empty inner-product FAISS index that accepts ``add_with_ids``.
+    
+    ``flat`` and ``hnsw`` are wrapped in ``IndexIDMap2``. ``ivfpq`` is trained on
+    ``training_vectors`` and keeps ids itself, with a hashtable direct map so ids
+    can be removed and reconstructed.
+    """
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    if index_type == 'flat':
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+    if index_type == 'hnsw':
+        hnsw = faiss.IndexHNSWFlat(dimension, params['hnsw_m'], faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = params['ef_construction']
+        return faiss.IndexIDMap2(hnsw)
+    if index_type == 'ivfpq':
+        if training_vectors is None:
+            raise ValueError("IVF-PQ indexes need training vectors")
+        nlist, pq_m, _ = ivf_training_size(dimension, len(training_vectors), params)
+        index = faiss.IndexIVFPQ(faiss.IndexFlatIP(dimension), dimension, nlist, pq_m, 8,
+                                 faiss.METRIC_INNER_PRODUCT)
+        index.train(np.ascontiguousarray(training_vectors, dtype='float32'))
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+    raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+
+def apply_search_params(index, index_type: str, params: Optional[Dict] = None):
+    """Set efSearch (HNSW) or nprobe (IVF) on a built index."""
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    if index_type == 'hnsw':
+        faiss.downcast_index(index.index).hnsw.efSearch = params['ef_search']
+    elif index_type == 'ivfpq':
+        faiss.extract_index_ivf(index).nprobe = params['nprobe']
 
 
 class VectorStore:
-    """Vector store for semantic search using FAISS."""
+    """
+    Vector store for semantic search using FAISS.
+    
+    Vectors live in an ``IndexIDMap2`` keyed by a stable integer per task_id, so
+    updates and deletes use ``remove_ids``/``add_with_ids`` instead of rebuilding
+    the index. The metadata file maps task_ids to those integer ids.
+    
+    Persistence is batched: mutations only mark the store dirty and a background
+    timer flushes every ``flush_interval`` seconds (``flush()`` can be called
+    explicitly, and the store flushes at interpreter exit). ``flush_interval=0``
+    writes through on every change. Files are written to a temp path and renamed
+    into place, and the index/metadata pair is cross-checked on load.
+    
+    The metadata records which embedding model built the index. An index from a
+    different model (or dimension) is discarded on load and ``rebuild_required``
+    is set so the caller can reindex.
+    
+    Vectors are L2-normalized on the way in and searched by inner product, so
+    search scores are cosine similarities. Indexes saved with the older L2
+    metric are converted on load.
+    
+    ``index_type`` selects exact search (``flat``) or an approximate index:
+    ``hnsw`` (graph, no training) or ``ivfpq`` (inverted lists with product
+    quantization; needs training, so it is only built by ``rebuild()`` once
+    there are enough vectors). The type on disk is used until ``rebuild()`` is
+    called. HNSW cannot remove vectors, so deletes and updates leave tombstones
+    that are skipped at query time and dropped by the next rebuild.
+    
+    Each save writes a new snapshot ``<index_path>.<generation>`` and then the
+    metadata naming it, so a snapshot is never modified once published. With
+    ``shared=True`` (several worker processes on one index) the snapshot is
+    memory-mapped read-only, so workers share page cache instead of each
+    holding a copy; ``refresh()`` stats the metadata file and remaps only when
+    another process published a newer generation. Writes take a file lock,
+    apply the change to a private copy of the latest snapshot and publish it
+    immediately.
+    """
+    
+    METADATA_VERSION = 4
+    METRIC = 'cosine'
+    SNAPSHOTS_KEPT = 3  # Readers may still be mapping the previous generations
+    
+    # Model that produced indexes saved before the model id was recorded
+    LEGACY_MODEL_ID = 'text-embedding-3-small'
     
     def __init__(self, dimension=1536, index_path='vector_index.faiss', 
-                 metadata_path='vector_metadata.json'):
+                 metadata_path='vector_metadata.json', flush_interval: float = 5.0,
+                 model_id: Optional[str] = None, index_type: str = 'flat',
+                 index_params: Optional[Dict] = None, shared: bool = False):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
         self.dimension = dimension  # OpenAI embeddings are 1536 dimensions
+        self.model_id = model_id or self.LEGACY_MODEL_ID
+        self.rebuild_required = False  # Set when the saved index came from another model
+        self.target_index_type = index_type  # Type used by rebuild()
+        self.index_type = 'flat'  # Type of the index currently loaded
+        self.index_params = {**DEFAULT_INDEX_PARAMS, **(index_params or {})}
         self.index_path = index_path
         self.metadata_path = metadata_path
         self.index = None
-        self.metadata = []  # Store task_ids corresponding to each vector
+        self.id_map: Dict[str, int] = {}  # task_id -> FAISS id
+        self.task_ids: Dict[int, str] = {}  # FAISS id -> task_id
+        self.next_id = 1
+        self.flush_interval = 0 if shared else flush_interval  # Shared stores write through
+        self.shared = shared
+        self.generation = 0  # Snapshot currently loaded
+        self.missing_task_ids: List[str] = []  # Dropped on load: metadata without a vector
+        
+        self._lock = threading.RLock()
+        self._mapped = False
+        self._metadata_signature = None
+        self._file_lock_depth = 0
+        self._dirty = False
+        self._stop_flusher = threading.Event()
+        self._flusher = None
         
         # Initialize or load index
         self._load_or_create_index()
+        
+        if self.flush_interval:
+            self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+            self._flusher.start()
+        atexit.register(self.close)
+    
+    def _new_index(self):
+        """Empty index of the target type; IVF-PQ starts flat until there is data to train on."""
+        self.index_type = 'hnsw' if self.target_index_type == 'hnsw' else 'flat'
+        index = build_faiss_index(self.index_type, self.dimension, self.index_params)
+        apply_search_params(index, self.index_type, self.index_params)
+        return index
+    
+    @property
+    def supports_remove(self) -> bool:
+        return self.index_type != 'hnsw'
+    
+    def _index_ids(self) -> np.ndarray:
+        """Every id stored in the FAISS index, including HNSW tombstones."""
+        if self.index_type == 'ivfpq':
+            invlists = self.index.invlists
+            lists = [faiss.rev_swig_ptr(invlists.get_ids(i), invlists.list_size(i)).copy()
+                     for i in range(self.index.nlist) if invlists.list_size(i)]
+            return np.concatenate(lists) if lists else np.array([], dtype='int64')
+        return faiss.vector_to_array(self.index.id_map)
+    
+    @property
+    def tombstones(self) -> int:
+        return self.index.ntotal - len(self.id_map)
     
     def _load_or_create_index(self):
         """Load existing index or create a new one."""
-        if os.path.exists(self.index_path) and os.path.exists(self.metadata_path):
-            print(f"Loading existing vector index from {self.index_path}")
-            self.index = faiss.read_index(self.index_path)
-            with open(self.metadata_path, 'r') as f:
-                self.metadata = json.load(f)
+        with self._file_lock():
+            self._load_or_create_locked()
+            if self.shared:
+                if not self.generation:
+                    self._save_index()  # Publish a snapshot to map
+                self._load_snapshot()
+    
+    def _load_or_create_locked(self):
+        metadata = self._read_metadata()[0] if os.path.exists(self.metadata_path) else None
+        index_file = self._index_file(metadata) if metadata is not None else None
+        if index_file and os.path.exists(index_file):
+            print(f"Loading existing vector index from {index_file}")
+            index = faiss.read_index(index_file)
+            if isinstance(metadata, dict):
+                self.generation = metadata.get('generation', 0)
+            
+            saved_model = self.LEGACY_MODEL_ID if isinstance(metadata, list) else \
+                metadata.get('model_id', self.LEGACY_MODEL_ID)
+            if saved_model != self.model_id or index.d != self.dimension:
+                print(f"⚠️ Vector index was built with {saved_model} ({index.d} dims), "
+                      f"now using {self.model_id} ({self.dimension} dims). Starting a new index; "
+                      f"tasks need reindexing.")
+                self.index = self._new_index()
+                self._set_id_map({})
+                self.rebuild_required = True
+                self._save_index()
+            elif isinstance(metadata, list):
+                self._migrate_legacy_index(index, metadata)
+            else:
+                self.index = index
+                self.index_type = metadata.get('index_type', 'flat')
+                apply_search_params(self.index, self.index_type, self.index_params)
+                if self.index_type != self.target_index_type:
+                    print(f"Vector index on disk is '{self.index_type}'; "
+                          f"rebuild it to switch to '{self.target_index_type}'")
+                self._set_id_map(metadata['ids'])
+                self.next_id = metadata.get('next_id', max(self.task_ids, default=0) + 1)
+                self._check_consistency()
+                if metadata.get('metric') != self.METRIC:
+                    self._migrate_to_cosine()
         else:
             print("Creating new vector index")
-            # Using IndexFlatL2 for simplicity - cosine similarity index
-            self.index = faiss.IndexFlatL2(self.dimension)
-            self.metadata = []
+            self.index = self._new_index()
+            self._set_id_map({})
             self._save_index()
     
+    def _check_consistency(self):
+        """
+        Reconcile the index with the metadata after an interrupted write.
+        
+        Vectors whose id is not in the metadata are removed; metadata entries
+        without a vector are dropped and listed in ``missing_task_ids`` so the
+        caller can re-index them.
+        """
+        index_ids = set(int(i) for i in self._index_ids())
+        known_ids = set(self.task_ids)
+        orphaned = index_ids - known_ids
+        missing = known_ids - index_ids
+        if not self.supports_remove:
+            orphaned = set()  # HNSW tombstones are expected
+        if not orphaned and not missing:
+            return
+        
+        print(f"⚠️ Vector index and metadata disagree: {len(orphaned)} orphaned vectors, "
+              f"{len(missing)} task_ids without vectors. Repairing.")
+        
+        if orphaned:
+            self.index.remove_ids(np.array(sorted(orphaned), dtype='int64'))
+        self.missing_task_ids = [self.task_ids[faiss_id] for faiss_id in missing]
+        for task_id in self.missing_task_ids:
+            self.task_ids.pop(self.id_map.pop(task_id))
+        if index_ids:
+            self.next_id = max(self.next_id, max(index_ids) + 1)
+        self._save_index()
+    
+    def _migrate_legacy_index(self, legacy_index, legacy_metadata: List[str]):
+        """
+        Convert the positional layout (IndexFlatL2 + list of task_ids) to the
+        ID-mapped layout. Duplicate rows left by old updates keep the newest vector.
+        """
+        print(f"Migrating legacy vector index ({legacy_index.ntotal} vectors) to ID-mapped layout")
+        latest_row = {}
+        for row, task_id in enumerate(legacy_metadata[:legacy_index.ntotal]):
+            latest_row[task_id] = row
+        
+        vectors = legacy_index.reconstruct_n(0, legacy_index.ntotal) if latest_row else \
+            np.zeros((0, self.dimension), dtype='float32')
+        # The legacy layout was always flat; switching type is left to an explicit rebuild()
+        self._rebuild_locked('flat', list(latest_row), vectors[list(latest_row.values())])
+        print(f"✅ Migrated {len(latest_row)} vectors")
+    
+    def _migrate_to_cosine(self):
+        """Re-add the vectors of an L2 index, normalized, to an inner-product index of the same type."""
+        print(f"Converting vector index ({len(self.id_map)} vectors) from L2 distance to cosine similarity")
+        task_ids, vectors = self.get_vectors()
+        self._rebuild_locked(self.index_type, task_ids, vectors)
+    
+    # ---------------- Snapshots ----------------
+    
+    def _snapshot_path(self, generation: int) -> str:
+        return f"{self.index_path}.{generation}"
+    
+    def _index_file(self, metadata) -> str:
+        """Snapshot named by the metadata; older layouts kept the index at ``index_path``."""
+        generation = metadata.get('generation') if isinstance(metadata, dict) else None
+        return self._snapshot_path(generation) if generation else self.index_path
+    
+    def _signature(self):
+        """Cheap change check: every save replaces the metadata file (new inode and mtime)."""
+        try:
+            stat = os.stat(self.metadata_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    
+    def _read_metadata(self):
+        """(metadata, signature), with the signature taken before reading so no change is missed."""
+        signature = self._signature()
+        with open(self.metadata_path, 'r') as f:
+            return json.load(f), signature
+    
+    def _load_snapshot(self):
+        """Memory-map the snapshot named by the metadata on disk and adopt its ids."""
+        with self._lock:
+            metadata, signature = self._read_metadata()
+            self.index_type = metadata.get('index_type', 'flat')
+            # IO_FLAG_MMAP maps IVF inverted lists; flat/HNSW storage needs the zero-copy variant
+            flags = faiss.IO_FLAG_MMAP if self.index_type == 'ivfpq' else \
+                getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP)
+            self.index = faiss.read_index(self._snapshot_path(metadata['generation']), flags)
+            apply_search_params(self.index, self.index_type, self.index_params)
+            self.generation = metadata['generation']
+            self._set_id_map(metadata['ids'])
+            self.next_id = metadata['next_id']
+            self._metadata_signature = signature
+            self._mapped = True
+    
+    def refresh(self) -> bool:
+        """
+        In shared mode, remap the index if another process published a newer
+        generation. Costs one ``stat`` when nothing changed. Returns True on reload.
+        """
+        if not self.shared or self._signature() == self._metadata_signature:
+            return False
+        with self._lock:
+            previous = self.generation
+            try:
+                self._load_snapshot()
+            except (OSError, RuntimeError, ValueError, KeyError) as e:
+                # Caught mid-publish or the snapshot was pruned; the next call retries
+                print(f"Vector index reload deferred: {e}")
+                return False
+            return self.generation != previous
+    
+    @contextmanager
+    def _file_lock(self):
+        """Cross-process write lock on ``<index_path>.lock`` (shared mode); re-entrant."""
+        with self._lock:
+            if not self.shared or self._file_lock_depth:
+                self._file_lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._file_lock_depth -= 1
+                return
+            
+            with open(self.index_path + '.lock', 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._file_lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._file_lock_depth = 0
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    @contextmanager
+    def _writing(self):
+        """
+        Scope for a change to the index. In shared mode: lock, start from a
+        private copy of the latest snapshot, then publish and remap on exit.
+        """
+        with self._lock:
+            if not self.shared or self._file_lock_depth:
+                yield
+                return
+            
+            with self._file_lock():
+                self.refresh()
+                if self._mapped:
+                    self.index = faiss.read_index(self._snapshot_path(self.generation))
+                    apply_search_params(self.index, self.index_type, self.index_params)
+                    self._mapped = False
+                try:
+                    yield
+                except BaseException:
+                    self._dirty = False
+                    self._load_snapshot()  # Drop the partial change
+                    raise
+                if self._dirty:
+                    self._save_index()
+                self._load_snapshot()
+    
+    def _prune_snapshots(self):
+        directory = os.path.dirname(os.path.abspath(self.index_path))
+        prefix = os.path.basename(self.index_path) + '.'
+        for name in os.listdir(directory):
+            suffix = name[len(prefix):] if name.startswith(prefix) else ''
+            if suffix.isdigit() and int(suffix) <= self.generation - self.SNAPSHOTS_KEPT:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass  # Still open elsewhere (Windows); removed on a later save
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)  # Single-file layout from before snapshots
+    
+    def _set_id_map(self, id_map: Dict[str, int]):
+        self.id_map = {task_id: int(faiss_id) for task_id, faiss_id in id_map.items()}
+        self.task_ids = {faiss_id: task_id for task_id, faiss_id in self.id_map.items()}
+    
+    def _assign_id(self, task_id: str) -> int:
+        faiss_id = self.next_id
+        self.next_id += 1
+        self.id_map[task_id] = faiss_id
+        self.task_ids[faiss_id] = task_id
+        return faiss_id
+    
     def _save_index(self):
-        """Save index and metadata to disk."""
-        faiss.write_index(self.index, self.index_path)
-        with open(self.metadata_path, 'w') as f:
-            json.dump(self.metadata, f)
+        """Write the index as the next snapshot, then publish it by replacing the metadata."""
+        with self._lock:
+            self.generation += 1
+            snapshot = self._snapshot_path(self.generation)
+            index_tmp = snapshot + '.tmp'
+            faiss.write_index(self.index, index_tmp)
+            os.replace(index_tmp, snapshot)
+            
+            metadata_tmp = self.metadata_path + '.tmp'
+            with open(metadata_tmp, 'w') as f:
+                json.dump({
+                    'version': self.METADATA_VERSION,
+                    'model_id': self.model_id,
+                    'dimension': self.dimension,
+                    'index_type': self.index_type,
+                    'metric': self.METRIC,
+                    'generation': self.generation,
+                    'next_id': self.next_id,
+                    'ids': self.id_map
+                }, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(metadata_tmp, self.metadata_path)
+            self._metadata_signature = self._signature()
+            self._dirty = False
+            self._prune_snapshots()
+    
+    def _mark_dirty(self):
+        self._dirty = True
+        if not self.flush_interval and not self.shared:  # Shared stores publish when _writing() exits
+            self._save_index()
+    
+    def flush(self):
+        """Write pending changes to disk, if any."""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+    
+    def _flush_periodically(self):
+        while not self._stop_flusher.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Vector index flush error: {e}")
+    
+    def close(self):
+        """Stop the background flusher and flush outstanding changes."""
+        self._stop_flusher.set()
+        self.flush()
     
     def add_vector(self, task_id: str, embedding: np.ndarray):
-        """Add a vector and its metadata to the index."""
+        """Add a vector for a task_id, replacing any vector it already has."""
         if embedding.shape[0] != self.dimension:
             raise ValueError(f"Embedding dimension {embedding.shape[0]} does not match index dimension {self.dimension}")
         
         # FAISS expects vectors as float32 and in shape (1, dimension)
-        embedding_array = embedding.astype('float32').reshape(1, -1)
-        
-        # Add to index
-        self.index.add(embedding_array)
-        
-        # Add metadata
-        self.metadata.append(task_id)
+        embedding_array = normalize_vectors(embedding.reshape(1, -1))
         
-        # Save to disk
-        self._save_index()
+        with self._writing():
+            faiss_id = self.id_map.get(task_id)
+            if faiss_id is None:
+                faiss_id = self._assign_id(task_id)
+            elif self.supports_remove:
+                # Replace in place, keeping the task's stable id
+                self.index.remove_ids(np.array([faiss_id], dtype='int64'))
+            else:
+                # Leave the old vector as a tombstone and give the task a new id
+                self.task_ids.pop(faiss_id, None)
+                faiss_id = self._assign_id(task_id)
+            
+            self.index.add_with_ids(embedding_array, np.array([faiss_id], dtype='int64'))
+            self._mark_dirty()
     
-    def update_vector(self, task_id: str, new_embedding: np.ndarray):
-        """Update a vector for an existing task_id."""
-        # Find the index of the task_id
-        if task_id not in self.metadata:
-            # If not found, just add it
-            self.add_vector(task_id, new_embedding)
+    def add_vectors(self, task_ids: List[str], embeddings: np.ndarray):
+        """Bulk upsert: one remove_ids and one add_with_ids for the whole batch."""
+        if len(task_ids) == 0:
             return
+        if embeddings.shape != (len(task_ids), self.dimension):
+            raise ValueError(f"Expected embeddings of shape ({len(task_ids)}, {self.dimension}), got {embeddings.shape}")
+        # One FAISS id per task: a repeated task_id would add two vectors under the same id
+        task_ids, embeddings = last_occurrences(task_ids, embeddings)
         
-        # FAISS doesn't support updates directly, so we need to rebuild
-        # Get all vectors except the one to update
-        indices_to_keep = [i for i, tid in enumerate(self.metadata) if tid != task_id]
-        
-        # Create new index
-        new_index = faiss.IndexFlatL2(self.dimension)
-        new_metadata = []
-        
-        # Add all vectors except the one being updated
-        for idx in indices_to_keep:
-            vector = self.index.reconstruct(idx)
-            new_index.add(vector.reshape(1, -1))
-            new_metadata.append(self.metadata[idx])
-        
-        # Add the updated vector
-        new_embedding_array = new_embedding.astype('float32').reshape(1, -1)
-        new_index.add(new_embedding_array)
-        new_metadata.append(task_id)
-        
-        # Replace old index and metadata
-        self.index = new_index
-        self.metadata = new_metadata
-        
-        # Save to disk
-        self._save_index()
+        with self._writing():
+            existing = [self.id_map[task_id] for task_id in task_ids if task_id in self.id_map]
+            if existing and self.supports_remove:
+                self.index.remove_ids(np.array(existing, dtype='int64'))
+            elif existing:
+                for task_id in task_ids:
+                    if task_id in self.id_map:
+                        self.task_ids.pop(self.id_map.pop(task_id), None)
+            
+            ids = np.array([self.id_map.get(task_id) or self._assign_id(task_id) for task_id in task_ids],
+                           dtype='int64')
+            self.index.add_with_ids(normalize_vectors(embeddings), ids)
+            self._mark_dirty()
+    
+    def update_vector(self, task_id: str, new_embedding: np.ndarray):
+        """Update a vector for an existing task_id (adds it if missing)."""
+        self.add_vector(task_id, new_embedding)
     
     def search(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Tuple[str, float]]:
         """
         Search for the most similar vectors.
         
         Returns:
-            List of (task_id, distance) tuples, sorted by similarity (lower distance = more similar)
+            List of (task_id, cosine similarity) tuples, most similar first
         """
+        self.refresh()
         if self.index.ntotal == 0:
             return []
         
         # Ensure query is the right shape
-        query_array = query_embedding.astype('float32').reshape(1, -1)
+        query_array = normalize_vectors(query_embedding.reshape(1, -1))
         
-        # Search
-        top_k = min(top_k, self.index.ntotal)  # Don't ask for more than we have
-        distances, indices = self.index.search(query_array, top_k)
+        # Search, over-fetching by the number of tombstones so top_k live hits remain
+        with self._lock:
+            k = min(top_k + self.tombstones, self.index.ntotal)  # Don't ask for more than we have
+            scores, labels = self.index.search(query_array, k)
         
         # Build results
         results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.metadata):  # Safety check
-                task_id = self.metadata[idx]
-                distance = float(distances[0][i])
-                results.append((task_id, distance))
+        for score, faiss_id in zip(scores[0], labels[0]):
+            task_id = self.task_ids.get(int(faiss_id))  # -1, tombstones and unknown ids are skipped
+            if task_id is not None:
+                results.append((task_id, float(score)))
         
-        return results
+        return results[:top_k]
     
     def delete_vector(self, task_id: str):
         """Delete a vector by task_id."""
-        if task_id not in self.metadata:
-            return
-        
-        # Rebuild index without the deleted vector
-        indices_to_keep = [i for i, tid in enumerate(self.metadata) if tid != task_id]
+        with self._writing():
+            faiss_id = self.id_map.pop(task_id, None)
+            if faiss_id is None:
+                return
+            
+            self.task_ids.pop(faiss_id, None)
+            if self.supports_remove:
+                self.index.remove_ids(np.array([faiss_id], dtype='int64'))
+            self._mark_dirty()
+    
+    def delete_vectors(self, task_ids: List[str]):
+        """Delete many vectors with one remove_ids."""
+        with self._writing():
+            faiss_ids = [self.id_map.pop(task_id) for task_id in task_ids if task_id in self.id_map]
+            if not faiss_ids:
+                return
+            for faiss_id in faiss_ids:
+                self.task_ids.pop(faiss_id, None)
+            if self.supports_remove:
+                self.index.remove_ids(np.array(faiss_ids, dtype='int64'))
+            self._mark_dirty()
+    
+    def get_all_task_ids(self) -> List[str]:
+        """Get all task_ids in the index."""
+        self.refresh()
+        with self._lock:
+            return list(self.id_map)
+    
+    def get_vectors(self) -> Tuple[List[str], np.ndarray]:
+        """All live (task_id, vector) pairs. IVF-PQ vectors are approximate reconstructions."""
+        self.refresh()
+        with self._lock:
+            task_ids = list(self.id_map)
+            if not task_ids:
+                return [], np.zeros((0, self.dimension), dtype='float32')
+            if self.index_type == 'ivfpq':
+                ids = np.array([self.id_map[task_id] for task_id in task_ids], dtype='int64')
+                return task_ids, self.index.reconstruct_batch(ids)
+            # IndexIDMap2 stores vectors in insertion order alongside their ids
+            vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+            row_of = {int(faiss_id): row for row, faiss_id in enumerate(self._index_ids())}
+            return task_ids, vectors[[row_of[self.id_map[task_id]] for task_id in task_ids]]
+    
+    def rebuild(self, index_type: Optional[str] = None, task_ids: Optional[List[str]] = None,
+                vectors: Optional[np.ndarray] = None) -> Dict:
+        """
+        Build a fresh index of ``index_type`` (default: the configured type).
         
-        new_index = faiss.IndexFlatL2(self.dimension)
-        new_metadata = []
+        Vectors come from ``task_ids``/``vectors`` when given, otherwise from the
+        current index. IVF-PQ is trained on them; with too few vectors to train,
+        the store stays flat. Tombstones are dropped.
+        """
+        if index_type and index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+        with self._writing():
+            self.target_index_type = index_type or self.target_index_type
+            self._rebuild_locked(self.target_index_type, task_ids, vectors)
+        return self.get_stats()
+    
+    def _rebuild_locked(self, index_type: str, task_ids: Optional[List[str]], vectors: Optional[np.ndarray]):
+        if vectors is None:
+            task_ids, vectors = self.get_vectors()
+        elif len(task_ids):
+            task_ids, vectors = last_occurrences(task_ids, vectors)
+        vectors = normalize_vectors(vectors) if len(vectors) else \
+            np.zeros((0, self.dimension), dtype='float32')
         
-        for idx in indices_to_keep:
-            vector = self.index.reconstruct(idx)
-            new_index.add(vector.reshape(1, -1))
-            new_metadata.append(self.metadata[idx])
+        built_type = index_type
+        if built_type == 'ivfpq':
+            _, _, min_training = ivf_training_size(self.dimension, len(vectors), self.index_params)
+            if len(vectors) < min_training:
+                print(f"⚠️ IVF-PQ needs at least {min_training} vectors to train, have {len(vectors)}; "
+                      f"keeping a flat index")
+                built_type = 'flat'
         
-        self.index = new_index
-        self.metadata = new_metadata
+        index = build_faiss_index(built_type, self.dimension, self.index_params,
+                                  training_vectors=vectors if built_type == 'ivfpq' else None)
+        apply_search_params(index, built_type, self.index_params)
         
+        self.index = index
+        self.index_type = built_type
+        self._set_id_map({})
+        self.next_id = 1
+        if len(task_ids):
+            ids = np.array([self._assign_id(task_id) for task_id in task_ids], dtype='int64')
+            self.index.add_with_ids(vectors, ids)
         self._save_index()
+        
+        print(f"✅ Rebuilt vector index as '{built_type}' with {len(task_ids)} vectors")
     
-    def get_all_task_ids(self) -> List[str]:
-        """Get all task_ids in the index."""
-        return self.metadata.copy()
+    def set_search_params(self, ef_search: Optional[int] = None, nprobe: Optional[int] = None):
+        """Tune the recall/latency trade-off of an approximate index at runtime."""
+        with self._lock:
+            if ef_search:
+                self.index_params['ef_search'] = ef_search
+            if nprobe:
+                self.index_params['nprobe'] = nprobe
+            apply_search_params(self.index, self.index_type, self.index_params)
+    
+    def get_stats(self) -> Dict:
+        self.refresh()
+        with self._lock:
+            return {
+                'index_type': self.index_type,
+                'target_index_type': self.target_index_type,
+                'model_id': self.model_id,
+                'dimension': self.dimension,
+                'metric': self.METRIC,
+                'vectors': len(self.id_map),
+                'tombstones': self.tombstones,
+                'ef_search': self.index_params['ef_search'],
+                'nprobe': self.index_params['nprobe'],
+                'generation': self.generation,
+                'shared': self.shared,
+                'memory_mapped': self._mapped,
+            }
     
     def clear(self):
         """Clear all vectors from the index."""
-        self.index = faiss.IndexFlatL2(self.dimension)
-        self.metadata = []
-        self._save_index()
+        with self._writing():
+            self.index = self._new_index()
+            self._set_id_map({})
+            self._mark_dirty()
 
 
 class EmbeddingService:
-    """Service for generating embeddings using OpenAI API."""
+    """Service for generating embeddings through a pluggable EmbeddingBackend."""
     
-    def __init__(self, api_key: Optional[str] = None):
-        self.api_key = api_key or os.environ.get('OPENAI_API_KEY')
-        if not self.api_key:
-            raise ValueError("OpenAI API key is required for embedding generation")
-        
-        self.client = OpenAI(api_key=self.api_key)
-        self.model = "text-embedding-3-small"  # Fast and cost-effective
+    def __init__(self, api_key: Optional[str] = None, cache: Optional[EmbeddingCache] = None,
+                 backend: Optional[EmbeddingBackend] = None):
+        self.backend = backend or OpenAIEmbeddingBackend(api_key)
+        self.model = self.backend.model_id
+        self.dimension = self.backend.dimension
+        self.cache = cache
     
     def generate_embedding(self, text: str) -> np.ndarray:
-        """Generate embedding for a text string."""
+        """Generate embedding for a text string, served from the cache when seen before."""
+        if self.cache:
+            cached = self.cache.get(self.model, text)
+            if cached is not None:
+                return cached
+        
+        embedding = self._request_embeddings([text])[0]
+        if self.cache:
+            self.cache.put(self.model, text, embedding)
+        return embedding
+    
+    def generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Generate embeddings for many texts, requesting only cache misses from the backend."""
+        if not self.cache:
+            return self._request_embeddings(texts)
+        
+        vectors = self.cache.get_many(self.model, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fetched = self._request_embeddings([texts[i] for i in missing])
+            self.cache.put_many(self.model, [texts[i] for i in missing], fetched)
+            for i, vector in zip(missing, fetched):
+                vectors[i] = vector
+        return np.array(vectors, dtype=np.float32)
+    
+    def _request_embeddings(self, texts: List[str]) -> np.ndarray:
         try:
-            response = self.client.embeddings.create(
-                model=self.model,
-                input=text
-            )
-            
-            # Extract the embedding vector
-            embedding = np.array(response.data[0].embedding, dtype=np.float32)
-            return embedding
-            
+            return self.backend.embed(texts)
         except Exception as e:
-            print(f"Error generating embedding: {e}")
+            print(f"Error generating embeddings with {self.model}: {e}")
             raise
     
-    def generate_task_embedding(self, task_name: str, description: str, tags: List[str]) -> np.ndarray:
-        """
-        Generate embedding for a task based on its metadata.
-        Combines task name, description, and tags into a single text.
-        """
-        # Create a comprehensive text representation
+    @staticmethod
+    def task_text(task_name: str, description: str, tags: List[str]) -> str:
+        """Combine task name, description, and tags into a single text."""
         text_parts = [task_name]
         
         if description:
@@ -191,17 +762,78 @@ class EmbeddingService:
         if tags:
             text_parts.append("Tags: " + ", ".join(tags))
         
-        combined_text = ". ".join(text_parts)
-        
-        return self.generate_embedding(combined_text)
+        return ". ".join(text_parts)
+    
+    def generate_task_embedding(self, task_name: str, description: str, tags: List[str]) -> np.ndarray:
+        """Generate embedding for a task based on its metadata."""
+        return self.generate_embedding(self.task_text(task_name, description, tags))
+
+
+# Damping constant for reciprocal rank fusion (the usual choice from the RRF paper)
+RRF_K = 60
+
+
+def load_ranked_tasks(ranked: List[Tuple[str, Dict]], include_code: bool = False) -> List[Dict]:
+    """Fetch task dicts for ranked (task_id, scores) pairs in one query, keeping rank order."""
+    if not ranked:
+        return []
+    
+    from models import LearnedTask
+    
+    tasks = {task.task_id: task for task in
+             LearnedTask.get_many([task_id for task_id, _ in ranked], include_code=include_code)}
+    
+    results = []
+    for task_id, scores in ranked:
+        task = tasks.get(task_id)
+        if task:
+            task_dict = task.to_dict()
+            if not include_code:
+                task_dict.pop('playwright_code', None)
+            task_dict.update(scores)
+            results.append(task_dict)
+    return results
+
+
+def keyword_search_tasks(query: str, top_k: int = 5, include_code: bool = False) -> List[Dict]:
+    """
+    Keyword-only task search over the FTS5 index; needs no embeddings or network.
+    
+    ``similarity_score`` is the BM25 score relative to the best hit (1.0).
+    """
+    from models import LearnedTask
+    
+    hits = LearnedTask.keyword_search(query, limit=top_k)
+    if not hits:
+        return []
+    best = hits[0][1] or 1.0
+    return load_ranked_tasks([
+        (task_id, {'keyword_score': score, 'similarity_score': score / best})
+        for task_id, score in hits
+    ], include_code)
 
 
 class SemanticSearch:
     """High-level semantic search service combining VectorStore and EmbeddingService."""
     
-    def __init__(self, api_key: Optional[str] = None):
-        self.vector_store = VectorStore()
-        self.embedding_service = EmbeddingService(api_key)
+    def __init__(self, api_key: Optional[str] = None, backend: Optional[EmbeddingBackend] = None):
+        backend = backend or create_embedding_backend(api_key)
+        self.vector_store = VectorStore(
+            dimension=backend.dimension,
+            model_id=backend.model_id,
+            flush_interval=float(os.environ.get('VECTOR_INDEX_FLUSH_INTERVAL', 5.0)),
+            **index_options_from_env()
+        )
+        # Hashing vectors are computed faster than they are looked up, so only remote backends are cached
+        self.embedding_cache = EmbeddingCache(
+            max_memory_entries=int(os.environ.get('EMBEDDING_CACHE_MEMORY_ENTRIES', 2048)),
+            max_entries=int(os.environ.get('EMBEDDING_CACHE_MAX_ENTRIES', 50000)),
+            ttl_seconds=int(os.environ.get('EMBEDDING_CACHE_TTL', 30 * 24 * 3600))
+        ) if backend.cacheable else None
+        self.embedding_service = EmbeddingService(cache=self.embedding_cache, backend=backend)
+        # Cosine thresholds per backend (see embedding_calibration.py); env vars override them
+        self.recall_threshold = float(os.environ.get('SEMANTIC_RECALL_THRESHOLD', backend.recall_threshold))
+        self.reuse_threshold = float(os.environ.get('SEMANTIC_REUSE_THRESHOLD', backend.reuse_threshold))
     
     def index_task(self, task):
         """Index a LearnedTask for semantic search."""
@@ -217,6 +849,7 @@ class SemanticSearch:
         
         # Also save embedding with the task
         task.embedding_vector = embedding
+        task.embedding_model = self.embedding_service.model
         task.save()
     
     def update_task_index(self, task):
@@ -230,53 +863,249 @@ class SemanticSearch:
         self.vector_store.update_vector(task.task_id, embedding)
         
         task.embedding_vector = embedding
+        task.embedding_model = self.embedding_service.model
         task.save()
     
-    def search_tasks(self, query: str, top_k: int = 5) -> List[Dict]:
+    def search_tasks(self, query: str, top_k: int = 5, include_code: bool = False,
+                     mode: str = 'semantic') -> List[Dict]:
         """
         Search for tasks similar to the query.
         
+        ``mode`` is 'semantic' (embeddings), 'keyword' (FTS5/BM25, no API call)
+        or 'hybrid' (both, fused with reciprocal rank fusion). Task details are
+        fetched in a single query and returned in rank order; ``playwright_code``
+        is only included when ``include_code`` is set.
+        
         Returns:
             List of task dictionaries with similarity scores
         """
+        if mode == 'keyword':
+            return keyword_search_tasks(query, top_k, include_code)
+        if mode == 'hybrid':
+            return self.hybrid_search(query, top_k, include_code)
+        
         # Generate embedding for query
         query_embedding = self.embedding_service.generate_embedding(query)
         
         # Search vector store
         results = self.vector_store.search(query_embedding, top_k)
         
-        # Fetch task details from database
+        return load_ranked_tasks([
+            (task_id, {'similarity_score': score})  # Cosine similarity
+            for task_id, score in results
+        ], include_code)
+    
+    def hybrid_search(self, query: str, top_k: int = 5, include_code: bool = False,
+                      candidates: int = 50) -> List[Dict]:
+        """
+        Fuse vector and BM25 rankings with reciprocal rank fusion.
+        
+        Each list contributes 1 / (RRF_K + rank) per task, so exact URL and
+        selector matches found by keyword search can outrank loose semantic ones.
+        Hits without a vector score have ``similarity_score`` None; keyword hits
+        carry ``keyword_relevance``, the BM25 score relative to the best hit.
+        """
         from models import LearnedTask
         
-        tasks_with_scores = []
-        for task_id, distance in results:
-            task = LearnedTask.get_by_id(task_id)
-            if task:
-                task_dict = task.to_dict()
-                task_dict['similarity_score'] = float(1 / (1 + distance))  # Convert distance to similarity
-                task_dict['distance'] = float(distance)
-                tasks_with_scores.append(task_dict)
+        query_embedding = self.embedding_service.generate_embedding(query)
+        vector_hits = self.vector_store.search(query_embedding, candidates)
+        keyword_hits = LearnedTask.keyword_search(query, limit=candidates)
+        
+        scores: Dict[str, Dict] = {}
+        for rank, (task_id, similarity) in enumerate(vector_hits, start=1):
+            entry = scores.setdefault(task_id, {'rrf_score': 0.0, 'similarity_score': None})
+            entry['rrf_score'] += 1.0 / (RRF_K + rank)
+            entry['similarity_score'] = similarity
+        best_keyword = keyword_hits[0][1] if keyword_hits and keyword_hits[0][1] else 1.0
+        for rank, (task_id, score) in enumerate(keyword_hits, start=1):
+            entry = scores.setdefault(task_id, {'rrf_score': 0.0, 'similarity_score': None})
+            entry['rrf_score'] += 1.0 / (RRF_K + rank)
+            entry['keyword_score'] = score
+            entry['keyword_relevance'] = score / best_keyword
+        
+        ranked = sorted(scores.items(), key=lambda item: item[1]['rrf_score'], reverse=True)[:top_k]
+        return load_ranked_tasks(ranked, include_code)
+    
+    def find_reusable_task(self, command: str, threshold: Optional[float] = None,
+                           min_success_ratio: float = 0.8, min_runs: int = 1) -> Optional[Dict]:
+        """
+        Return the best learned task for a command if it is safe to run as-is.
+        
+        The top hit must clear the similarity threshold (default: the backend's
+        ``reuse_threshold``), have at least ``min_runs``
+        recorded executions and a success ratio of at least ``min_success_ratio``.
+        """
+        results = self.search_tasks(command, top_k=1, include_code=True)
+        if not results:
+            return None
+        
+        best = results[0]
+        if best['similarity_score'] < (self.reuse_threshold if threshold is None else threshold):
+            return None
+        
+        runs = best['success_count'] + best['failure_count']
+        if runs < min_runs:
+            return None
+        if runs and best['success_count'] / runs < min_success_ratio:
+            return None
         
-        return tasks_with_scores
+        return best
     
     def delete_task_from_index(self, task_id: str):
         """Remove a task from the search index."""
         self.vector_store.delete_vector(task_id)
     
-    def reindex_all_tasks(self):
-        """Rebuild the entire search index from scratch."""
+    def _embed_and_index(self, tasks: List[Dict], stats: Dict, batch_size: int = 100,
+                         max_in_flight: int = 4, checkpoint_batches: int = 10,
+                         progress_callback: Optional[Callable[[int, int], None]] = None):
+        """Embed ``tasks`` in concurrent batches, adding to FAISS and the DB at each checkpoint."""
         from models import LearnedTask
         
-        # Clear existing index
-        self.vector_store.clear()
+        total = len(tasks)
+        batches = [tasks[i:i + batch_size] for i in range(0, total, batch_size)]
+        pending_ids: List[str] = []
+        pending_vectors: List[np.ndarray] = []
         
-        # Get all tasks
-        all_tasks = LearnedTask.get_all(limit=10000)
+        def embed(batch):
+            texts = [self.embedding_service.task_text(t['task_name'], t['description'], t['tags'])
+                     for t in batch]
+            return self.embedding_service.generate_embeddings(texts)
         
-        # Index each task
-        for task in all_tasks:
-            try:
-                self.index_task(task)
-                print(f"Indexed task: {task.task_name}")
-            except Exception as e:
-                print(f"Failed to index task {task.task_id}: {e}")
+        def checkpoint():
+            if not pending_ids:
+                return
+            matrix = np.vstack(pending_vectors)
+            self.vector_store.add_vectors(pending_ids, matrix)
+            self.vector_store.flush()
+            LearnedTask.bulk_update_embeddings(list(zip(pending_ids, matrix)), model=self.embedding_service.model)
+            pending_ids.clear()
+            pending_vectors.clear()
+        
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            # Submit in windows so at most max_in_flight requests are outstanding
+            for window_start in range(0, len(batches), max_in_flight):
+                window = batches[window_start:window_start + max_in_flight]
+                futures = {pool.submit(embed, batch): batch for batch in window}
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    try:
+                        vectors = future.result()
+                    except Exception as e:
+                        print(f"Failed to embed batch of {len(batch)} tasks: {e}")
+                        stats['failed'] += len(batch)
+                        continue
+                    pending_ids.extend(t['task_id'] for t in batch)
+                    pending_vectors.append(vectors)
+                    stats['indexed'] += len(batch)
+                
+                if len(pending_ids) >= checkpoint_batches * batch_size:
+                    checkpoint()
+                if progress_callback:
+                    progress_callback(stats['indexed'] + stats['failed'], total)
+        
+        checkpoint()
+    
+    def sync_with_database(self, reembed: bool = True, batch_size: int = 100) -> Dict:
+        """
+        Make the index match ``learned_tasks`` without re-embedding what is already stored.
+        
+        Vectors of deleted tasks are removed. Tasks missing from the index are
+        loaded from their ``embedding_vector`` BLOBs in one bulk add (an empty
+        index is rebuilt from them, so IVF-PQ gets trained). Only tasks with no
+        usable stored vector are sent to the embedding backend, and only when
+        ``reembed`` is set.
+        """
+        from models import LearnedTask
+        
+        started = time.perf_counter()
+        store = self.vector_store
+        tasks = LearnedTask.get_index_fields()
+        db_ids = {t['task_id'] for t in tasks}
+        indexed_ids = set(store.get_all_task_ids())
+        
+        orphaned = sorted(indexed_ids - db_ids)
+        if orphaned:
+            store.delete_vectors(orphaned)
+        
+        missing = db_ids - indexed_ids
+        stored_ids, stored_vectors = LearnedTask.get_stored_embeddings(self.embedding_service.model,
+                                                                      store.dimension)
+        rows = [i for i, task_id in enumerate(stored_ids) if task_id in missing]
+        loaded_ids = [stored_ids[i] for i in rows]
+        if loaded_ids:
+            if not indexed_ids - set(orphaned):
+                store.rebuild(task_ids=loaded_ids, vectors=stored_vectors[rows])
+            else:
+                store.add_vectors(loaded_ids, stored_vectors[rows])
+        
+        gaps = [t for t in tasks if t['task_id'] in missing - set(loaded_ids)]
+        stats = {'total': len(gaps), 'indexed': 0, 'failed': 0}
+        if gaps and reembed:
+            self._embed_and_index(gaps, stats, batch_size=batch_size)
+        store.flush()
+        
+        result = {
+            'tasks': len(db_ids),
+            'orphaned_removed': len(orphaned),
+            'loaded_from_db': len(loaded_ids),
+            'reembedded': stats['indexed'],
+            'reembed_failed': stats['failed'],
+            'still_missing': len(gaps) - stats['indexed'],
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        }
+        if orphaned or missing:
+            print(f"✅ Vector index synced with database: {result}")
+        return result
+    
+    def reindex_all_tasks(self, batch_size: int = 100, max_in_flight: int = 4,
+                          checkpoint_batches: int = 10, resume: bool = False,
+                          progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """
+        Rebuild the search index with batched embedding requests.
+        
+        Texts are embedded ``batch_size`` at a time with at most ``max_in_flight``
+        requests outstanding. Every ``checkpoint_batches`` batches the vectors are
+        written to FAISS in one bulk add, flushed, and the embeddings are stored in
+        a single DB transaction, so an interrupted run can continue with
+        ``resume=True``, which skips tasks already in the index.
+        """
+        from models import LearnedTask
+        
+        if not resume:
+            self.vector_store.clear()
+        
+        already_indexed = set(self.vector_store.get_all_task_ids()) if resume else set()
+        tasks = [t for t in LearnedTask.get_index_fields() if t['task_id'] not in already_indexed]
+        stats = {'total': len(tasks), 'indexed': 0, 'failed': 0, 'skipped': len(already_indexed)}
+        
+        self._embed_and_index(tasks, stats, batch_size, max_in_flight, checkpoint_batches, progress_callback)
+        print(f"✅ Reindexed {stats['indexed']}/{stats['total']} tasks ({stats['failed']} failed)")
+        
+        # A cleared index starts flat; train the configured ANN index now that it has data
+        if self.vector_store.index_type != self.vector_store.target_index_type:
+            self.vector_store.rebuild()
+        return stats
+
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Vector index maintenance')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = subparsers.add_parser('rebuild', help='Rebuild the FAISS index from its stored vectors')
+    rebuild_parser.add_argument('--index-type', choices=INDEX_TYPES,
+                                help='Index type to build (default: VECTOR_INDEX_TYPE)')
+    sync_parser = subparsers.add_parser('sync', help='Repair the index from learned_tasks embeddings')
+    sync_parser.add_argument('--no-reembed', action='store_true',
+                             help='Do not call the embedding backend for tasks without a stored vector')
+    subparsers.add_parser('stats', help='Show index statistics')
+    args = parser.parse_args()
+    
+    search = SemanticSearch()
+    if args.command == 'rebuild':
+        print(json.dumps(search.vector_store.rebuild(args.index_type), indent=2))
+    elif args.command == 'sync':
+        print(json.dumps(search.sync_with_database(reembed=not args.no_reembed), indent=2))
+    else:
+        print(json.dumps(search.vector_store.get_stats(), indent=2))
+    search.vector_store.close()
@@ -0,0 +1,226 @@
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict
+
+from db_pool import get_db
+
+
+TEST_HISTORY_COLUMNS = {'status', 'logs', 'screenshot_path', 'healed_code'}
+
+
+class _FlushMarker:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class WriteBehindQueue:
+    """
+    Single writer for execution results and task statistics.
+
+    Callers enqueue ``test_history`` updates, ``task_executions`` inserts and
+    ``learned_tasks`` counter increments; one background writer drains the
+    bounded queue and applies each batch in a single transaction. Updates to
+    the same test are merged, and counter increments are summed per task.
+    A failed batch is retried, then applied one operation at a time so only the
+    operations that keep failing are dropped. ``put`` blocks when the queue is
+    full, and ``close`` drains it on shutdown.
+    """
+
+    def __init__(self, db_path='automation.db', max_pending=1000, max_batch=200, flush_interval=0.1,
+                 retries=2, retry_delay=0.05):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'failed': 0,
+            'retried': 0,
+            'split_batches': 0,
+            'largest_batch': 0,
+            'blocked_puts': 0,
+        }
+
+    # ---------------- Producers ----------------
+
+    def update_test_history(self, test_id, **fields):
+        """Queue an UPDATE of ``test_history`` columns for one test."""
+        unknown = set(fields) - TEST_HISTORY_COLUMNS
+        if unknown:
+            raise ValueError(f"Unknown test_history columns: {sorted(unknown)}")
+        self._put(('test_history', test_id, fields))
+
+    def record_execution(self, task_id, execution_result, success, error_message=None, execution_time_ms=0):
+        """Queue a ``task_executions`` row."""
+        self._put(('task_execution', task_id,
+                   (task_id, execution_result, success, error_message, execution_time_ms)))
+
+    def increment_task_counters(self, task_id, success, executed_at=None):
+        """Queue a success/failure increment and ``last_executed`` bump for a learned task."""
+        executed_at = (executed_at or datetime.now()).isoformat()
+        self._put(('task_counters', task_id, (1 if success else 0, 0 if success else 1, executed_at)))
+
+    def _put(self, op):
+        if self._closed:
+            # Late writes during shutdown go straight to the database
+            self._write([op])
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(op)
+        except queue.Full:
+            self._count('blocked_puts')
+            self._queue.put(op)
+        self._count('enqueued')
+
+    # ---------------- Writer ----------------
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._closed:
+                    return
+                continue
+            if first is None:
+                return
+
+            batch = [first]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+
+            ops = [item for item in batch if not isinstance(item, _FlushMarker)]
+            if ops:
+                self._write(ops)
+            for item in batch:
+                if isinstance(item, _FlushMarker):
+                    item.done.set()
+
+    def _write(self, ops, retry=True):
+        attempts = self.retries + 1 if retry else 1
+        for attempt in range(attempts):
+            try:
+                self._apply(ops)
+                break
+            except Exception as e:
+                error = e
+            if attempt < attempts - 1:
+                self._count('retried')
+                time.sleep(self.retry_delay * (2 ** attempt))
+        else:
+            if len(ops) == 1:
+                print(f"⚠️ Write-behind dropped {ops[0][0]} for {ops[0][1]}: {error}")
+                self._count('failed')
+                return
+            # Apply one at a time so a single bad operation does not take the batch with it
+            print(f"⚠️ Write-behind batch of {len(ops)} operations failed ({error}), writing them one by one")
+            self._count('split_batches')
+            for op in ops:
+                self._write([op], retry=False)
+            return
+
+        with self._stats_lock:
+            self.stats['written'] += len(ops)
+            self.stats['batches'] += 1
+            self.stats['largest_batch'] = max(self.stats['largest_batch'], len(ops))
+
+    def _apply(self, ops):
+        """Merge ops and write them in one transaction; raises if the transaction fails."""
+        history = {}
+        executions = []
+        counters = {}
+        for kind, key, payload in ops:
+            if kind == 'test_history':
+                history.setdefault(key, {}).update(payload)
+            elif kind == 'task_execution':
+                executions.append(payload)
+            elif kind == 'task_counters':
+                successes, failures, executed_at = payload
+                total = counters.get(key, (0, 0, executed_at))
+                counters[key] = (total[0] + successes, total[1] + failures, max(total[2], executed_at))
+
+        with get_db(self.db_path).transaction() as conn:
+            for test_id, fields in history.items():
+                columns = ', '.join(f'{column}=?' for column in fields)
+                conn.execute(f'UPDATE test_history SET {columns} WHERE id=?',
+                             list(fields.values()) + [test_id])
+            if executions:
+                conn.executemany('''INSERT INTO task_executions
+                                    (task_id, execution_result, success, error_message, execution_time_ms)
+                                    VALUES (?, ?, ?, ?, ?)''', executions)
+            if counters:
+                conn.executemany('''UPDATE learned_tasks
+                                    SET success_count=COALESCE(success_count, 0)+?,
+                                        failure_count=COALESCE(failure_count, 0)+?,
+                                        last_executed=?
+                                    WHERE task_id=?''',
+                                 [(s, f, at, task_id) for task_id, (s, f, at) in counters.items()])
+
+    # ---------------- Control ----------------
+
+    def flush(self, timeout=10.0):
+        """Block until everything queued so far has been written."""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        marker = _FlushMarker()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self, timeout=10.0):
+        """Drain the queue and stop the writer. Safe to call more than once."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+        # Anything the writer did not get to is written synchronously
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, _FlushMarker):
+                item.done.set()
+            elif item is not None:
+                leftover.append(item)
+        if leftover:
+            self._write(leftover)
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['pending'] = self._queue.qsize()
+        stats['max_pending'] = self._queue.maxsize
+        stats['avg_batch'] = round(stats['written'] / stats['batches'], 2) if stats['batches'] else 0.0
+        return stats